@@ -0,0 +1,231 @@
+"""
+Admission control for the upload endpoints.
+
+Runs in front of the endpoint, before FastAPI reads (and spools to disk) the
+multipart body, so a burst is turned away at the door instead of being
+accepted, buffered and queued until memory runs out or the load balancer
+times out. At most `max_in_flight` uploads are admitted at once; up to
+`max_waiting` more wait in FIFO order for up to `max_wait` seconds. Anything
+beyond that is rejected immediately with 503 and a Retry-After estimated
+from recent service times. With `per_client` set, a single client can't
+hold more than that many admitted-or-waiting requests (429).
+
+Limits are per worker process.
+"""
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import deque
+from typing import Collection, Deque, Dict, Optional, Tuple
+
+from telemetry import ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised by AdmissionController.acquire; `status` is 503 (saturated) or 429 (per-client cap)."""
+
+    def __init__(self, status: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounded in-flight count plus a bounded FIFO wait queue, on the event loop.
+    Every successful acquire() must be paired with one release(client).
+    """
+
+    def __init__(self,
+                 max_in_flight: int,
+                 max_waiting: int = 0,
+                 max_wait: float = 10.0,
+                 per_client: int = 0):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_waiting = max(0, max_waiting)
+        self.max_wait = max_wait
+        self.per_client = max(0, per_client)
+        self._in_flight = 0
+        self._waiters: Deque[Tuple[asyncio.Future, float]] = deque()
+        self._clients: Dict[str, int] = {}
+        # Smoothed seconds a request holds its slot, for Retry-After
+        self._service_time = 1.0
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    async def acquire(self, client: str) -> float:
+        """
+        Waits for a slot and returns the seconds spent waiting.
+        Raises AdmissionRejected when the queue is full, the wait times out
+        or the client is over its cap.
+        """
+        if self.per_client and self._clients.get(client, 0) >= self.per_client:
+            raise self._reject(429, "client_limit")
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._admit(client)
+            ADMISSION_WAIT_SECONDS.observe(0.0)
+            return 0.0
+        if len(self._waiters) >= self.max_waiting:
+            raise self._reject(503, "queue_full")
+
+        self._clients[client] = self._clients.get(client, 0) + 1
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (waiter, time.perf_counter())
+        self._waiters.append(entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the request went away; pass it on
+                self.release(client)
+            else:
+                self._abandon(entry, client)
+            raise
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._abandon(entry, client)
+                self._timed_out += 1
+                raise self._reject(503, "wait_timeout")
+            # The slot was handed over just as the wait ran out: keep it
+        waited = time.perf_counter() - entry[1]
+        ADMISSION_WAIT_SECONDS.observe(waited)
+        return waited
+
+    def release(self, client: str, held: Optional[float] = None):
+        """Frees the client's slot, handing it straight to the longest waiter if there is one."""
+        if held is not None:
+            self._service_time = 0.8 * self._service_time + 0.2 * held
+        self._release_client(client)
+        while self._waiters:
+            waiter, _ = self._waiters.popleft()
+            if not waiter.done():
+                # The slot moves to the waiter without going through _in_flight
+                waiter.set_result(None)
+                self._admitted += 1
+                return
+        self._in_flight -= 1
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free: one service time per full round of queued requests."""
+        rounds = len(self._waiters) / self.max_in_flight + 1
+        return int(min(60, max(1, math.ceil(self._service_time * rounds))))
+
+    def _admit(self, client: str):
+        self._in_flight += 1
+        self._admitted += 1
+        self._clients[client] = self._clients.get(client, 0) + 1
+
+    def _abandon(self, entry: Tuple[asyncio.Future, float], client: str):
+        entry[0].cancel()
+        self._waiters.remove(entry)
+        self._release_client(client)
+
+    def _release_client(self, client: str):
+        count = self._clients.get(client, 0) - 1
+        if count > 0:
+            self._clients[client] = count
+        else:
+            self._clients.pop(client, None)
+
+    def _reject(self, status: int, reason: str) -> AdmissionRejected:
+        self._rejected += 1
+        ADMISSION_REJECTED.labels(reason).inc()
+        logger.debug("Admission rejected (%s): %d in flight, %d waiting", reason, self._in_flight, len(self._waiters))
+        return AdmissionRejected(status, reason, self.retry_after())
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def oldest_wait(self) -> float:
+        """Seconds the longest-waiting request has been queued (0 when none)."""
+        return time.perf_counter() - self._waiters[0][1] if self._waiters else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """Snapshot of admission state, suitable for a JSON response."""
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_waiting": self.max_waiting,
+            "in_flight": self._in_flight,
+            "queue_depth": len(self._waiters),
+            "oldest_wait_seconds": round(self.oldest_wait(), 3),
+            "service_time_seconds": round(self._service_time, 3),
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying the app's `state.admission` controller to POSTs
+    on `paths` (others pass straight through, as does everything while the
+    controller isn't set up). A plain ASGI wrapper rather than an
+    @app.middleware function so the slot is held until the response,
+    streamed or not, has been fully sent, and released even when the client
+    disconnects. The client is the peer address, or the first
+    X-Forwarded-For hop when `trust_forwarded_for` is set (behind a proxy).
+    """
+
+    def __init__(self, app, paths: Collection[str], trust_forwarded_for: bool = False):
+        self.app = app
+        self.paths = set(paths)
+        self.trust_forwarded_for = trust_forwarded_for
+
+    async def __call__(self, scope, receive, send):
+        admission: Optional[AdmissionController] = None
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.paths:
+            admission = getattr(scope["app"].state, "admission", None)
+        if admission is None:
+            await self.app(scope, receive, send)
+            return
+
+        client = self.client_key(scope)
+        try:
+            await admission.acquire(client)
+        except AdmissionRejected as e:
+            await self.reject(send, e)
+            return
+
+        admitted_at = time.perf_counter()
+        # The upload's own stage timings (parse_upload) start once it is admitted
+        scope.setdefault("state", {})["received_at"] = admitted_at
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(client, time.perf_counter() - admitted_at)
+
+    @staticmethod
+    async def reject(send, rejected: AdmissionRejected):
+        """Sends the 429/503 JSON response straight over ASGI; the upload body is never read."""
+        error = ("Too many concurrent uploads from this client." if rejected.status == 429
+                 else "Server is busy, please retry shortly.")
+        body = json.dumps({"error": error}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": rejected.status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(rejected.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    def client_key(self, scope) -> str:
+        if self.trust_forwarded_for:
+            for name, value in scope.get("headers", []):
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
@@ -0,0 +1,71 @@
+import logging
+import os
+import tarfile
+import zipfile
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def is_archive(filename: str) -> bool:
+    return (filename or "").lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def is_image(filename: str) -> bool:
+    return os.path.splitext(filename or "")[1].lower() in IMAGE_EXTENSIONS
+
+
+def iter_archive_images(fileobj: BinaryIO, filename: str, max_entry_bytes: int) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yields (member name, bytes) for every image inside a zip or tar archive.
+    Members are read one at a time so the whole archive is never held in memory.
+    Members larger than `max_entry_bytes` are reported with empty bytes.
+    """
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not is_image(info.filename):
+                    continue
+                if info.file_size > max_entry_bytes:
+                    logger.warning(f"Skipping oversized archive member {info.filename}")
+                    yield info.filename, b""
+                    continue
+                yield info.filename, archive.read(info)
+    else:
+        with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+            for member in archive:
+                if not member.isfile() or not is_image(member.name):
+                    continue
+                if member.size > max_entry_bytes:
+                    logger.warning(f"Skipping oversized archive member {member.name}")
+                    yield member.name, b""
+                    continue
+                extracted = archive.extractfile(member)
+                if extracted is not None:
+                    yield member.name, extracted.read()
+
+
+def iter_upload_images(uploads, max_entry_bytes: int) -> Iterator[Tuple[str, bytes, Optional[str]]]:
+    """
+    Flattens a list of uploaded files (plain images and/or archives) into
+    (name, bytes, error) triples, in upload order. A broken archive yields a
+    single triple carrying the error instead of aborting the whole batch.
+    """
+    for upload in uploads:
+        name = upload.filename or "upload"
+        if is_archive(name):
+            try:
+                for member_name, data in iter_archive_images(upload.file, name, max_entry_bytes):
+                    yield f"{name}/{member_name}", data, None if data else "Empty or oversized image."
+            except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError) as e:
+                logger.warning(f"Could not read archive {name}: {e}")
+                yield name, b"", f"Could not read archive: {e}"
+        else:
+            data = upload.file.read(max_entry_bytes + 1)
+            if len(data) > max_entry_bytes:
+                yield name, b"", "Empty or oversized image."
+            else:
+                yield name, data, None if data else "Empty or oversized image."
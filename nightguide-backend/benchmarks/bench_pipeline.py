@@ -0,0 +1,261 @@
+"""
+Per-stage micro-benchmarks for pipeline.py.
+
+Runs fully offline on deterministic synthetic fixtures (benchmarks/fixtures.py)
+and times each stage separately plus end-to-end:
+
+    decode, get_yolo_detections, denormalize_box_from_center,
+    find_stars_within_box, map_and_order_stars, map_and_order_stars_batch,
+    match_partial_stars,
+    draw_constellation, render_overlay, encode, encode_webp
+
+Usage (from nightguide-backend/):
+
+    python benchmarks/bench_pipeline.py --output bench.json
+    python benchmarks/bench_pipeline.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json --tolerance 0.15
+
+The YOLO stage (and the full end-to-end run) is skipped with a note when the
+model can't be loaded; everything after detection still runs, driven by a
+planted constellation with a known box. With --baseline, the exit status is
+non-zero when any stage's median regressed by more than --tolerance.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import cv2
+import numpy as np
+
+from benchmarks.fixtures import DEFAULT_FIXTURES, SkyFixture, plant_constellation, render_sky
+from config import Config
+from constellation_catalog import get_catalog
+from output_encoding import OutputEncoding, encode_image
+from partial_match import match_partial_stars
+import pipeline
+
+BENCH_LABEL = "UMa"  # a 7-star pattern, large enough to exercise the matcher
+
+
+def time_stage(fn: Callable, repeat: int, warmup: int, setup: Optional[Callable] = None) -> Dict[str, float]:
+    """Times `fn(setup())` `repeat` times after `warmup` untimed calls; returns ms statistics."""
+    for _ in range(warmup):
+        fn(setup() if setup else None)
+    samples = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter_ns()
+        fn(arg)
+        samples.append((time.perf_counter_ns() - start) / 1e6)
+    return summarize(samples)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Statistics over millisecond timings."""
+    samples = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+    return {
+        "n": len(samples),
+        "median_ms": statistics.median(samples),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "min_ms": samples[0],
+        "mean_ms": statistics.fmean(samples),
+    }
+
+
+def load_detector(model_path: str, model_type: Optional[str]):
+    try:
+        from model_registry import registry
+        return registry.warm_up(model_path, Config.YOLO_YAML_PATH, model_type)
+    except Exception as e:
+        print(f"  ⚠️  YOLO stage skipped: could not load {model_path} ({e})", file=sys.stderr)
+        return None
+
+
+def bench_fixture(image: np.ndarray, repeat: int, warmup: int, loaded_model) -> Dict[str, dict]:
+    canonical_model = get_catalog()[BENCH_LABEL]
+    expected = canonical_model.star_count
+    img_h, img_w = image.shape[:2]
+
+    # Plant the benchmark constellation in a known box so every post-detection stage has real work
+    side = min(img_w, img_h) // 3
+    box = [img_w // 2 - side // 2, img_h // 2 - side // 2, side, side]
+    image = image.copy()
+    plant_constellation(image, canonical_model.points, box)
+    normalized_box = [(box[0] + side / 2) / img_w, (box[1] + side / 2) / img_h, side / img_w, side / img_h]
+
+    encoded = cv2.imencode(".jpg", image)[1].tobytes()
+    detected_points = pipeline.find_stars_within_box(image, box, expected)
+    ordered_points = pipeline.map_and_order_stars(canonical_model, detected_points) if len(detected_points) == expected else None
+
+    stages = {}
+    stages["decode"] = time_stage(lambda _: cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_COLOR), repeat, warmup)
+    if loaded_model is not None:
+        stages["get_yolo_detections"] = time_stage(
+            lambda _: pipeline.get_yolo_detections(loaded_model.model_path, None, loaded_model.yaml_path,
+                                                   loaded_model=loaded_model, image=image),
+            repeat, warmup)
+    stages["denormalize_box_from_center"] = time_stage(
+        lambda _: pipeline.denormalize_box_from_center(normalized_box, img_w, img_h), repeat * 100, warmup)
+    stages["find_stars_within_box"] = time_stage(
+        lambda _: pipeline.find_stars_within_box(image, box, expected), repeat, warmup)
+    if ordered_points:
+        stages["map_and_order_stars"] = time_stage(
+            lambda _: pipeline.map_and_order_stars(canonical_model, detected_points), repeat, warmup)
+        # Eight constellations in view, aligned in one call
+        stages["map_and_order_stars_batch"] = time_stage(
+            lambda _: pipeline.map_and_order_stars_batch([canonical_model] * 8, [detected_points] * 8),
+            repeat, warmup)
+        # One star missing: no hypothesis matches every star, so this is the capped worst case
+        stages["match_partial_stars"] = time_stage(
+            lambda _: match_partial_stars(canonical_model, detected_points[:-1], box_size=side,
+                                          min_fraction=Config.PARTIAL_MATCH_MIN_FRACTION,
+                                          max_hypotheses=Config.PARTIAL_MATCH_MAX_HYPOTHESES,
+                                          time_budget=Config.PARTIAL_MATCH_TIME_BUDGET_MS / 1000),
+            repeat, warmup)
+        stages["draw_constellation"] = time_stage(
+            lambda canvas: pipeline.draw_constellation(canvas, ordered_points, canonical_model),
+            repeat, warmup, setup=image.copy)
+        # Eight figures in view, drawn in one batched pass
+        stages["render_overlay"] = time_stage(
+            lambda canvas: pipeline.render_overlay(canvas, [(ordered_points, canonical_model, None)] * 8),
+            repeat, warmup, setup=image.copy)
+    else:
+        print(f"  ⚠️  Planted {BENCH_LABEL} not recovered ({len(detected_points)}/{expected} stars); matcher stages skipped")
+    stages["encode"] = time_stage(lambda _: cv2.imencode(".jpg", image), repeat, warmup)
+    stages["encode_webp"] = time_stage(
+        lambda _: encode_image(image, OutputEncoding("webp", Config.OUTPUT_QUALITY)), repeat, warmup)
+
+    def post_detection(_):
+        # decode -> star extraction -> matching -> drawing -> encode, with the detection box given
+        img = cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_COLOR)
+        constellation_box = pipeline.denormalize_box_from_center(normalized_box, img_w, img_h)
+        points = pipeline.find_stars_within_box(img, constellation_box, expected)
+        if len(points) == expected:
+            ordered = pipeline.map_and_order_stars(canonical_model, points)
+            if ordered:
+                pipeline.draw_constellation(img, ordered, canonical_model)
+        cv2.imencode(".jpg", img)
+
+    stages["end_to_end_post_detection"] = time_stage(post_detection, repeat, warmup)
+    if loaded_model is not None:
+        stages["end_to_end"] = time_stage(
+            lambda _: pipeline.run_pipeline_on_bytes(encoded, loaded_model.model_path, loaded_model.yaml_path,
+                                                     loaded_model=loaded_model),
+            repeat, warmup)
+    return stages
+
+
+def compare_to_baseline(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Returns one message per stage whose median is more than `tolerance` slower than the baseline."""
+    regressions = []
+    for fixture_name, stages in report["fixtures"].items():
+        base_stages = baseline.get("fixtures", {}).get(fixture_name, {})
+        for stage, stats in stages.items():
+            base = base_stages.get(stage)
+            if not base or base["median_ms"] <= 0:
+                continue
+            ratio = stats["median_ms"] / base["median_ms"]
+            stats["vs_baseline"] = round(ratio, 3)
+            if ratio > 1 + tolerance:
+                regressions.append(f"{fixture_name}/{stage}: {base['median_ms']:.3f}ms -> "
+                                   f"{stats['median_ms']:.3f}ms ({(ratio - 1) * 100:+.0f}%)")
+    return regressions
+
+
+def parse_fixture(spec: str) -> SkyFixture:
+    """NAME:WIDTHxHEIGHT:STARS[:BACKGROUND], e.g. 'astro:9000x6000:40000' or 'city:2000x1500:1500:48'."""
+    name, size, stars, *background = spec.split(":")
+    width, height = size.lower().split("x")
+    extra = {"background": float(background[0])} if background else {}
+    return SkyFixture(name, int(width), int(height), int(stars), **extra)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage benchmarks for pipeline.py")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--fixture", action="append", type=parse_fixture,
+                        help="NAME:WIDTHxHEIGHT:STARS[:BACKGROUND] (repeatable; defaults to the built-in set)")
+    parser.add_argument("--only", action="append", help="Only run fixtures with these names")
+    parser.add_argument("--no-yolo", action="store_true", help="Skip the model-dependent stages")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="Compare against a previously saved report")
+    parser.add_argument("--save-baseline", help="Also save this run as a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed median slowdown vs baseline")
+    args = parser.parse_args()
+
+    os.chdir(BACKEND_DIR)
+    fixtures = args.fixture or DEFAULT_FIXTURES
+    if args.only:
+        fixtures = [f for f in fixtures if f.name in args.only]
+
+    loaded_model = None
+    if not args.no_yolo:
+        model_path, model_type = Config.detector_model()
+        loaded_model = load_detector(model_path, model_type)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+            "yolo": loaded_model.backend if loaded_model else None,
+        },
+        "fixtures": {},
+    }
+
+    for fixture in fixtures:
+        print(f"⏱️  {fixture.name} ({fixture.width}x{fixture.height}, {fixture.star_count} stars)", file=sys.stderr)
+        image = render_sky(fixture)
+        # pipeline.py reports progress with print(); keep stdout clean for the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            stages = bench_fixture(image, args.repeat, args.warmup, loaded_model)
+        report["fixtures"][fixture.name] = stages
+        for stage, stats in stages.items():
+            print(f"    {stage:<30} median {stats['median_ms']:9.3f}ms  p90 {stats['p90_ms']:9.3f}ms  "
+                  f"p99 {stats['p99_ms']:9.3f}ms", file=sys.stderr)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(output)
+
+    if regressions:
+        print(f"❌ {len(regressions)} stage(s) regressed by more than {args.tolerance:.0%}:", file=sys.stderr)
+        for line in regressions:
+            print(f"    {line}", file=sys.stderr)
+        sys.exit(1)
+    if args.baseline:
+        print("✅ No regressions against the baseline.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
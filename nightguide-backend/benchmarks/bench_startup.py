@@ -0,0 +1,161 @@
+"""
+Cold-start benchmarks: how long a fresh process takes to import the server
+and to become ready.
+
+Each stage runs in its own fresh interpreter (so nothing is already imported
+or cached in memory) and times only its own work, not interpreter startup:
+
+    import_pipeline   import pipeline (what every worker needs)
+    import_main       import main (the FastAPI app; skipped if FastAPI is missing)
+    load_catalog      get_catalog() after its import
+    model_ready       load + warm up the detection model (what /ready waits for)
+
+Each import stage also reports which heavy dependencies (torch,
+ultralytics, scipy, ...) the import pulled in; those should only load on
+first use. Usage (from nightguide-backend/):
+
+    python benchmarks/bench_startup.py --output startup.json
+    python benchmarks/bench_startup.py --save-baseline benchmarks/startup_baseline.json
+    python benchmarks/bench_startup.py --baseline benchmarks/startup_baseline.json --tolerance 0.2
+
+With --baseline, the exit status is non-zero when a stage's median regressed
+by more than --tolerance or an import pulls in a heavy module the baseline's
+didn't.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.bench_pipeline import compare_to_baseline, summarize
+
+HEAVY_MODULES = ("torch", "ultralytics", "scipy.optimize", "scipy.spatial", "scipy.stats",
+                 "onnxruntime", "openvino", "prometheus_client", "opentelemetry")
+
+# (setup run untimed, timed code) per stage
+STAGES = {
+    "import_pipeline": ("", "import pipeline"),
+    "import_main": ("", "import main"),
+    "load_catalog": ("from constellation_catalog import get_catalog", "get_catalog()"),
+    "model_ready": ("from config import Config\nfrom model_registry import registry",
+                    "registry.warm_up(Config.detector_model()[0], Config.YOLO_YAML_PATH, Config.detector_model()[1])"),
+}
+
+CHILD = """
+import json, sys, time
+{setup}
+start = time.perf_counter_ns()
+{timed}
+elapsed = (time.perf_counter_ns() - start) / 1e6
+print(json.dumps({{"ms": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def run_child(setup: str, timed: str) -> dict:
+    """Runs one stage in a fresh interpreter; raises RuntimeError with its stderr on failure."""
+    code = CHILD.format(setup=setup, timed=timed, heavy=HEAVY_MODULES)
+    completed = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def bench_stage(name: str, repeat: int) -> Optional[dict]:
+    setup, timed = STAGES[name]
+    samples, heavy = [], set()
+    for _ in range(repeat):
+        try:
+            result = run_child(setup, timed)
+        except RuntimeError as e:
+            print(f"  ⚠️  {name} skipped: {e}", file=sys.stderr)
+            return None
+        samples.append(result["ms"])
+        heavy.update(result["heavy"])
+    stats = summarize(samples)
+    if name.startswith("import_"):
+        stats["heavy_modules"] = sorted(heavy)
+    return stats
+
+
+def heavy_import_regressions(report: dict, baseline: dict) -> List[str]:
+    """One message per import stage that now loads a heavy module its baseline didn't."""
+    regressions = []
+    base_stages = baseline.get("fixtures", {}).get("startup", {})
+    for stage, stats in report["fixtures"]["startup"].items():
+        base = base_stages.get(stage)
+        if base is None or "heavy_modules" not in stats:
+            continue
+        added = sorted(set(stats["heavy_modules"]) - set(base.get("heavy_modules", [])))
+        if added:
+            regressions.append(f"startup/{stage}: now imports {', '.join(added)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmarks for the NightGuide backend")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per stage")
+    parser.add_argument("--no-yolo", action="store_true", help="Skip the model_ready stage")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="Compare against a previously saved report")
+    parser.add_argument("--save-baseline", help="Also save this run as a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed median slowdown vs baseline")
+    args = parser.parse_args()
+
+    stages: Dict[str, dict] = {}
+    for name in STAGES:
+        if name == "model_ready" and args.no_yolo:
+            continue
+        stats = bench_stage(name, args.repeat)
+        if stats is None:
+            continue
+        stages[name] = stats
+        heavy = f"  heavy: {', '.join(stats['heavy_modules']) or 'none'}" if "heavy_modules" in stats else ""
+        print(f"    {name:<30} median {stats['median_ms']:9.1f}ms  p90 {stats['p90_ms']:9.1f}ms{heavy}",
+              file=sys.stderr)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+        },
+        # Same layout as bench_pipeline's report, so the baseline comparison is shared
+        "fixtures": {"startup": stages},
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.tolerance)
+        regressions += heavy_import_regressions(report, baseline)
+        report["regressions"] = regressions
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(output)
+
+    if regressions:
+        print(f"❌ {len(regressions)} startup regression(s):", file=sys.stderr)
+        for line in regressions:
+            print(f"    {line}", file=sys.stderr)
+        sys.exit(1)
+    if args.baseline:
+        print("✅ No regressions against the baseline.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
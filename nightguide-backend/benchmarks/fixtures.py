@@ -0,0 +1,79 @@
+"""
+Deterministic synthetic sky images for the benchmarks, so they run fully
+offline and produce the same pixels on every machine.
+"""
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+
+@dataclass(frozen=True)
+class SkyFixture:
+    name: str
+    width: int
+    height: int
+    star_count: int
+    seed: int = 0
+    background: float = 18.0  # mean sky level; ~50 is a light-polluted or twilight sky
+
+
+DEFAULT_FIXTURES = [
+    SkyFixture("phone-sparse", 1600, 1200, 150),
+    SkyFixture("phone-dense", 1600, 1200, 4000),
+    SkyFixture("dslr-sparse", 6000, 4000, 400),
+    SkyFixture("dslr-milky-way", 6000, 4000, 25000),
+    SkyFixture("phone-light-polluted", 2000, 1500, 1500, background=48),
+]
+
+
+def render_sky(fixture: SkyFixture) -> np.ndarray:
+    """
+    Renders a BGR star field: a noisy sky background around
+    `fixture.background` plus `star_count` Gaussian-blurred stars with a
+    power-law brightness distribution.
+    """
+    rng = np.random.default_rng(fixture.seed)
+    h, w = fixture.height, fixture.width
+
+    sky = rng.normal(fixture.background, 6, size=(h, w)).clip(0, 255).astype(np.float32)
+    # A soft glow band so dense fixtures resemble a Milky Way shot
+    yy = np.linspace(-1, 1, h, dtype=np.float32)[:, None]
+    xx = np.linspace(-1, 1, w, dtype=np.float32)[None, :]
+    sky += 35 * np.exp(-((yy - 0.3 * xx) ** 2) / 0.05) * min(1.0, fixture.star_count / 10000)
+
+    xs = rng.integers(0, w, fixture.star_count)
+    ys = rng.integers(0, h, fixture.star_count)
+    brightness = (255 * rng.power(0.35, fixture.star_count)).clip(40, 255)
+    radii = rng.integers(1, 5, fixture.star_count)
+    stars = np.zeros((h, w), dtype=np.float32)
+    for x, y, b, r in zip(xs, ys, brightness, radii):
+        cv2.circle(stars, (int(x), int(y)), int(r), float(b), -1)
+    stars = cv2.GaussianBlur(stars, (5, 5), 1.2)
+
+    gray = np.clip(sky + stars, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def plant_constellation(image: np.ndarray, star_points: List[Tuple[int, int]], box: List[int],
+                        seed: int = 0) -> List[Tuple[int, int]]:
+    """
+    Draws a catalog constellation's stars, rotated and scaled into `box`
+    ([x, y, w, h] pixels), brightly enough that star extraction finds them.
+    Returns the planted star coordinates in catalog order.
+    """
+    rng = np.random.default_rng(seed)
+    x, y, w, h = box
+    points = np.array(star_points, dtype=float)
+    points -= points.mean(axis=0)
+    angle = rng.uniform(0, 2 * np.pi)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    points = points @ rotation.T
+    extent = np.abs(points).max() or 1.0
+    points = points / extent * (0.4 * min(w, h)) + (x + w / 2, y + h / 2)
+
+    planted = [(int(px), int(py)) for px, py in points]
+    for px, py in planted:
+        cv2.circle(image, (px, py), 6, (255, 255, 255), -1)
+    return planted
@@ -1,25 +1,68 @@
+import ast
+import os
+import cv2
 import numpy as np
+import yaml
+from collections import defaultdict
 from typing import List, Dict, Tuple, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+ULTRALYTICS_BACKEND = "ultralytics"
+EXPORTED_BACKENDS = ("onnx", "openvino")
+
+def infer_backend(model_path: str, model_type: Optional[str] = None) -> str:
+    """Backend for a model: explicit onnx/openvino model_type, else from the file extension."""
+    if model_type in EXPORTED_BACKENDS:
+        return model_type
+    if model_path.endswith(".onnx"):
+        return "onnx"
+    if model_path.endswith(".xml") or model_path.rstrip("/").endswith("_openvino_model"):
+        return "openvino"
+    return ULTRALYTICS_BACKEND
+
 class CNNConstellationDetector:
     """
-    CNN-based constellation detector interface.
-    Your teammates can implement this class with their CNN model.
+    CPU inference backend for the YOLO constellation detector exported to
+    ONNX (run with ONNX Runtime) or OpenVINO IR (run with OpenVINO).
+
+    Produces the same {label: [normalized xywh boxes]} dict as
+    pipeline.get_yolo_detections, so it can stand in for the ultralytics
+    PyTorch model. Export the model with `python export_model.py`.
     """
     
-    def __init__(self, model_path: Optional[str] = None):
+    def __init__(self,
+                 model_path: Optional[str] = None,
+                 model_type: Optional[str] = None,
+                 class_names: Optional[List[str]] = None,
+                 input_size: int = 640,
+                 conf_threshold: float = 0.25,
+                 iou_threshold: float = 0.7,
+                 num_threads: int = 0):
         """
         Initialize the CNN detector.
         
         Args:
-            model_path: Path to the trained CNN model file
+            model_path: Path to the exported model (.onnx file, or OpenVINO .xml / export directory)
+            model_type: "onnx" or "openvino"; inferred from the path when omitted
+            class_names: Class names indexed by class id; read from the model metadata when omitted
+            input_size: Square input size the model was exported with (overridden by a static model input shape)
+            conf_threshold: Minimum confidence for a detection to be kept
+            iou_threshold: IoU threshold for per-class non-maximum suppression
+            num_threads: Intra-op CPU threads (0 = let the runtime decide)
         """
         self.model = None
         self.model_path = model_path
+        self.model_type = model_type
+        self.class_names = class_names
+        self.input_size = input_size
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.num_threads = num_threads
         self.is_loaded = False
+        self._input_name = None
+        self._dynamic_batch = False
         
         # Load the model if path is provided
         if model_path:
@@ -27,7 +70,7 @@ class CNNConstellationDetector:
     
     def load_model(self, model_path: str) -> bool:
         """
-        Load the CNN model from file.
+        Load the exported model from file.
         
         Args:
             model_path: Path to the model file
@@ -36,39 +79,144 @@ class CNNConstellationDetector:
             bool: True if model loaded successfully
         """
         try:
-            # TODO: Your teammates should implement this method
-            # Example implementation:
-            # import tensorflow as tf
-            # self.model = tf.keras.models.load_model(model_path)
-            # self.is_loaded = True
+            model_type = self.model_type or infer_backend(model_path)
+            if model_type == "onnx":
+                self._load_onnx(model_path)
+            elif model_type == "openvino":
+                self._load_openvino(model_path)
+            else:
+                raise ValueError(f"Unsupported model type '{model_type}' (expected onnx or openvino)")
             
-            logger.info(f"CNN model loaded from {model_path}")
+            self.model_type = model_type
+            self.model_path = model_path
+            self.is_loaded = True
+            logger.info(f"CNN model loaded from {model_path} ({model_type}, input {self.input_size}px, "
+                        f"{len(self.class_names or [])} classes)")
             return True
             
         except Exception as e:
             logger.error(f"Failed to load CNN model: {str(e)}")
             return False
     
-    def preprocess_image(self, image: np.ndarray) -> np.ndarray:
+    def _load_onnx(self, model_path: str):
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        # Don't spin idle threads between requests; the CPU is shared with star extraction
+        options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        
+        session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        model_input = session.get_inputs()[0]
+        self._input_name = model_input.name
+        self._read_input_shape(model_input.shape)
+        
+        if self.class_names is None:
+            metadata = session.get_modelmeta().custom_metadata_map
+            self.class_names = _parse_names(metadata.get("names"))
+        
+        self.model = session
+    
+    def _load_openvino(self, model_path: str):
+        import openvino as ov
+        
+        if os.path.isdir(model_path):
+            xml_files = [f for f in os.listdir(model_path) if f.endswith(".xml")]
+            if not xml_files:
+                raise FileNotFoundError(f"No OpenVINO .xml model found in {model_path}")
+            model_path = os.path.join(model_path, xml_files[0])
+        
+        core = ov.Core()
+        network = core.read_model(model_path)
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if self.num_threads:
+            config["INFERENCE_NUM_THREADS"] = self.num_threads
+        
+        model_input = network.inputs[0]
+        partial_shape = model_input.get_partial_shape()
+        self._read_input_shape([d.get_length() if d.is_static else None for d in partial_shape])
+        
+        if self.class_names is None:
+            self.class_names = _read_openvino_names(model_path)
+        
+        self.model = core.compile_model(network, "CPU", config)
+    
+    def _read_input_shape(self, shape):
+        # Exported YOLO models take NCHW input; a static H/W overrides input_size
+        batch, _, height, width = shape
+        self._dynamic_batch = not isinstance(batch, int)
+        if isinstance(height, int) and isinstance(width, int):
+            self.input_size = max(height, width)
+    
+    def preprocess_image(self, image: np.ndarray) -> Tuple[np.ndarray, float, Tuple[float, float]]:
         """
-        Preprocess image for CNN input.
+        Preprocess image for CNN input (YOLO letterbox).
         
         Args:
             image: Input image as numpy array (BGR format from OpenCV)
             
         Returns:
-            np.ndarray: Preprocessed image ready for CNN
-        """
-        # TODO: Your teammates should implement this method
-        # Example preprocessing:
-        # - Resize to model input size
-        # - Convert BGR to RGB
-        # - Normalize pixel values
-        # - Add batch dimension
-        
-        # Placeholder implementation
-        processed = image.copy()
-        return processed
+            Tuple of (NCHW float32 tensor in RGB 0-1, resize ratio, (pad_x, pad_y))
+        """
+        h, w = image.shape[:2]
+        ratio = min(self.input_size / h, self.input_size / w)
+        new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+        pad_x, pad_y = (self.input_size - new_w) / 2, (self.input_size - new_h) / 2
+        
+        resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR) if (new_w, new_h) != (w, h) else image
+        top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+        left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+        padded = cv2.copyMakeBorder(resized, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        
+        # BGR HWC uint8 -> RGB CHW float32 in [0, 1], with batch dimension
+        blob = cv2.dnn.blobFromImage(padded, scalefactor=1 / 255.0, swapRB=True)
+        return blob, ratio, (left, top)
+    
+    def _infer(self, blob: np.ndarray) -> np.ndarray:
+        if self.model_type == "onnx":
+            return self.model.run(None, {self._input_name: blob})[0]
+        return self.model(blob)[self.model.output(0)]
+    
+    def detect_yolo(self, image, with_confidence: bool = False,
+                    conf_threshold: Optional[float] = None) -> Dict[str, List[List[float]]]:
+        """
+        Detect constellations and return them in get_yolo_detections' shape.
+        
+        Args:
+            image: BGR image array, or a path to an image file
+            with_confidence: Append each box's confidence as a 5th value
+            conf_threshold: Overrides the detector's confidence threshold for this call
+            
+        Returns:
+            Dict mapping class label to a list of [x_center, y_center, w, h] boxes normalized to 0-1
+        """
+        return self.detect_batch([image], with_confidence, conf_threshold)[0]
+    
+    def detect_batch(self, images: List, with_confidence: bool = False,
+                     conf_threshold: Optional[float] = None) -> List[Dict[str, List[List[float]]]]:
+        """
+        Batched detect_yolo. Runs a single forward pass when the model was
+        exported with a dynamic batch dimension, one pass per image otherwise.
+        """
+        if not self.is_loaded:
+            raise RuntimeError("CNN model not loaded")
+        
+        images = [cv2.imread(image) if isinstance(image, str) else image for image in images]
+        prepared = [self.preprocess_image(image) for image in images]
+        
+        if self._dynamic_batch and len(prepared) > 1:
+            outputs = self._infer(np.concatenate([blob for blob, _, _ in prepared]))
+        else:
+            outputs = np.concatenate([self._infer(blob) for blob, _, _ in prepared])
+        
+        return [
+            self._process_predictions(outputs[i], image.shape, ratio, pad, with_confidence, conf_threshold)
+            for i, (image, (_, ratio, pad)) in enumerate(zip(images, prepared))
+        ]
     
     def detect_constellations(self, image: np.ndarray) -> List[Dict]:
         """
@@ -82,11 +230,9 @@ class CNNConstellationDetector:
             Example format:
             [
                 {
-                    "constellation": "Orion",
+                    "constellation": "Ori",
                     "confidence": 0.95,
-                    "bbox": [x1, y1, x2, y2],  # Optional bounding box
-                    "keypoints": [[x1, y1], [x2, y2], ...],  # Optional keypoints
-                    "stars": [{"x": 0.2, "y": 0.3, "name": "Betelgeuse"}, ...]
+                    "bbox": [x1, y1, x2, y2],  # Relative coordinates
                 }
             ]
         """
@@ -95,35 +241,104 @@ class CNNConstellationDetector:
             return []
         
         try:
-            # Preprocess image
-            processed_image = self.preprocess_image(image)
-            
-            # TODO: Your teammates should implement the actual CNN inference here
-            # Example:
-            # predictions = self.model.predict(processed_image)
-            # return self._process_predictions(predictions, image.shape)
-            
-            # Placeholder implementation
-            return []
+            detections = self.detect_yolo(image, with_confidence=True)
+            results = []
+            for label, boxes in detections.items():
+                for x_center, y_center, w, h, confidence in boxes:
+                    results.append({
+                        "constellation": label,
+                        "confidence": confidence,
+                        "bbox": [x_center - w / 2, y_center - h / 2, x_center + w / 2, y_center + h / 2],
+                    })
+            results.sort(key=lambda r: r["confidence"], reverse=True)
+            return results
             
         except Exception as e:
             logger.error(f"CNN detection failed: {str(e)}")
             return []
     
-    def _process_predictions(self, predictions: np.ndarray, image_shape: Tuple[int, int, int]) -> List[Dict]:
+    def _process_predictions(self, predictions: np.ndarray, image_shape: Tuple[int, int, int],
+                             ratio: float, pad: Tuple[float, float],
+                             with_confidence: bool = False,
+                             conf_threshold: Optional[float] = None) -> Dict[str, List[List[float]]]:
         """
-        Process raw CNN predictions into structured results.
+        Process raw YOLO predictions into get_yolo_detections' dict shape.
         
         Args:
-            predictions: Raw predictions from CNN model
+            predictions: Raw output for one image, shape (4 + num_classes, num_anchors)
             image_shape: Original image shape (height, width, channels)
+            ratio: Letterbox resize ratio
+            pad: Letterbox (x, y) padding in pixels
+            with_confidence: Append each box's confidence as a 5th value
+            conf_threshold: Overrides the detector's confidence threshold
             
         Returns:
-            List[Dict]: Processed constellation detections
+            Dict mapping class label to normalized [x_center, y_center, w, h(, conf)] boxes
         """
-        # TODO: Your teammates should implement this method
-        # This should convert the CNN output into the expected format
-        return []
+        conf_threshold = self.conf_threshold if conf_threshold is None else conf_threshold
+        predictions = predictions.T  # (num_anchors, 4 + num_classes)
+        class_scores = predictions[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        confidences = class_scores[np.arange(len(class_ids)), class_ids]
+        
+        keep = confidences >= conf_threshold
+        if not keep.any():
+            return {}
+        boxes, class_ids, confidences = predictions[keep, :4], class_ids[keep], confidences[keep]
+        
+        # Undo the letterbox: model space (cx, cy, w, h) -> original image pixels
+        img_h, img_w = image_shape[:2]
+        boxes = boxes.astype(np.float64)
+        boxes[:, 0] = (boxes[:, 0] - pad[0]) / ratio
+        boxes[:, 1] = (boxes[:, 1] - pad[1]) / ratio
+        boxes[:, 2:] /= ratio
+        
+        # Clip to the image, as ultralytics does before normalizing
+        x1 = np.clip(boxes[:, 0] - boxes[:, 2] / 2, 0, img_w)
+        y1 = np.clip(boxes[:, 1] - boxes[:, 3] / 2, 0, img_h)
+        x2 = np.clip(boxes[:, 0] + boxes[:, 2] / 2, 0, img_w)
+        y2 = np.clip(boxes[:, 1] + boxes[:, 3] / 2, 0, img_h)
+        
+        indices = cv2.dnn.NMSBoxesBatched(
+            np.stack([x1, y1, x2 - x1, y2 - y1], axis=1).tolist(),
+            confidences.astype(float).tolist(),
+            class_ids.astype(int).tolist(),
+            conf_threshold,
+            self.iou_threshold
+        )
+        
+        detections = defaultdict(list)
+        for i in sorted(np.array(indices).flatten().tolist(), key=lambda i: -confidences[i]):
+            box = [
+                float((x1[i] + x2[i]) / 2 / img_w),
+                float((y1[i] + y2[i]) / 2 / img_h),
+                float((x2[i] - x1[i]) / img_w),
+                float((y2[i] - y1[i]) / img_h),
+            ]
+            if with_confidence:
+                box.append(float(confidences[i]))
+            class_id = int(class_ids[i])
+            label = self.class_names[class_id] if self.class_names and class_id < len(self.class_names) else str(class_id)
+            detections[label].append(box)
+        return dict(detections)
+
+def _parse_names(names) -> Optional[List[str]]:
+    """Parses the class-name map that ultralytics stores in exported model metadata."""
+    if not names:
+        return None
+    if isinstance(names, str):
+        names = ast.literal_eval(names)
+    if isinstance(names, dict):
+        return [names[i] for i in sorted(names)]
+    return list(names)
+
+def _read_openvino_names(xml_path: str) -> Optional[List[str]]:
+    # ultralytics writes metadata.yaml next to the OpenVINO IR files
+    metadata_path = os.path.join(os.path.dirname(xml_path), "metadata.yaml")
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path, "r") as f:
+        return _parse_names(yaml.safe_load(f).get("names"))
 
 class HybridConstellationDetector:
     """
@@ -1,5 +1,5 @@
 import os
-from typing import Optional
+from typing import Optional, Tuple
 
 class Config:
     """Configuration management for NightGuide backend"""
@@ -11,9 +11,103 @@ class Config:
     # CNN Model settings
     USE_CNN = os.getenv("USE_CNN", "false").lower() == "true"
     CNN_MODEL_PATH = os.getenv("CNN_MODEL_PATH")
-    MODEL_TYPE = os.getenv("MODEL_TYPE", "tensorflow")  # tensorflow, pytorch, onnx
+    MODEL_TYPE = os.getenv("MODEL_TYPE", "tensorflow")  # tensorflow, pytorch, onnx, openvino
     MODEL_INPUT_SIZE = int(os.getenv("MODEL_INPUT_SIZE", 224))
     CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE_THRESHOLD", 0.8))
+    CNN_NUM_THREADS = int(os.getenv("CNN_NUM_THREADS", 0))  # 0 = let the runtime decide
+    
+    # Default detector (ultralytics / PyTorch)
+    YOLO_MODEL_PATH = os.getenv("YOLO_MODEL_PATH", "models/best.pt")
+    YOLO_YAML_PATH = os.getenv("YOLO_YAML_PATH", "models/data.yaml")
+    
+    # Inference batching (collects concurrent /upload requests into one predict)
+    ENABLE_BATCHING = os.getenv("ENABLE_BATCHING", "true").lower() == "true"
+    BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 8))
+    BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 5))
+    
+    # Compiled constellation catalog (see constellation_catalog.py); defaults to models/constellations.npz
+    CONSTELLATION_CATALOG_PATH = os.getenv("CONSTELLATION_CATALOG_PATH")
+    
+    # Decoding: reject uploads whose header declares more pixels than this
+    # (0 = no limit), and decode images at least twice DETECT_DECODE_SIDE on
+    # their longer side at 1/2, 1/4 or 1/8 resolution for detection (0 = off)
+    MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 120_000_000))
+    DETECT_DECODE_SIDE = int(os.getenv("DETECT_DECODE_SIDE", 1280))
+    
+    # Tiled inference for high-resolution frames (overlapping tiles + merged boxes)
+    TILED_INFERENCE = os.getenv("TILED_INFERENCE", "false").lower() == "true"
+    TILE_SIZE = int(os.getenv("TILE_SIZE", 1280))
+    TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", 0.2))
+    TILE_INCLUDE_FULL_FRAME = os.getenv("TILE_INCLUDE_FULL_FRAME", "true").lower() == "true"
+    
+    # Partial star matching when a box holds more or fewer stars than the catalog pattern
+    PARTIAL_MATCHING = os.getenv("PARTIAL_MATCHING", "true").lower() == "true"
+    PARTIAL_MATCH_MIN_FRACTION = float(os.getenv("PARTIAL_MATCH_MIN_FRACTION", 0.6))
+    PARTIAL_MATCH_EXTRA_STARS = int(os.getenv("PARTIAL_MATCH_EXTRA_STARS", 4))
+    PARTIAL_MATCH_MAX_HYPOTHESES = int(os.getenv("PARTIAL_MATCH_MAX_HYPOTHESES", 4096))
+    PARTIAL_MATCH_TIME_BUDGET_MS = float(os.getenv("PARTIAL_MATCH_TIME_BUDGET_MS", 25))
+    
+    # Per-box work: duplicate suppression and the star-extraction thread pool (1 = sequential)
+    DUPLICATE_BOX_IOU = float(os.getenv("DUPLICATE_BOX_IOU", 0.5))
+    ROI_WORKERS = int(os.getenv("ROI_WORKERS", min(4, os.cpu_count() or 1)))
+    
+    # Rendered output defaults (clients can override with ?format=&quality=&max_side= or Accept)
+    OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "jpeg")  # jpeg | webp | png
+    OUTPUT_QUALITY = int(os.getenv("OUTPUT_QUALITY", 85))
+    # Longer side of the returned image; 0 = the upload's resolution, even when detection ran on a reduced decode
+    OUTPUT_MAX_SIDE = int(os.getenv("OUTPUT_MAX_SIDE", 0))
+    
+    # Pipeline executor (runs the blocking pipeline off the event loop)
+    PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", min(4, os.cpu_count() or 1)))
+    PIPELINE_MAX_QUEUE = int(os.getenv("PIPELINE_MAX_QUEUE", 64))  # 0 = unbounded
+    
+    # Admission control for /upload and /upload/stream, applied before the body is read:
+    # at most ADMISSION_MAX_IN_FLIGHT admitted at once, ADMISSION_MAX_WAITING more queued
+    # for up to ADMISSION_MAX_WAIT_SECONDS, the rest rejected with 503 + Retry-After
+    ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() == "true"
+    ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 0))  # 0 = 2 x PIPELINE_WORKERS
+    ADMISSION_MAX_WAITING = int(os.getenv("ADMISSION_MAX_WAITING", 32))
+    ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", 10))
+    ADMISSION_PER_CLIENT = int(os.getenv("ADMISSION_PER_CLIENT", 0))  # per client IP; 0 = no cap (429 when over)
+    ADMISSION_TRUST_FORWARDED_FOR = os.getenv("ADMISSION_TRUST_FORWARDED_FOR", "false").lower() == "true"
+    
+    # Production launcher (gunicorn.conf.py / `python run.py --production`):
+    # uvicorn worker processes forked from a master that loads the model first
+    WEB_WORKERS = int(os.getenv("WEB_WORKERS", 0))  # 0 = one per CPU
+    PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "true").lower() == "true"
+    WORKER_TORCH_THREADS = int(os.getenv("WORKER_TORCH_THREADS", 0))  # 0 = CPUs / workers
+    WORKER_OPENCV_THREADS = int(os.getenv("WORKER_OPENCV_THREADS", 0))  # 0 = CPUs / workers
+    WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", 1000))  # recycle a worker after this many; 0 = never
+    WORKER_MAX_REQUESTS_JITTER = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", 100))
+    WORKER_TIMEOUT = int(os.getenv("WORKER_TIMEOUT", 120))  # seconds
+    
+    # Load and warm the model after the server starts listening (/ready turns 200 when done)
+    # instead of before; off = block startup until the model is ready
+    BACKGROUND_STARTUP = os.getenv("BACKGROUND_STARTUP", "true").lower() == "true"
+    
+    # Keep uploads in memory (decode -> pipeline -> encode) instead of temp files
+    IN_MEMORY_PIPELINE = os.getenv("IN_MEMORY_PIPELINE", "true").lower() == "true"
+    
+    # Result cache for /upload (content-addressed; in-memory pipeline mode only)
+    RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 256))
+    RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR")  # set to enable the on-disk tier
+    RESULT_CACHE_DISK_MAX_BYTES = int(os.getenv("RESULT_CACHE_DISK_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+    
+    # Batch uploads (/upload/batch)
+    BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", 0))  # 0 = PIPELINE_WORKERS
+    BATCH_UPLOAD_MAX_IMAGE_BYTES = int(os.getenv("BATCH_UPLOAD_MAX_IMAGE_BYTES", 50 * 1024 * 1024))
+    
+    # Live-sky WebSocket (/live): full detection on keyframes, optical-flow tracking in between
+    LIVE_KEYFRAME_INTERVAL = int(os.getenv("LIVE_KEYFRAME_INTERVAL", 30))  # frames
+    LIVE_MIN_TRACKED_FRACTION = float(os.getenv("LIVE_MIN_TRACKED_FRACTION", 0.5))
+    LIVE_MAX_FRAME_BYTES = int(os.getenv("LIVE_MAX_FRAME_BYTES", 4 * 1024 * 1024))
+    
+    # Observability (/metrics needs prometheus_client; tracing needs opentelemetry-sdk)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    TRACING_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT", "http://localhost:4318/v1/traces")
     
     # Logging
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -31,6 +125,37 @@ class Config:
         
         return True
     
+    @classmethod
+    def detector_model(cls) -> Tuple[str, Optional[str]]:
+        """
+        (model path, model type) for the constellation detector: the exported
+        CNN_MODEL_PATH when USE_CNN is set with MODEL_TYPE onnx/openvino,
+        otherwise the ultralytics PyTorch model.
+        """
+        if cls.USE_CNN and cls.CNN_MODEL_PATH and cls.MODEL_TYPE in ("onnx", "openvino"):
+            return cls.CNN_MODEL_PATH, cls.MODEL_TYPE
+        return cls.YOLO_MODEL_PATH, None
+    
+    @classmethod
+    def detect_decode_side(cls) -> int:
+        """Reduced-resolution decode target; tiled inference needs full-resolution pixels, so it's off then."""
+        return 0 if cls.TILED_INFERENCE else cls.DETECT_DECODE_SIDE
+    
+    @classmethod
+    def admission_max_in_flight(cls) -> int:
+        """Admitted uploads: by default one being processed and one uploading/encoding per pipeline thread."""
+        return cls.ADMISSION_MAX_IN_FLIGHT or 2 * cls.PIPELINE_WORKERS
+    
+    @classmethod
+    def web_workers(cls) -> int:
+        return cls.WEB_WORKERS or os.cpu_count() or 1
+    
+    @classmethod
+    def worker_threads(cls) -> Tuple[int, int]:
+        """(torch, OpenCV) threads per worker process; by default the CPUs are split evenly between workers."""
+        share = max(1, (os.cpu_count() or 1) // cls.web_workers())
+        return cls.WORKER_TORCH_THREADS or share, cls.WORKER_OPENCV_THREADS or share
+    
     @classmethod
     def print_config(cls):
         """Print current configuration"""
@@ -42,4 +167,37 @@ class Config:
             print(f"  Model Type: {cls.MODEL_TYPE}")
             print(f"  Input Size: {cls.MODEL_INPUT_SIZE}")
             print(f"  Confidence Threshold: {cls.CONFIDENCE_THRESHOLD}")
+            print(f"  CNN Threads: {cls.CNN_NUM_THREADS or 'auto'}")
+        print(f"  Detector Model: {cls.detector_model()[0]}")
+        print(f"  Batching: {cls.ENABLE_BATCHING}")
+        if cls.ENABLE_BATCHING:
+            print(f"  Batch Size / Window: {cls.BATCH_MAX_SIZE} / {cls.BATCH_MAX_WAIT_MS}ms")
+        print(f"  Max Image Pixels: {cls.MAX_IMAGE_PIXELS or 'unlimited'}")
+        print(f"  Detection Decode Side: {cls.detect_decode_side() or 'full resolution'}")
+        print(f"  Tiled Inference: {cls.TILED_INFERENCE}")
+        if cls.TILED_INFERENCE:
+            print(f"  Tile Size / Overlap: {cls.TILE_SIZE} / {cls.TILE_OVERLAP}")
+        print(f"  Partial Matching: {cls.PARTIAL_MATCHING}")
+        if cls.PARTIAL_MATCHING:
+            print(f"  Partial Match Min Fraction / Hypotheses / Budget: {cls.PARTIAL_MATCH_MIN_FRACTION} / "
+                  f"{cls.PARTIAL_MATCH_MAX_HYPOTHESES} / {cls.PARTIAL_MATCH_TIME_BUDGET_MS}ms")
+        print(f"  ROI Workers / Duplicate Box IoU: {cls.ROI_WORKERS} / {cls.DUPLICATE_BOX_IOU}")
+        print(f"  Output Format / Quality / Max Side: {cls.OUTPUT_FORMAT} / {cls.OUTPUT_QUALITY} / "
+              f"{cls.OUTPUT_MAX_SIDE or 'original'}")
+        print(f"  Pipeline Workers / Max Queue: {cls.PIPELINE_WORKERS} / {cls.PIPELINE_MAX_QUEUE}")
+        print(f"  Admission Control: {cls.ADMISSION_CONTROL}")
+        if cls.ADMISSION_CONTROL:
+            print(f"  Admission In Flight / Waiting / Max Wait / Per Client: {cls.admission_max_in_flight()} / "
+                  f"{cls.ADMISSION_MAX_WAITING} / {cls.ADMISSION_MAX_WAIT_SECONDS}s / {cls.ADMISSION_PER_CLIENT or 'unlimited'}")
+        print(f"  Background Startup: {cls.BACKGROUND_STARTUP}")
+        print(f"  In-Memory Pipeline: {cls.IN_MEMORY_PIPELINE}")
+        print(f"  Web Workers / Threads (torch, OpenCV): {cls.web_workers()} / {cls.worker_threads()} "
+              f"(preload model: {cls.PRELOAD_MODEL}, max requests: {cls.WORKER_MAX_REQUESTS or 'unlimited'})")
+        print(f"  Result Cache: {cls.RESULT_CACHE_ENABLED}")
+        if cls.RESULT_CACHE_ENABLED:
+            print(f"  Result Cache Entries / Bytes: {cls.RESULT_CACHE_MAX_ENTRIES} / {cls.RESULT_CACHE_MAX_BYTES}")
+            print(f"  Result Cache Dir: {cls.RESULT_CACHE_DIR or '(memory only)'}")
+        print(f"  Live Keyframe Interval / Min Tracked: {cls.LIVE_KEYFRAME_INTERVAL} / {cls.LIVE_MIN_TRACKED_FRACTION}")
+        print(f"  Metrics: {cls.METRICS_ENABLED}")
+        print(f"  Tracing: {cls.TRACING_ENDPOINT if cls.TRACING_ENABLED else False}")
         print(f"  Log Level: {cls.LOG_LEVEL}") 
\ No newline at end of file
@@ -0,0 +1,230 @@
+"""
+Compiled constellation catalog.
+
+The editable source is models/constellations.json (label -> name, canonical
+star points, connections). It is compiled into models/constellations.npz:
+one contiguous array per field for all 88 constellations, with the star
+points pre-centered and scale-normalized so matching does no per-request
+preprocessing. Rebuild it after editing the JSON:
+
+    python constellation_catalog.py
+
+At runtime the .npz is loaded lazily on first use. If it is missing or was
+compiled from a different JSON, the catalog is compiled in-process instead
+(and a warning logged).
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE_PATH = os.path.join(BACKEND_DIR, "models", "constellations.json")
+DEFAULT_CATALOG_PATH = os.path.join(BACKEND_DIR, "models", "constellations.npz")
+
+# Bumped whenever the .npz layout changes, so old files are recompiled
+CATALOG_FORMAT = 1
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """
+    One constellation. The arrays are read-only views into the catalog's
+    contiguous arrays: `points` as in the source, `centered` minus their
+    centroid, `normalized` additionally divided by `scale` (the RMS distance
+    from the centroid), `radii` each normalized point's distance from the
+    centroid (a rotation/scale-invariant per-star signature).
+    """
+    label: str
+    name: str
+    points: np.ndarray
+    centered: np.ndarray
+    normalized: np.ndarray
+    radii: np.ndarray
+    centroid: np.ndarray
+    scale: float
+    connections: np.ndarray
+
+    @property
+    def star_count(self) -> int:
+        return len(self.points)
+
+
+class ConstellationCatalog:
+    """
+    Read-only mapping of label -> CatalogEntry backed by flat arrays.
+
+    Star points of constellation i are rows point_offsets[i]:point_offsets[i + 1]
+    of `points` / `centered` / `normalized`; connections likewise with
+    `connection_offsets`.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.version = str(arrays["version"])
+        self.labels: List[str] = [str(label) for label in arrays["labels"]]
+        self.names: List[str] = [str(name) for name in arrays["names"]]
+        self.point_offsets = arrays["point_offsets"]
+        self.points = arrays["points"]
+        self.centered = arrays["centered"]
+        self.normalized = arrays["normalized"]
+        self.radii = arrays["radii"]
+        self.centroids = arrays["centroids"]
+        self.scales = arrays["scales"]
+        self.connection_offsets = arrays["connection_offsets"]
+        self.connections = arrays["connections"]
+        for array in (self.points, self.centered, self.normalized, self.radii, self.connections):
+            array.setflags(write=False)
+
+        self._entries: Dict[str, CatalogEntry] = {}
+        for i, label in enumerate(self.labels):
+            p0, p1 = self.point_offsets[i], self.point_offsets[i + 1]
+            c0, c1 = self.connection_offsets[i], self.connection_offsets[i + 1]
+            self._entries[label] = CatalogEntry(
+                label=label,
+                name=self.names[i],
+                points=self.points[p0:p1],
+                centered=self.centered[p0:p1],
+                normalized=self.normalized[p0:p1],
+                radii=self.radii[p0:p1],
+                centroid=self.centroids[i],
+                scale=float(self.scales[i]),
+                connections=self.connections[c0:c1],
+            )
+
+    def __getitem__(self, label: str) -> CatalogEntry:
+        return self._entries[label]
+
+    def __contains__(self, label) -> bool:
+        return label in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.labels)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def get(self, label: str) -> Optional[CatalogEntry]:
+        return self._entries.get(label)
+
+    def entries(self) -> List[CatalogEntry]:
+        return [self._entries[label] for label in self.labels]
+
+
+def source_version(source_bytes: bytes) -> str:
+    """Short hash of the catalog source file (and the .npz format); feeds result cache keys."""
+    # Line endings are normalized so a CRLF checkout doesn't look like an edit
+    return hashlib.sha256(f"{CATALOG_FORMAT}:".encode() + source_bytes.replace(b"\r\n", b"\n")).hexdigest()[:16]
+
+
+def compile_catalog(source_bytes: bytes) -> Dict[str, np.ndarray]:
+    """Flattens the {label: {name, star_points, connections}} JSON source into the catalog arrays."""
+    source = json.loads(source_bytes)
+    labels, names = [], []
+    point_offsets, connection_offsets = [0], [0]
+    points, centered, normalized, radii, centroids, scales, connections = [], [], [], [], [], [], []
+    for label, entry in source.items():
+        star_points = np.asarray(entry["star_points"], dtype=np.float64).reshape(-1, 2)
+        centroid = star_points.mean(axis=0)
+        offsets = star_points - centroid
+        scale = float(np.sqrt((offsets ** 2).sum(axis=1).mean())) or 1.0
+        labels.append(label)
+        names.append(entry["name"])
+        points.append(star_points)
+        centered.append(offsets)
+        normalized.append(offsets / scale)
+        radii.append(np.linalg.norm(offsets / scale, axis=1))
+        centroids.append(centroid)
+        scales.append(scale)
+        connections.append(np.asarray(entry["connections"], dtype=np.int32).reshape(-1, 2))
+        point_offsets.append(point_offsets[-1] + len(star_points))
+        connection_offsets.append(connection_offsets[-1] + len(connections[-1]))
+
+    return {
+        "version": np.array(source_version(source_bytes)),
+        "labels": np.array(labels),
+        "names": np.array(names),
+        "point_offsets": np.array(point_offsets, dtype=np.int32),
+        "points": np.ascontiguousarray(np.concatenate(points)),
+        "centered": np.ascontiguousarray(np.concatenate(centered)),
+        "normalized": np.ascontiguousarray(np.concatenate(normalized)),
+        "radii": np.concatenate(radii),
+        "centroids": np.array(centroids),
+        "scales": np.array(scales),
+        "connection_offsets": np.array(connection_offsets, dtype=np.int32),
+        "connections": np.ascontiguousarray(np.concatenate(connections)),
+    }
+
+
+def read_source(source_path: str = DEFAULT_SOURCE_PATH) -> bytes:
+    with open(source_path, "rb") as f:
+        return f.read()
+
+
+def build_catalog(source_path: str = DEFAULT_SOURCE_PATH, catalog_path: str = DEFAULT_CATALOG_PATH) -> str:
+    """Compiles the JSON source into the .npz catalog and returns its version."""
+    arrays = compile_catalog(read_source(source_path))
+    # Uncompressed, so loading is a straight read of each array
+    with open(catalog_path, "wb") as f:
+        np.savez(f, format=np.array(CATALOG_FORMAT), **arrays)
+    return str(arrays["version"])
+
+
+def load_catalog(catalog_path: str = DEFAULT_CATALOG_PATH,
+                 source_path: str = DEFAULT_SOURCE_PATH) -> ConstellationCatalog:
+    """
+    Loads the compiled catalog, compiling from the JSON source in memory when
+    the .npz is missing, of another format, or was built from a different
+    source (checked by hashing the raw JSON bytes, without parsing them).
+    A deployment may ship only the .npz, in which case it is used as is.
+    """
+    source_bytes = read_source(source_path) if os.path.exists(source_path) else None
+    if os.path.exists(catalog_path):
+        with np.load(catalog_path, allow_pickle=False) as npz:
+            if int(npz["format"]) == CATALOG_FORMAT and (
+                    source_bytes is None or str(npz["version"]) == source_version(source_bytes)):
+                return ConstellationCatalog({name: npz[name] for name in npz.files})
+    if source_bytes is None:
+        raise FileNotFoundError(f"Neither {catalog_path} nor {source_path} exists")
+    logger.warning(f"Constellation catalog {catalog_path} is missing or out of date; compiling "
+                   f"{source_path} in memory (run `python constellation_catalog.py` to rebuild it)")
+    return ConstellationCatalog(compile_catalog(source_bytes))
+
+
+_catalog: Optional[ConstellationCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> ConstellationCatalog:
+    """The process-wide catalog, loaded on first use."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = load_catalog(Config.CONSTELLATION_CATALOG_PATH or DEFAULT_CATALOG_PATH)
+    return _catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the constellation catalog to .npz")
+    parser.add_argument("--source", default=DEFAULT_SOURCE_PATH, help="Catalog source JSON")
+    parser.add_argument("--output", default=DEFAULT_CATALOG_PATH, help="Compiled .npz to write")
+    args = parser.parse_args()
+
+    version = build_catalog(args.source, args.output)
+    catalog = load_catalog(args.output, args.source)
+    print(f"✅ Compiled {len(catalog)} constellations ({len(catalog.points)} stars) "
+          f"to {args.output}, version {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,72 +7,12 @@ import json
 import os
 import logging
 
+from pattern_index import get_pattern_index
+
 logger = logging.getLogger(__name__)
 
 class ConstellationDetector:
     def __init__(self, use_cnn: bool = False, cnn_model_path: Optional[str] = None):
-        # Predefined constellation patterns (simplified for demo)
-        self.constellations = {
-            "Orion": {
-                "description": "The Hunter",
-                "stars": [
-                    {"name": "Betelgeuse", "x": 0.2, "y": 0.3},
-                    {"name": "Bellatrix", "x": 0.3, "y": 0.25},
-                    {"name": "Mintaka", "x": 0.5, "y": 0.5},
-                    {"name": "Alnilam", "x": 0.5, "y": 0.45},
-                    {"name": "Alnitak", "x": 0.5, "y": 0.4},
-                    {"name": "Saiph", "x": 0.4, "y": 0.7},
-                    {"name": "Rigel", "x": 0.45, "y": 0.75}
-                ],
-                "lines": [
-                    [0.2, 0.3, 0.3, 0.25],  # Betelgeuse to Bellatrix
-                    [0.3, 0.25, 0.5, 0.5],  # Bellatrix to Mintaka
-                    [0.5, 0.5, 0.5, 0.45],  # Mintaka to Alnilam
-                    [0.5, 0.45, 0.5, 0.4],  # Alnilam to Alnitak
-                    [0.5, 0.4, 0.4, 0.7],   # Alnitak to Saiph
-                    [0.4, 0.7, 0.45, 0.75], # Saiph to Rigel
-                    [0.45, 0.75, 0.2, 0.3]  # Rigel to Betelgeuse
-                ]
-            },
-            "Ursa Major": {
-                "description": "The Great Bear",
-                "stars": [
-                    {"name": "Dubhe", "x": 0.1, "y": 0.1},
-                    {"name": "Merak", "x": 0.15, "y": 0.15},
-                    {"name": "Phecda", "x": 0.2, "y": 0.2},
-                    {"name": "Megrez", "x": 0.25, "y": 0.25},
-                    {"name": "Alioth", "x": 0.3, "y": 0.3},
-                    {"name": "Mizar", "x": 0.35, "y": 0.35},
-                    {"name": "Alkaid", "x": 0.4, "y": 0.4}
-                ],
-                "lines": [
-                    [0.1, 0.1, 0.15, 0.15],
-                    [0.15, 0.15, 0.2, 0.2],
-                    [0.2, 0.2, 0.25, 0.25],
-                    [0.25, 0.25, 0.3, 0.3],
-                    [0.3, 0.3, 0.35, 0.35],
-                    [0.35, 0.35, 0.4, 0.4]
-                ]
-            },
-            "Cassiopeia": {
-                "description": "The Queen",
-                "stars": [
-                    {"name": "Schedar", "x": 0.6, "y": 0.2},
-                    {"name": "Caph", "x": 0.7, "y": 0.25},
-                    {"name": "Gamma Cas", "x": 0.8, "y": 0.3},
-                    {"name": "Segin", "x": 0.75, "y": 0.4},
-                    {"name": "Ruchbah", "x": 0.65, "y": 0.35}
-                ],
-                "lines": [
-                    [0.6, 0.2, 0.7, 0.25],
-                    [0.7, 0.25, 0.8, 0.3],
-                    [0.8, 0.3, 0.75, 0.4],
-                    [0.75, 0.4, 0.65, 0.35],
-                    [0.65, 0.35, 0.6, 0.2]
-                ]
-            }
-        }
-        
         # CNN integration
         self.use_cnn = use_cnn
         self.cnn_detector = None
@@ -125,40 +65,39 @@ class ConstellationDetector:
         
         return stars
 
-    def match_constellation(self, detected_stars: List[Dict[str, float]]) -> Tuple[str, Dict]:
-        """Match detected stars to known constellations"""
-        best_match = None
-        best_score = 0
-        
-        for const_name, const_data in self.constellations.items():
-            score = self._calculate_similarity(detected_stars, const_data["stars"])
-            if score > best_score:
-                best_score = score
-                best_match = const_name
-        
-        # Return the best match or a default
-        if best_match and best_score > 0.3:  # Threshold for confidence
-            return best_match, self.constellations[best_match]
-        else:
-            # Return a random constellation for demo purposes
-            import random
-            const_name = random.choice(list(self.constellations.keys()))
-            return const_name, self.constellations[const_name]
+    def match_constellation(self, detected_stars: List[Dict[str, float]],
+                            image_shape: Optional[Tuple[int, int]] = None) -> Tuple[Optional[str], Dict]:
+        """
+        Match detected stars against every catalog constellation through the
+        geometric-hashing pattern index. `image_shape` ((height, width)) turns
+        the relative star coordinates back into pixels so the pattern's
+        proportions survive a non-square image.
+        Returns (name, data) with the relative `lines` and `points` to draw,
+        or (None, {}) when no constellation is recognised.
+        """
+        height, width = image_shape[:2] if image_shape is not None else (1, 1)
+        # Brightest first: the index only hashes the leading stars
+        stars = sorted(detected_stars, key=lambda star: star.get("brightness", 0), reverse=True)
+        points = np.array([[star["x"] * width, star["y"] * height] for star in stars]).reshape(-1, 2)
 
-    def _calculate_similarity(self, detected_stars: List[Dict], const_stars: List[Dict]) -> float:
-        """Calculate similarity between detected stars and constellation pattern"""
-        if not detected_stars or not const_stars:
-            return 0.0
-        
-        # Simple similarity based on star count and positions
-        # In a real implementation, this would be much more sophisticated
-        score = min(len(detected_stars), len(const_stars)) / max(len(detected_stars), len(const_stars))
-        
-        # Add some randomness for demo purposes
-        import random
-        score += random.uniform(0, 0.2)
-        
-        return min(score, 1.0)
+        match = get_pattern_index().match(points)
+        if match is None:
+            return None, {}
+
+        relative = match.stars / np.array([width, height], dtype=np.float64)
+        return match.name, {
+            "label": match.label,
+            "description": match.name,
+            "score": match.score,
+            "stars": [
+                {"name": f"{match.name} #{i + 1}", "x": float(x), "y": float(y)}
+                for i, (x, y) in enumerate(relative)
+            ],
+            "lines": [
+                [float(relative[a][0]), float(relative[a][1]), float(relative[b][0]), float(relative[b][1])]
+                for a, b in match.connections
+            ],
+        }
 
     def process_image(self, image_bytes: bytes) -> Dict:
         """Process uploaded image and return constellation data"""
@@ -195,7 +134,17 @@ class ConstellationDetector:
             # Fallback to traditional methods
             logger.info("Using traditional CV methods for constellation detection")
             detected_stars = self.detect_stars(image)
-            const_name, const_data = self.match_constellation(detected_stars)
+            const_name, const_data = self.match_constellation(detected_stars, image.shape)
+            if const_name is None:
+                return {
+                    "constellation": None,
+                    "description": "",
+                    "lines": [],
+                    "points": [],
+                    "detected_stars": len(detected_stars),
+                    "confidence": "low",
+                    "method": "traditional"
+                }
             
             # Prepare response
             result = {
@@ -204,7 +153,7 @@ class ConstellationDetector:
                 "lines": const_data["lines"],
                 "points": const_data["stars"],
                 "detected_stars": len(detected_stars),
-                "confidence": "high" if len(detected_stars) > 5 else "medium",
+                "confidence": "high" if const_data["score"] > 0.8 else "medium",
                 "method": "traditional"
             }
             
@@ -0,0 +1,65 @@
+"""
+Export the YOLO constellation detector (models/best.pt) for CPU inference.
+
+    python export_model.py --format onnx
+    python export_model.py --format openvino
+
+Then serve it with:
+
+    USE_CNN=true MODEL_TYPE=onnx CNN_MODEL_PATH=models/best.onnx python run.py
+"""
+import argparse
+import os
+
+from config import Config
+
+
+def export_model(model_path: str, export_format: str, imgsz: int = 640,
+                 dynamic_batch: bool = True, half: bool = False) -> str:
+    """
+    Exports `model_path` with ultralytics and returns the exported path
+    (a .onnx file, or an *_openvino_model directory).
+    """
+    from ultralytics import YOLO
+
+    model = YOLO(model_path)
+    kwargs = dict(format=export_format, imgsz=imgsz)
+    if export_format == "onnx":
+        # A dynamic batch axis lets the inference batcher run one forward
+        # pass for several concurrent uploads
+        kwargs.update(dynamic=dynamic_batch, simplify=True)
+    elif export_format == "openvino":
+        kwargs.update(dynamic=dynamic_batch, half=half)
+    return model.export(**kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the NightGuide detector to ONNX / OpenVINO")
+    parser.add_argument("--model", default=Config.YOLO_MODEL_PATH, help="Path to the PyTorch weights")
+    parser.add_argument("--format", choices=["onnx", "openvino"], default="onnx")
+    parser.add_argument("--imgsz", type=int, default=640, help="Square input size")
+    parser.add_argument("--static-batch", action="store_true", help="Export with a fixed batch size of 1")
+    parser.add_argument("--half", action="store_true", help="FP16 weights (OpenVINO only)")
+    parser.add_argument("--verify", action="store_true", help="Load the export and run a dummy inference")
+    args = parser.parse_args()
+
+    print(f"📦 Exporting {args.model} to {args.format} ({args.imgsz}px)...")
+    exported = export_model(args.model, args.format, args.imgsz, not args.static_batch, args.half)
+    print(f"✅ Exported to {exported}")
+
+    if args.verify:
+        import numpy as np
+        from cnn_integration import CNNConstellationDetector
+
+        detector = CNNConstellationDetector(exported, model_type=args.format, input_size=args.imgsz)
+        if not detector.is_loaded:
+            raise SystemExit("❌ Exported model could not be loaded")
+        detector.detect_yolo(np.zeros((args.imgsz, args.imgsz, 3), dtype=np.uint8))
+        print(f"✅ Verified: {len(detector.class_names or [])} classes, input {detector.input_size}px")
+
+    print(f"👉 Serve it with: USE_CNN=true MODEL_TYPE={args.format} "
+          f"CNN_MODEL_PATH={os.path.relpath(exported)} python run.py")
+
+
+if __name__ == "__main__":
+    main()
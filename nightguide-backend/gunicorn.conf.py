@@ -0,0 +1,77 @@
+"""
+Production launch: gunicorn with uvicorn workers.
+
+    gunicorn main:app          # from nightguide-backend/, picks up this file
+    python run.py --production
+
+The master imports main (preload_app) and loads the detection model, class
+names and constellation catalog before forking, so every worker starts with
+them already in memory, shared copy-on-write, and a recycled worker
+(WORKER_MAX_REQUESTS) comes back without reloading anything. Each worker
+still warms the model up itself in main's lifespan; inference must not run
+in the master, whose runtime thread pools would not survive the fork.
+
+Only the ultralytics (PyTorch) model is preloaded. ONNX Runtime and
+OpenVINO sessions own threads from the moment they are created, so those
+backends load in each worker.
+"""
+import gc
+import logging
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# config and main are importable wherever gunicorn is started from
+sys.path.insert(0, BACKEND_DIR)
+
+from config import Config
+
+logger = logging.getLogger("gunicorn.error")
+
+torch_threads, opencv_threads = Config.worker_threads()
+# Read by OpenMP/MKL when torch is first imported. main no longer imports it;
+# the first import is registry.preload in on_starting below (or the first model
+# load in a worker), so these must stay set at module level, before that hook runs
+os.environ.setdefault("OMP_NUM_THREADS", str(torch_threads))
+os.environ.setdefault("MKL_NUM_THREADS", str(torch_threads))
+
+bind = f"{Config.HOST}:{Config.PORT}"
+workers = Config.web_workers()
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+max_requests = Config.WORKER_MAX_REQUESTS
+max_requests_jitter = Config.WORKER_MAX_REQUESTS_JITTER if Config.WORKER_MAX_REQUESTS else 0
+timeout = Config.WORKER_TIMEOUT
+graceful_timeout = Config.WORKER_TIMEOUT
+loglevel = Config.LOG_LEVEL.lower()
+wsgi_app = "main:app"
+chdir = BACKEND_DIR
+
+
+def on_starting(server):
+    if not Config.PRELOAD_MODEL:
+        return
+    from cnn_integration import ULTRALYTICS_BACKEND, infer_backend
+    from constellation_catalog import get_catalog
+    from main import MODEL_PATH, MODEL_TYPE, YAML_PATH
+    from model_registry import registry
+
+    get_catalog()
+    if infer_backend(MODEL_PATH, MODEL_TYPE) == ULTRALYTICS_BACKEND:
+        registry.preload(MODEL_PATH, YAML_PATH, MODEL_TYPE)
+    # Move everything allocated so far out of the collector's reach: collections
+    # in the workers would otherwise write to these objects' pages and un-share them
+    gc.freeze()
+    logger.info(f"Preloaded {MODEL_PATH} and the constellation catalog for {workers} workers")
+
+
+def post_fork(server, worker):
+    import cv2
+    cv2.setNumThreads(opencv_threads)
+    try:
+        import torch
+    except ImportError:
+        pass
+    else:
+        torch.set_num_threads(torch_threads)
+    logger.info(f"Worker {worker.pid}: {torch_threads} torch / {opencv_threads} OpenCV threads")
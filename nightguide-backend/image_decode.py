@@ -0,0 +1,115 @@
+import io
+import logging
+import warnings
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from telemetry import stage
+
+logger = logging.getLogger(__name__)
+
+# Scale factors OpenCV can decode at directly; for JPEG this is libjpeg's DCT
+# scaling, so the full-resolution pixels are never materialised.
+_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an upload's header declares more pixels than the configured budget."""
+
+
+@dataclass
+class DecodedImage:
+    """
+    An upload decoded for the pipeline.
+
+    `image` is the BGR array detection runs on, decoded at 1/`factor` of the
+    original resolution. `width`/`height` are the original dimensions. When
+    `factor` > 1, `load_full_resolution` returns the full-resolution BGR
+    image that star extraction and a full-size rendering both use; it is
+    decoded on the first call only (once the detector has found something)
+    and kept for the rest of the request.
+    """
+    image: np.ndarray
+    width: int
+    height: int
+    factor: int = 1
+    load_full_resolution: Optional[Callable[[], np.ndarray]] = None
+
+
+def image_dimensions(image_bytes: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from the image header alone, or None if Pillow can't identify it."""
+    try:
+        with warnings.catch_warnings():
+            # We enforce our own pixel budget; Pillow's bomb warning would just be noise
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(image_bytes)) as header:
+                return header.size
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e)) from e
+    except Exception:
+        return None
+
+
+def reduction_factor(width: int, height: int, detect_side: int) -> int:
+    """Largest of 1/2/4/8 that keeps the longer side at or above `detect_side` (0 = never reduce)."""
+    if detect_side <= 0:
+        return 1
+    factor = 1
+    for candidate in sorted(_REDUCED_FLAGS):
+        if max(width, height) / candidate >= detect_side:
+            factor = candidate
+    return factor
+
+
+def decode_for_pipeline(image_bytes: bytes, max_pixels: int = 0, detect_side: int = 0) -> Optional[DecodedImage]:
+    """
+    Adaptive decode: reads the header dimensions first and raises
+    ImageTooLargeError above `max_pixels` (0 = no limit) before any pixels are
+    decoded. Images whose longer side is at least twice `detect_side` are
+    decoded at reduced resolution for detection. Returns None if the bytes
+    can't be decoded.
+    """
+    dimensions = image_dimensions(image_bytes)
+    if dimensions is not None and max_pixels and dimensions[0] * dimensions[1] > max_pixels:
+        raise ImageTooLargeError(
+            f"Image is {dimensions[0]}x{dimensions[1]} ({dimensions[0] * dimensions[1]} pixels); "
+            f"the limit is {max_pixels} pixels.")
+
+    factor = reduction_factor(*dimensions, detect_side) if dimensions is not None else 1
+    buffer = np.frombuffer(image_bytes, np.uint8)
+    with stage("decode"):
+        img = cv2.imdecode(buffer, _REDUCED_FLAGS[factor] if factor > 1 else cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+
+    img_h, img_w = img.shape[:2]
+    if factor == 1:
+        if max_pixels and img_w * img_h > max_pixels:
+            # Pillow couldn't read the header; still don't hand a huge array on
+            raise ImageTooLargeError(f"Image is {img_w}x{img_h}; the limit is {max_pixels} pixels.")
+        return DecodedImage(image=img, width=img_w, height=img_h)
+
+    width, height = dimensions
+    if (img_w > img_h) != (width > height):
+        # The decoder applied an EXIF rotation the header size doesn't reflect
+        width, height = height, width
+
+    full_resolution = []
+
+    def load_full_resolution() -> np.ndarray:
+        if not full_resolution:
+            with stage("decode_full_resolution"):
+                full_resolution.append(cv2.imdecode(buffer, cv2.IMREAD_COLOR))
+        return full_resolution[0]
+
+    logger.debug("Decoded %dx%d upload at 1/%d for detection", width, height, factor)
+    return DecodedImage(image=img, width=width, height=height, factor=factor,
+                        load_full_resolution=load_full_resolution)
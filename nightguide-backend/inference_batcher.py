@@ -0,0 +1,125 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+from cnn_integration import ULTRALYTICS_BACKEND
+from model_registry import LoadedModel
+from pipeline import detections_from_result
+from telemetry import stage, INFERENCE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceBatcher:
+    """
+    Dynamic micro-batching scheduler in front of a YOLO model.
+
+    Requests submitted from concurrent threads are collected for up to
+    `max_wait_ms` (or until `max_batch_size` is reached) and run through a
+    single batched `predict`. Each caller gets back only the detections for
+    its own image, in the same dict shape as `get_yolo_detections` with
+    `with_confidence=True`.
+    """
+
+    def __init__(self,
+                 loaded_model: LoadedModel,
+                 max_batch_size: int = 8,
+                 max_wait_ms: float = 5.0,
+                 conf_threshold: float = 0.25):
+        self.loaded_model = loaded_model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.conf_threshold = conf_threshold
+
+        self._queue: "queue.Queue[Optional[Tuple[object, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the background batching thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Inference batcher started (max_batch_size={self.max_batch_size}, "
+                    f"max_wait_ms={self.max_wait * 1000:.1f})")
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """Stop the batching thread once the queued requests have been served."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, source) -> Future:
+        """Queue an image (path or BGR ndarray) and return a Future with its detections."""
+        if self._thread is None:
+            raise RuntimeError("InferenceBatcher is not running; call start() first")
+        future: Future = Future()
+        self._queue.put((source, future))
+        return future
+
+    def detect(self, source, timeout: Optional[float] = None) -> dict:
+        """Blocking helper: submit an image and wait for its detections."""
+        return self.submit(source).result(timeout)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _collect_batch(self, first) -> Tuple[List[Tuple[object, Future]], bool]:
+        batch = [first]
+        stopping = False
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+        return batch, stopping
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stopping = self._collect_batch(first)
+            self._predict(batch)
+            if stopping:
+                return
+
+    def _predict(self, batch: List[Tuple[object, Future]]):
+        # Skip requests whose caller has already given up
+        batch = [(source, future) for source, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        sources = [source for source, _ in batch]
+        INFERENCE_BATCH_SIZE.observe(len(sources))
+        try:
+            with stage("batch_predict", batch_size=len(sources)):
+                if self.loaded_model.backend != ULTRALYTICS_BACKEND:
+                    # Exported ONNX / OpenVINO model: already returns detection dicts
+                    detections = self.loaded_model.model.detect_batch(
+                        sources, with_confidence=True, conf_threshold=self.conf_threshold)
+                else:
+                    results = self.loaded_model.model.predict(source=sources, conf=self.conf_threshold, verbose=False)
+                    detections = [
+                        detections_from_result(result, self.loaded_model.class_names, with_confidence=True)
+                        for result in results
+                    ]
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), image_detections in zip(batch, detections):
+            future.set_result(image_detections)
@@ -0,0 +1,182 @@
+"""
+Live-sky mode: constellation overlays for a stream of camera frames.
+
+Running YOLO and star extraction on every frame is far too slow for a live
+view, so the full pipeline only runs on keyframes. In between, the ordered
+star positions of each matched constellation are carried forward with
+pyramidal Lucas-Kanade optical flow, and a similarity transform fitted to
+each constellation's tracked stars moves the whole figure (stars lost by the
+tracker included). A new keyframe is taken every `keyframe_interval` frames,
+when too few stars survive tracking, or when the client asks for one.
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, List, Optional
+
+import cv2
+import numpy as np
+
+from image_decode import decode_for_pipeline
+from pipeline import results_to_geometry
+from telemetry import stage, LIVE_FRAMES
+
+logger = logging.getLogger(__name__)
+
+LK_PARAMS = dict(winSize=(21, 21), maxLevel=3,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+MAX_FORWARD_BACKWARD_ERROR = 1.0  # pixels; a point that doesn't track back to itself is dropped
+
+
+class LatestFrame:
+    """
+    One-slot mailbox between a connection's receive loop and its processing
+    loop. A new frame replaces one that hasn't been picked up yet, so a client
+    sending faster than we can process gets the newest frame processed and
+    the rest dropped, instead of a growing backlog.
+    """
+
+    def __init__(self):
+        self._frame: Optional[bytes] = None
+        self._closed = False
+        self._event = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, frame: bytes):
+        if self._frame is not None:
+            self.dropped += 1
+            LIVE_FRAMES.labels("dropped").inc()
+        self._frame = frame
+        self._event.set()
+
+    def close(self):
+        self._closed = True
+        self._event.set()
+
+    async def get(self) -> Optional[bytes]:
+        """The newest frame, waiting for one if needed; None once closed."""
+        while self._frame is None and not self._closed:
+            self._event.clear()
+            await self._event.wait()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+class LiveSkyTracker:
+    """
+    Per-connection tracking state. `analyze` runs the full pipeline on a BGR
+    frame and returns analyze_image results (or None). Not thread-safe: a
+    connection processes one frame at a time.
+    """
+
+    def __init__(self,
+                 analyze: Callable[[np.ndarray], Optional[list]],
+                 keyframe_interval: int = 30,
+                 min_tracked_fraction: float = 0.5,
+                 max_pixels: int = 0):
+        self.analyze = analyze
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.min_tracked_fraction = min_tracked_fraction
+        self.max_pixels = max_pixels
+        self.frame_count = 0
+        self._results: List[dict] = []
+        self._gray: Optional[np.ndarray] = None
+        self._since_keyframe = 0
+        self._keyframe_requested = True
+
+    def request_keyframe(self):
+        self._keyframe_requested = True
+
+    def process_bytes(self, frame_bytes: bytes) -> Optional[dict]:
+        """
+        Decodes an encoded frame and returns its overlay update (None if it
+        can't be decoded). Raises image_decode.ImageTooLargeError above the
+        pixel budget.
+        """
+        decoded = decode_for_pipeline(frame_bytes, self.max_pixels)
+        if decoded is None:
+            return None
+        return self.process(decoded.image)
+
+    def process(self, frame: np.ndarray) -> dict:
+        """The overlay update for a BGR frame: a keyframe detection or a tracked update."""
+        start = time.perf_counter()
+        self.frame_count += 1
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        img_h, img_w = gray.shape
+
+        keyframe = (self._keyframe_requested or self._gray is None
+                    or self._gray.shape != gray.shape
+                    or self._since_keyframe >= self.keyframe_interval)
+        tracked = 1.0
+        if not keyframe:
+            with stage("live_track"):
+                tracked = self._track(self._gray, gray)
+            if tracked < self.min_tracked_fraction:
+                logger.debug("Live tracking kept %.0f%% of stars; taking a keyframe", tracked * 100)
+                keyframe = True
+        if keyframe:
+            with stage("live_keyframe"):
+                self._results = [result for result in (self.analyze(frame) or []) if result['matched']]
+            self._since_keyframe = 0
+            self._keyframe_requested = False
+            tracked = 1.0
+        else:
+            self._since_keyframe += 1
+        self._gray = gray
+        LIVE_FRAMES.labels("keyframe" if keyframe else "tracked").inc()
+
+        update = results_to_geometry(self._results, img_w, img_h)
+        update.update({
+            "type": "overlay",
+            "frame": self.frame_count,
+            "keyframe": keyframe,
+            "tracked": round(tracked, 3),
+            "processing_ms": round((time.perf_counter() - start) * 1000, 2),
+        })
+        return update
+
+    def _track(self, previous: np.ndarray, current: np.ndarray) -> float:
+        """
+        Moves every tracked constellation from `previous` to `current` in
+        place, dropping those that lose all but one star. Returns the fraction
+        of stars tracked.
+        """
+        if not self._results:
+            return 1.0
+        img_h, img_w = current.shape
+        counts = [len(result['stars']) for result in self._results]
+        points = np.array([p for result in self._results for p in result['stars']],
+                          dtype=np.float32).reshape(-1, 1, 2)
+        forward, status, _ = cv2.calcOpticalFlowPyrLK(previous, current, points, None, **LK_PARAMS)
+        backward, back_status, _ = cv2.calcOpticalFlowPyrLK(current, previous, forward, None, **LK_PARAMS)
+        error = np.linalg.norm((backward - points).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < MAX_FORWARD_BACKWARD_ERROR)
+
+        kept = []
+        offset = 0
+        for result, count in zip(self._results, counts):
+            src = points[offset:offset + count].reshape(-1, 2)
+            dst = forward[offset:offset + count].reshape(-1, 2)
+            ok = good[offset:offset + count]
+            offset += count
+            if ok.sum() < 2:
+                continue
+            # Lost stars follow the ones that tracked
+            transform, _ = cv2.estimateAffinePartial2D(src[ok], dst[ok])
+            if transform is None:
+                continue
+            moved = src @ transform[:, :2].T + transform[:, 2]
+            moved[ok] = dst[ok]
+            x, y, w, h = result['box']
+            corners = np.array([[x, y], [x + w, y], [x, y + h], [x + w, y + h]], dtype=np.float64)
+            corners = corners @ transform[:, :2].T + transform[:, 2]
+            (bx0, by0), (bx1, by1) = corners.min(axis=0), corners.max(axis=0)
+            # Float positions, so sub-pixel motion doesn't round away frame after frame
+            kept.append(dict(result,
+                             stars=[(float(px), float(py)) for px, py in moved],
+                             box=[int(bx0), int(by0), int(bx1 - bx0), int(by1 - by0)],
+                             box_normalized=[(bx0 + bx1) / 2 / img_w, (by0 + by1) / 2 / img_h,
+                                             (bx1 - bx0) / img_w, (by1 - by0) / img_h]))
+        self._results = kept
+        return float(good.mean()) if len(good) else 1.0
@@ -1,45 +1,674 @@
+import asyncio
+import base64
+import json
+import logging
 import os
+import time
 import uuid
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import FileResponse, JSONResponse
+from typing import List, Optional, Tuple
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from starlette.background import BackgroundTask # <-- 1. ADD THIS IMPORT
 import shutil
-from pipeline import run_full_pipeline
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+from image_decode import ImageTooLargeError
+from pipeline import (run_full_pipeline, run_pipeline_on_bytes, analyze_bytes, analyze_image,
+                      stream_pipeline_on_bytes, shutdown_roi_pool)
+from constellation_catalog import get_catalog
+from model_registry import registry
+from inference_batcher import InferenceBatcher
+from tiled_inference import TiledDetector
+from pipeline_executor import PipelineExecutor, PipelineBusyError
+from admission import AdmissionController, AdmissionMiddleware
+from result_cache import ResultCache, file_fingerprint, make_cache_key, guess_media_type
+from output_encoding import OutputEncoding, negotiate_encoding
+from batch_upload import iter_upload_images
+from live_sky import LatestFrame, LiveSkyTracker
+from config import Config
+import telemetry
+from telemetry import stage
 
-app = FastAPI()
-MODEL_PATH = "models/best.pt"
-YAML_PATH = "models/data.yaml"
+# best.pt through ultralytics by default; an exported ONNX / OpenVINO model
+# when USE_CNN=true and MODEL_TYPE=onnx|openvino (see export_model.py)
+MODEL_PATH, MODEL_TYPE = Config.detector_model()
+YAML_PATH = Config.YOLO_YAML_PATH
 TEMP_DIR = "temp_images"
-os.makedirs(TEMP_DIR, exist_ok=True)
+logger = logging.getLogger(__name__)
+if not Config.IN_MEMORY_PIPELINE:
+    os.makedirs(TEMP_DIR, exist_ok=True)
 
-@app.post("/upload")
-async def upload_and_run_pipeline(file: UploadFile = File(...)):
+def start_detector(app: FastAPI):
+    """
+    Blocking part of startup: loads the catalog and the model, warms the model
+    up and builds the detection chain on it, then marks the app ready.
+    """
+    start = time.perf_counter()
+    get_catalog()
+    # Load the model and class names once per worker and warm it up,
+    # so the first /upload doesn't pay the weight-load cost.
+    loaded_model = registry.warm_up(MODEL_PATH, YAML_PATH, MODEL_TYPE)
+    if Config.ENABLE_BATCHING:
+        app.state.batcher = InferenceBatcher(
+            loaded_model,
+            max_batch_size=Config.BATCH_MAX_SIZE,
+            max_wait_ms=Config.BATCH_MAX_WAIT_MS
+        )
+        app.state.batcher.start()
+        telemetry.track_queue("batcher", lambda: app.state.batcher.queue_depth)
+    # What the pipeline calls for detections: the tiler (which feeds its tiles
+    # to the batcher when batching is on), the batcher, or None for a direct predict
+    if Config.TILED_INFERENCE:
+        app.state.detector = TiledDetector(
+            loaded_model,
+            tile_size=Config.TILE_SIZE,
+            overlap=Config.TILE_OVERLAP,
+            batch_size=Config.BATCH_MAX_SIZE,
+            include_full_frame=Config.TILE_INCLUDE_FULL_FRAME,
+            inner=app.state.batcher
+        )
+    else:
+        app.state.detector = app.state.batcher
+    app.state.startup_seconds = time.perf_counter() - start
+    app.state.ready = True
+    logger.info(f"Ready to serve after {app.state.startup_seconds:.2f}s")
+
+async def start_detector_in_background(app: FastAPI):
+    try:
+        await run_in_threadpool(start_detector, app)
+    except Exception as e:
+        logger.exception("Startup failed; /ready will keep reporting it")
+        app.state.startup_error = f"{type(e).__name__}: {e}"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    telemetry.configure_tracing()
+    app.state.ready = False
+    app.state.startup_error = None
+    app.state.batcher = app.state.detector = None
+    if Config.RESULT_CACHE_ENABLED and Config.IN_MEMORY_PIPELINE:
+        app.state.result_cache = ResultCache(
+            max_entries=Config.RESULT_CACHE_MAX_ENTRIES,
+            max_bytes=Config.RESULT_CACHE_MAX_BYTES,
+            disk_dir=Config.RESULT_CACHE_DIR,
+            disk_max_bytes=Config.RESULT_CACHE_DISK_MAX_BYTES
+        )
+    else:
+        app.state.result_cache = None
+    app.state.executor = PipelineExecutor(
+        max_workers=Config.PIPELINE_WORKERS,
+        max_queue=Config.PIPELINE_MAX_QUEUE
+    )
+    telemetry.track_queue("executor", lambda: app.state.executor.queue_depth)
+    telemetry.IN_FLIGHT.set_function(lambda: app.state.executor.in_flight)
+    if Config.ADMISSION_CONTROL:
+        app.state.admission = AdmissionController(
+            max_in_flight=Config.admission_max_in_flight(),
+            max_waiting=Config.ADMISSION_MAX_WAITING,
+            max_wait=Config.ADMISSION_MAX_WAIT_SECONDS,
+            per_client=Config.ADMISSION_PER_CLIENT
+        )
+        telemetry.track_queue("admission", lambda: app.state.admission.queue_depth)
+        telemetry.ADMISSION_IN_FLIGHT.set_function(lambda: app.state.admission.in_flight)
+        telemetry.ADMISSION_OLDEST_WAIT.set_function(app.state.admission.oldest_wait)
+    else:
+        app.state.admission = None
+    # In the background, the server answers /health (and /ready with 503)
+    # while the model loads, instead of refusing connections
+    startup = None
+    if Config.BACKGROUND_STARTUP:
+        startup = asyncio.create_task(start_detector_in_background(app))
+    else:
+        start_detector(app)
+    yield
+    if startup is not None:
+        # The load can't be interrupted; let it finish so the batcher it starts gets stopped
+        await startup
+    app.state.executor.shutdown()
+    shutdown_roi_pool()
+    if app.state.batcher is not None:
+        app.state.batcher.stop()
+    telemetry.shutdown_tracing()
+
+app = FastAPI(lifespan=lifespan)
+# Added before record_request, so it sits inside it and rejections are still recorded
+app.add_middleware(AdmissionMiddleware, paths=("/upload", "/upload/stream"),
+                   trust_forwarded_for=Config.ADMISSION_TRUST_FORWARDED_FOR)
+
+def route_template(request: Request) -> str:
+    """The matched route's path template (e.g. /results/{cache_key}), keeping metric labels bounded."""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    """Request latency histogram plus a root trace span for every request."""
+    endpoint = route_template(request)
+    start = request.state.received_at = time.perf_counter()
+    status = 500
+    try:
+        with telemetry.span(f"{request.method} {endpoint}", **{"http.method": request.method, "http.route": endpoint}) as current:
+            response = await call_next(request)
+            status = response.status_code
+            if current is not None:
+                current.set_attribute("http.status_code", status)
+            return response
+    finally:
+        telemetry.REQUEST_SECONDS.labels(endpoint, request.method, str(status)).observe(time.perf_counter() - start)
+
+def result_cache_key(image_bytes: bytes, output_format: str) -> str:
+    """Cache key for an upload: image content + model weights + constellation catalog + detection mode + output format."""
+    detection_mode = f"tiled:{Config.TILE_SIZE}:{Config.TILE_OVERLAP}:{Config.TILE_INCLUDE_FULL_FRAME}" if Config.TILED_INFERENCE else "full"
+    detection_mode += f":decode{Config.detect_decode_side()}:nms{Config.DUPLICATE_BOX_IOU}"
+    if Config.PARTIAL_MATCHING:
+        detection_mode += (f":partial{Config.PARTIAL_MATCH_MIN_FRACTION}:{Config.PARTIAL_MATCH_EXTRA_STARS}"
+                           f":{Config.PARTIAL_MATCH_MAX_HYPOTHESES}:{Config.PARTIAL_MATCH_TIME_BUDGET_MS}ms")
+    return make_cache_key(image_bytes, file_fingerprint(MODEL_PATH), get_catalog().version, detection_mode, output_format)
+
+def image_encoding(format: Optional[str], quality: Optional[int], max_side: Optional[int]) -> OutputEncoding:
+    """
+    Encoding of the rendered image for endpoints that always return one
+    (/upload/stream, /upload/batch). Raises ValueError for unknown formats and json.
+    """
+    encoding = negotiate_encoding("", format, quality, max_side)
+    if encoding.format == "json":
+        raise ValueError("format=json is not available here; the geometry is part of the response already.")
+    return encoding
+
+def busy_response() -> JSONResponse:
+    """503 for uploads admitted but refused by the full executor queue."""
+    retry_after = app.state.admission.retry_after() if app.state.admission is not None else 1
+    return JSONResponse(status_code=503, content={"error": "Server is busy, please retry shortly."},
+                        headers={"Retry-After": str(retry_after)})
+
+def not_ready_response() -> JSONResponse:
+    """503 for requests that arrive while the model is still loading (or failed to load)."""
+    error = app.state.startup_error or "The model is still loading, please retry shortly."
+    return JSONResponse(status_code=503, content={"error": error}, headers={"Retry-After": "5"})
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def cached_image_response(image_bytes: bytes, cache_key: str) -> Response:
+    return Response(
+        content=image_bytes,
+        media_type=guess_media_type(image_bytes),
+        headers={
+            "ETag": f'"{cache_key}"',
+            "Cache-Control": "no-cache",
+            "Content-Location": f"/results/{cache_key}"
+        }
+    )
+
+def process_upload_in_memory(image_bytes: bytes, filename: str, encoding: Optional[OutputEncoding] = None):
+    """
+    Blocking part of /upload in in-memory mode: decodes the bytes, runs the
+    pipeline and returns the image rendered as `encoding` (Config's default
+    when None), or the JSON geometry when its format is "json" (None on failure).
+    Runs inside the pipeline executor.
+    """
+    encoding = encoding or OutputEncoding.default()
+    if encoding.format == "json":
+        geometry = analyze_bytes(
+            image_bytes,
+            model_path=MODEL_PATH,
+            yaml_path=YAML_PATH,
+            loaded_model=registry.get(MODEL_PATH, YAML_PATH, MODEL_TYPE),
+            batcher=app.state.detector,
+            image_name=filename,
+            max_pixels=Config.MAX_IMAGE_PIXELS,
+            detect_side=Config.detect_decode_side()
+        )
+        return json.dumps(geometry).encode() if geometry is not None else None
+    return run_pipeline_on_bytes(
+        image_bytes,
+        model_path=MODEL_PATH,
+        yaml_path=YAML_PATH,
+        loaded_model=registry.get(MODEL_PATH, YAML_PATH, MODEL_TYPE),
+        batcher=app.state.detector,
+        image_name=filename,
+        max_pixels=Config.MAX_IMAGE_PIXELS,
+        detect_side=Config.detect_decode_side(),
+        encoding=encoding
+    )
+
+async def run_pipeline_cached(image_bytes: bytes, filename: str,
+                              encoding: Optional[OutputEncoding] = None) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    Runs the in-memory pipeline through the executor, consulting the result
+    cache first. Returns (encoded result or None, cache key or None).
+    Raises PipelineBusyError when the executor queue is full and
+    ImageTooLargeError when the image exceeds MAX_IMAGE_PIXELS.
+    """
+    encoding = encoding or OutputEncoding.default()
+    cache = app.state.result_cache
+    cache_key = None
+    if cache is not None:
+        # Re-uploads and client retries are served without re-running the pipeline;
+        # hashing and the disk tier stay off the event loop
+        with stage("cache_lookup"):
+            cache_key = await run_in_threadpool(result_cache_key, image_bytes, encoding.cache_tag)
+            cached = await run_in_threadpool(cache.get, cache_key)
+        if cached is not None:
+            return cached, cache_key
+    result = await app.state.executor.run(process_upload_in_memory, image_bytes, filename, encoding)
+    if result is not None and cache is not None:
+        await run_in_threadpool(cache.put, cache_key, result)
+    return result, cache_key
+
+def process_upload(upload_file, filename: str):
+    """
+    Blocking part of /upload in temp-file mode: saves the file, runs the
+    pipeline and returns the output path (or None on failure).
+    Runs inside the pipeline executor.
+    """
     unique_id = str(uuid.uuid4())
-    input_filename = f"{unique_id}_{file.filename}"
+    input_filename = f"{unique_id}_{filename}"
     output_filename = f"{unique_id}_processed.jpg"
     
     input_path = os.path.join(TEMP_DIR, input_filename)
     output_path = os.path.join(TEMP_DIR, output_filename)
     
-    with open(input_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    with stage("save_upload"), open(input_path, "wb") as buffer:
+        shutil.copyfileobj(upload_file, buffer)
     
-    success = run_full_pipeline(
-        image_path=input_path,
-        model_path=MODEL_PATH,
-        yaml_path=YAML_PATH,
-        output_path=output_path
-    )
+    try:
+        success = run_full_pipeline(
+            image_path=input_path,
+            model_path=MODEL_PATH,
+            yaml_path=YAML_PATH,
+            output_path=output_path,
+            loaded_model=registry.get(MODEL_PATH, YAML_PATH, MODEL_TYPE),
+            batcher=app.state.detector,
+            max_pixels=Config.MAX_IMAGE_PIXELS,
+            detect_side=Config.detect_decode_side()
+        )
+    finally:
+        os.remove(input_path)
     
-    os.remove(input_path)
+    return output_path if success else None
+
+@app.post("/upload")
+async def upload_and_run_pipeline(request: Request, file: UploadFile = File(...), format: Optional[str] = None,
+                                  quality: Optional[int] = None, max_side: Optional[int] = None):
+    """
+    Returns the rendered image, JPEG by default. `format` (jpeg, webp, png or
+    json) or else the Accept header picks the encoding; `quality` (1-100,
+    JPEG/WebP) and `max_side` (downscale so the longer side fits) tune it.
+    JSON skips rendering and returns the detected constellations' geometry.
+    """
+    # FastAPI has already parsed the multipart body by the time we get here
+    telemetry.observe_stage("parse_upload", time.perf_counter() - request.state.received_at)
+    try:
+        encoding = negotiate_encoding(request.headers.get("accept", ""), format, quality, max_side)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if not app.state.ready:
+        return not_ready_response()
+    # Temp-file mode always writes the configured JPEG
+    if encoding.format == "json" and not Config.IN_MEMORY_PIPELINE:
+        return JSONResponse(status_code=501, content={"error": "JSON output requires IN_MEMORY_PIPELINE=true."})
+
+    # The pipeline is fully synchronous, so it runs in the bounded executor
+    # and the event loop stays free for other requests (and /health).
+    try:
+        if Config.IN_MEMORY_PIPELINE:
+            with stage("read_upload"):
+                image_bytes = await file.read()
+            result, cache_key = await run_pipeline_cached(image_bytes, file.filename, encoding)
+            if result is not None and cache_key is not None:
+                return cached_image_response(result, cache_key)
+        else:
+            result = await app.state.executor.run(process_upload, file.file, file.filename)
+    except PipelineBusyError:
+        return busy_response()
+    except ImageTooLargeError as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
     
-    if not success:
+    if result is None:
         return JSONResponse(status_code=500, content={"error": "Failed to process image or find constellations."})
-        
+    
+    if Config.IN_MEMORY_PIPELINE:
+        return Response(content=result, media_type=guess_media_type(result))
+    
     # --- 2. THIS IS THE CORRECTED RETURN STATEMENT ---
+    output_path = result
     cleanup_task = BackgroundTask(os.remove, output_path)
     return FileResponse(output_path, media_type="image/jpeg", background=cleanup_task)
 
+def process_upload_streaming(image_bytes: bytes, filename: str, emit, encoding: OutputEncoding,
+                             render: bool = True):
+    """
+    Blocking part of /upload/stream: runs the progressive pipeline, passing
+    each event to `emit` as it happens, and returns (geometry, image bytes,
+    or None without `render`). Runs inside the pipeline executor.
+    """
+    return stream_pipeline_on_bytes(
+        image_bytes,
+        model_path=MODEL_PATH,
+        yaml_path=YAML_PATH,
+        emit=emit,
+        loaded_model=registry.get(MODEL_PATH, YAML_PATH, MODEL_TYPE),
+        batcher=app.state.detector,
+        image_name=filename,
+        max_pixels=Config.MAX_IMAGE_PIXELS,
+        detect_side=Config.detect_decode_side(),
+        encoding=encoding,
+        render=render
+    )
+
+def image_event(image_bytes: Optional[bytes], cache_key: Optional[str], include_image: bool) -> dict:
+    """The final /upload/stream event: a link to the rendered image, or the image itself."""
+    if image_bytes is None:
+        return {"event": "error", "error": "Failed to render the result image."}
+    event = {"event": "image"}
+    if cache_key is not None:
+        event["etag"] = f'"{cache_key}"'
+        event["result_url"] = f"/results/{cache_key}"
+    if include_image or cache_key is None:
+        event["image"] = base64.b64encode(image_bytes).decode("ascii")
+    return event
+
+@app.post("/upload/stream")
+async def upload_stream(request: Request, file: UploadFile = File(...), include_image: bool = False,
+                        format: Optional[str] = None, quality: Optional[int] = None, max_side: Optional[int] = None,
+                        render: bool = True):
+    """
+    Progressive /upload. Streams NDJSON events as the pipeline produces them:
+    "detections" (YOLO labels and boxes, as soon as inference returns), one
+    "constellation" per box once its stars are matched, "geometry" (the
+    complete format=json body), "image" (a /results link to the rendered
+    image, or the image base64-encoded with include_image or when the result
+    cache is off) and finally "done". `format` (jpeg, webp or png),
+    `quality` and `max_side` pick the image encoding as for /upload.
+    Clients that draw the geometry themselves pass render=0: the image is
+    then never drawn, encoded or cached, and no "image" event is sent.
+    Busy, too-large and nothing-found uploads fail with the same status codes
+    as /upload, before any event is sent.
+    """
+    telemetry.observe_stage("parse_upload", time.perf_counter() - request.state.received_at)
+    if not Config.IN_MEMORY_PIPELINE:
+        return JSONResponse(status_code=501, content={"error": "Streaming requires IN_MEMORY_PIPELINE=true."})
+    if not app.state.ready:
+        return not_ready_response()
+    try:
+        encoding = image_encoding(format, quality, max_side)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    with stage("read_upload"):
+        image_bytes = await file.read()
+
+    cache = app.state.result_cache
+    json_key = image_key = None
+    if cache is not None:
+        with stage("cache_lookup"):
+            json_key, image_key = await run_in_threadpool(
+                lambda: (result_cache_key(image_bytes, "json"),
+                         result_cache_key(image_bytes, encoding.cache_tag) if render else None))
+            cached_geometry, cached_image = await run_in_threadpool(
+                lambda: (cache.get(json_key), cache.get(image_key) if render else None))
+        if cached_geometry is not None and (cached_image is not None or not render):
+            events = [dict(json.loads(cached_geometry), event="geometry")]
+            if render:
+                events.append(image_event(cached_image, image_key, include_image))
+            events.append({"event": "done"})
+            return StreamingResponse((json.dumps(event) + "\n" for event in events),
+                                     media_type="application/x-ndjson")
+
+    # The pipeline emits from its worker thread; events hop onto the loop in order,
+    # and the job's completion (queued after them) closes the stream
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    job = asyncio.create_task(app.state.executor.run(
+        process_upload_streaming, image_bytes, file.filename,
+        lambda event: loop.call_soon_threadsafe(events.put_nowait, event), encoding, render))
+    job.add_done_callback(lambda _: events.put_nowait(None))
+
+    first = await events.get()
+    if first is None:
+        try:
+            job.result()
+        except PipelineBusyError:
+            return busy_response()
+        except ImageTooLargeError as e:
+            return JSONResponse(status_code=413, content={"error": str(e)})
+        return JSONResponse(status_code=500, content={"error": "Failed to process image or find constellations."})
+
+    async def stream_events():
+        event = first
+        while event is not None:
+            yield json.dumps(event) + "\n"
+            event = await events.get()
+        try:
+            geometry, rendered = job.result()
+        except Exception as e:
+            yield json.dumps({"event": "error", "error": str(e)}) + "\n"
+            return
+        if cache is not None:
+            def store():
+                cache.put(json_key, json.dumps(geometry).encode())
+                if rendered is not None:
+                    cache.put(image_key, rendered)
+            await run_in_threadpool(store)
+        if render:
+            yield json.dumps(image_event(rendered, image_key if rendered is not None else None, include_image)) + "\n"
+        yield json.dumps({"event": "done"}) + "\n"
+
+    return StreamingResponse(stream_events(), media_type="application/x-ndjson")
+
+async def run_batch_item(index: int, filename: str, image_bytes: bytes,
+                         error: Optional[str], include_image: bool,
+                         encoding: Optional[OutputEncoding] = None) -> dict:
+    """Processes one image of a batch upload and returns its NDJSON record."""
+    record = {"index": index, "filename": filename}
+    if error:
+        record.update(status="error", error=error)
+        return record
+
+    # Other requests may have filled the executor queue; back off and retry
+    # rather than failing images that were already accepted as part of the batch.
+    delay = 0.05
+    while True:
+        try:
+            result, cache_key = await run_pipeline_cached(image_bytes, filename, encoding)
+            break
+        except PipelineBusyError:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        except ImageTooLargeError as e:
+            record.update(status="error", error=str(e))
+            return record
+
+    if result is None:
+        record.update(status="error", error="Failed to process image or find constellations.")
+        return record
+
+    record["status"] = "ok"
+    if cache_key is not None:
+        record["etag"] = f'"{cache_key}"'
+        record["result_url"] = f"/results/{cache_key}"
+    if include_image or cache_key is None:
+        record["image"] = base64.b64encode(result).decode("ascii")
+    return record
+
+@app.post("/upload/batch")
+async def upload_batch(files: List[UploadFile] = File(...), include_image: bool = False,
+                       format: Optional[str] = None, quality: Optional[int] = None, max_side: Optional[int] = None):
+    """
+    Accepts many images and/or zip/tar archives of images in one request.
+    Images run through the pipeline in parallel (sharing the loaded model) and
+    one NDJSON line is streamed back per image as soon as it finishes.
+    `format`, `quality` and `max_side` pick the image encoding as for /upload/stream.
+    """
+    if not Config.IN_MEMORY_PIPELINE:
+        return JSONResponse(status_code=501, content={"error": "Batch upload requires IN_MEMORY_PIPELINE=true."})
+    if not app.state.ready:
+        return not_ready_response()
+    try:
+        encoding = image_encoding(format, quality, max_side)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    concurrency = Config.BATCH_UPLOAD_CONCURRENCY or app.state.executor.max_workers
+
+    async def stream_results():
+        entries = iter_upload_images(files, Config.BATCH_UPLOAD_MAX_IMAGE_BYTES)
+        pending = set()
+        index = 0
+        exhausted = False
+        try:
+            while True:
+                # Keep at most `concurrency` images in flight; archive members are
+                # read lazily so thousands of images are never all in memory.
+                while not exhausted and len(pending) < concurrency:
+                    entry = await run_in_threadpool(next, entries, None)
+                    if entry is None:
+                        exhausted = True
+                        break
+                    filename, image_bytes, error = entry
+                    pending.add(asyncio.create_task(
+                        run_batch_item(index, filename, image_bytes, error, include_image, encoding)))
+                    index += 1
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield json.dumps(task.result()) + "\n"
+            yield json.dumps({"status": "done", "total": index}) + "\n"
+        finally:
+            # The client went away (or the stream failed): images still queued
+            # for the executor are dropped instead of processed for no one
+            for task in pending:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+def analyze_live_frame(frame):
+    """Full detection + star matching for a live-sky keyframe (runs inside the pipeline executor)."""
+    return analyze_image(
+        frame,
+        model_path=MODEL_PATH,
+        yaml_path=YAML_PATH,
+        loaded_model=registry.get(MODEL_PATH, YAML_PATH, MODEL_TYPE),
+        batcher=app.state.detector
+    )
+
+@app.websocket("/live")
+async def live_sky(websocket: WebSocket):
+    """
+    Live-sky mode. The client sends encoded camera frames (JPEG/PNG) as binary
+    messages, and may send {"type": "keyframe"} to force a fresh detection;
+    every processed frame is answered with an "overlay" JSON message (the
+    format=json geometry plus frame/keyframe/tracked/dropped fields). Frames
+    arriving while one is being processed replace each other, so only the
+    newest is processed.
+    """
+    await websocket.accept()
+    if not app.state.ready:
+        await websocket.send_json({"type": "error", "error": app.state.startup_error or "The model is still loading."})
+        await websocket.close(code=1013)  # Try Again Later
+        return
+    tracker = LiveSkyTracker(
+        analyze_live_frame,
+        keyframe_interval=Config.LIVE_KEYFRAME_INTERVAL,
+        min_tracked_fraction=Config.LIVE_MIN_TRACKED_FRACTION,
+        max_pixels=Config.MAX_IMAGE_PIXELS
+    )
+    frames = LatestFrame()
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    if len(message["bytes"]) > Config.LIVE_MAX_FRAME_BYTES:
+                        await websocket.send_json({"type": "error", "error": "Frame exceeds LIVE_MAX_FRAME_BYTES."})
+                        continue
+                    frames.put(message["bytes"])
+                elif message.get("text"):
+                    try:
+                        control = json.loads(message["text"])
+                    except ValueError:
+                        continue
+                    if isinstance(control, dict) and control.get("type") == "keyframe":
+                        tracker.request_keyframe()
+        finally:
+            frames.close()
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while (frame_bytes := await frames.get()) is not None:
+            try:
+                update = await app.state.executor.run(tracker.process_bytes, frame_bytes)
+            except PipelineBusyError:
+                # The server is saturated; this frame counts as dropped and the next one is tried
+                frames.dropped += 1
+                telemetry.LIVE_FRAMES.labels("dropped").inc()
+                continue
+            except ImageTooLargeError as e:
+                update = {"type": "error", "error": str(e)}
+            if update is None:
+                update = {"type": "error", "error": "Could not decode frame."}
+            update["dropped"] = frames.dropped
+            await websocket.send_json(update)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    """Liveness probe: the process is up and serving, whether or not the model has loaded yet."""
+    return {"status": "ok"}
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness probe: 200 once the model is loaded and warmed up, 503 while starting or after a failed load."""
+    if app.state.ready:
+        return {"status": "ready", "model": MODEL_PATH, "startup_seconds": round(app.state.startup_seconds, 3)}
+    if app.state.startup_error:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": app.state.startup_error})
+    return JSONResponse(status_code=503, content={"status": "starting"})
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms, detection counters, queue depths."""
+    if not (Config.METRICS_ENABLED and telemetry.metrics_available()):
+        return JSONResponse(status_code=501, content={"error": "Metrics require METRICS_ENABLED=true and prometheus-client."})
+    return Response(content=telemetry.render_metrics(), media_type=telemetry.METRICS_CONTENT_TYPE)
+
+@app.get("/results/{cache_key}")
+def get_cached_result(cache_key: str, request: Request):
+    """Serves a previously rendered result; conditional GETs return 304."""
+    cache = app.state.result_cache
+    if cache is None or cache_key not in cache:
+        return JSONResponse(status_code=404, content={"error": "Result not found."})
+    etag = f'"{cache_key}"'
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    cached = cache.get(cache_key)
+    if cached is None:
+        return JSONResponse(status_code=404, content={"error": "Result not found."})
+    return cached_image_response(cached, cache_key)
+
+@app.get("/stats")
+def pipeline_stats():
+    """Queue depth and in-flight counts for the pipeline executor and batcher."""
+    stats = {"executor": app.state.executor.stats()}
+    if app.state.batcher is not None:
+        stats["batcher"] = {"queue_depth": app.state.batcher.queue_depth}
+    if app.state.result_cache is not None:
+        stats["result_cache"] = app.state.result_cache.stats()
+    if app.state.admission is not None:
+        stats["admission"] = app.state.admission.stats()
+    return stats
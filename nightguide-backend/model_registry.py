@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import yaml
+
+from cnn_integration import ULTRALYTICS_BACKEND, infer_backend
+from config import Config
+from telemetry import MODEL_LOAD_SECONDS, MODEL_WARMUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LoadedModel:
+    """
+    A detection model together with the class names it was trained on.
+
+    `backend` is "ultralytics" for the PyTorch YOLO model (`model` is a
+    `YOLO`), or "onnx"/"openvino" for an exported model (`model` is a
+    `cnn_integration.CNNConstellationDetector`).
+    """
+    model: Any
+    class_names: List[str]
+    model_path: str
+    yaml_path: str
+    load_seconds: float
+    backend: str = ULTRALYTICS_BACKEND
+    warmed_up: bool = False
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded detection models.
+
+    Each (model_path, yaml_path, backend) is loaded once per worker process
+    and the same instance is handed out to every request afterwards.
+    """
+
+    def __init__(self):
+        self._models: Dict[Tuple[str, str, str], LoadedModel] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_path: str, yaml_path: str, model_type: Optional[str] = None) -> LoadedModel:
+        """Return the loaded model for the given paths, loading it on first use."""
+        backend = infer_backend(model_path, model_type)
+        key = (model_path, yaml_path, backend)
+        loaded = self._models.get(key)
+        if loaded is not None:
+            return loaded
+
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            loaded = self._models.get(key)
+            if loaded is None:
+                loaded = self._load(model_path, yaml_path, backend)
+                self._models[key] = loaded
+        return loaded
+
+    def preload(self, model_path: str, yaml_path: str, model_type: Optional[str] = None) -> LoadedModel:
+        """
+        Load the model without running inference, in a parent process about
+        to fork workers: the weights are then shared copy-on-write instead of
+        loaded once per worker. Conv+BN layers are fused here, since the first
+        predict would otherwise write a fused copy into every worker. No
+        inference runs, so no runtime thread pools exist yet when forking.
+        """
+        loaded = self.get(model_path, yaml_path, model_type)
+        if loaded.backend == ULTRALYTICS_BACKEND:
+            loaded.model.fuse()
+        return loaded
+
+    def warm_up(self, model_path: str, yaml_path: str, model_type: Optional[str] = None,
+                image_size: int = 640) -> LoadedModel:
+        """Load the model (if needed) and run one dummy inference to initialise the graph."""
+        loaded = self.get(model_path, yaml_path, model_type)
+        if loaded.warmed_up:
+            return loaded
+
+        start = time.perf_counter()
+        dummy = np.zeros((image_size, image_size, 3), dtype=np.uint8)
+        if loaded.backend == ULTRALYTICS_BACKEND:
+            loaded.model.predict(source=dummy, verbose=False)
+        else:
+            loaded.model.detect_yolo(dummy)
+        loaded.warmed_up = True
+        warmup_seconds = time.perf_counter() - start
+        MODEL_WARMUP_SECONDS.labels(model_path, loaded.backend).set(warmup_seconds)
+        logger.info(f"Warmed up {model_path} in {warmup_seconds:.2f}s")
+        return loaded
+
+    def clear(self):
+        """Drop every cached model."""
+        with self._lock:
+            self._models.clear()
+
+    def _load(self, model_path: str, yaml_path: str, backend: str) -> LoadedModel:
+        start = time.perf_counter()
+        with open(yaml_path, 'r') as f:
+            class_names = yaml.safe_load(f)['names']
+
+        if backend == ULTRALYTICS_BACKEND:
+            # Imported on first load: ultralytics pulls in torch, which dominates import time
+            from ultralytics import YOLO
+            model = YOLO(model_path)
+        else:
+            from cnn_integration import CNNConstellationDetector
+            model = CNNConstellationDetector(
+                model_path,
+                model_type=backend,
+                class_names=class_names,
+                num_threads=Config.CNN_NUM_THREADS
+            )
+            if not model.is_loaded:
+                raise RuntimeError(f"Could not load {backend} model from {model_path}")
+
+        load_seconds = time.perf_counter() - start
+        MODEL_LOAD_SECONDS.labels(model_path, backend).set(load_seconds)
+        logger.info(f"Loaded {model_path} ({backend}, {len(class_names)} classes) in {load_seconds:.2f}s")
+        return LoadedModel(
+            model=model,
+            class_names=class_names,
+            model_path=model_path,
+            yaml_path=yaml_path,
+            load_seconds=load_seconds,
+            backend=backend,
+        )
+
+
+registry = ModelRegistry()
+
+
+def get_model(model_path: str, yaml_path: str, model_type: Optional[str] = None) -> LoadedModel:
+    """Shortcut for registry.get()."""
+    return registry.get(model_path, yaml_path, model_type)
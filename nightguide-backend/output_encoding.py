@@ -0,0 +1,136 @@
+"""
+Output format negotiation and encoding for rendered results.
+
+The rendered overlay can go back as JPEG (default), WebP or PNG, or not be
+rendered at all (JSON geometry). Clients pick through query parameters
+(`format`, `quality`, `max_side`) or the Accept header; the server defaults
+come from Config. `max_side` is measured against the upload's original
+dimensions, not the (possibly reduced) image detection ran on, and the
+downscale happens before the overlay is drawn, so drawing and encoding both
+work on the smaller image. With max_side 0 the upload's resolution is kept.
+"""
+from dataclasses import dataclass, replace
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config import Config
+
+FORMATS = ("json", "jpeg", "webp", "png")
+MEDIA_TYPES = {
+    "json": "application/json",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "png": "image/png",
+}
+# Accept-header tie-break among equally ranked images: cheapest to encode first
+# (WebP is smaller on the wire but costs many times JPEG's CPU)
+_IMAGE_PREFERENCE = ("jpeg", "webp", "png")
+
+
+@dataclass(frozen=True)
+class OutputEncoding:
+    format: str = "jpeg"
+    quality: int = 85      # JPEG / WebP quality, 1-100
+    max_side: int = 0      # fit the returned image's longer side within this; 0 = the upload's resolution
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.format]
+
+    @property
+    def cache_tag(self) -> str:
+        """Distinguishes cached renderings of the same upload."""
+        if self.format == "json":
+            return "json"
+        return f"{self.format}:q{self.quality}:s{self.max_side}"
+
+    @classmethod
+    def default(cls) -> "OutputEncoding":
+        return cls(format=Config.OUTPUT_FORMAT, quality=Config.OUTPUT_QUALITY, max_side=Config.OUTPUT_MAX_SIDE)
+
+
+def _accept_q(accept: str) -> dict:
+    """Highest q per media type (or wildcard) listed in an Accept header."""
+    weights = {}
+    for item in accept.split(","):
+        media_type, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    pass
+        media_type = media_type.strip().lower()
+        if media_type:
+            weights[media_type] = max(weights.get(media_type, 0.0), q)
+    return weights
+
+
+def negotiate_encoding(accept: str = "",
+                       format: Optional[str] = None,
+                       quality: Optional[int] = None,
+                       max_side: Optional[int] = None,
+                       default: Optional[OutputEncoding] = None) -> OutputEncoding:
+    """
+    The encoding for a request. An explicit `format` (json/jpeg/jpg/webp/png)
+    wins; otherwise the Accept header decides: JSON when application/json
+    outranks every image type, else the highest-ranked of image/webp,
+    image/jpeg and image/png, falling back to the default format for
+    image/*, */* or no Accept header. Raises ValueError for an unknown format.
+    """
+    encoding = default or OutputEncoding.default()
+    if format:
+        name = format.lower()
+        name = "jpeg" if name == "jpg" else name
+        if name not in FORMATS:
+            raise ValueError(f"Unsupported format '{format}'; use one of {', '.join(FORMATS)}.")
+        encoding = replace(encoding, format=name)
+    elif accept:
+        weights = _accept_q(accept)
+        image_weights = {name: weights.get(MEDIA_TYPES[name], 0.0) for name in _IMAGE_PREFERENCE}
+        best_image = max(_IMAGE_PREFERENCE, key=lambda name: image_weights[name])
+        # */* alone doesn't outrank JSON (e.g. "application/json, text/plain, */*")
+        image_q = max(image_weights[best_image], weights.get("image/*", 0.0))
+        if weights.get("application/json", 0.0) > image_q:
+            encoding = replace(encoding, format="json")
+        elif image_weights[best_image] > 0 and image_weights[best_image] >= image_q:
+            encoding = replace(encoding, format=best_image)
+        elif image_q > 0 and encoding.format == "json":
+            # image/* asked for an image; the JSON default can't serve it
+            encoding = replace(encoding, format="jpeg")
+    if quality is not None:
+        encoding = replace(encoding, quality=min(max(int(quality), 1), 100))
+    if max_side is not None:
+        encoding = replace(encoding, max_side=max(int(max_side), 0))
+    return encoding
+
+
+def downscale_factor(width: int, height: int, max_side: int) -> float:
+    """Factor that fits the longer side within `max_side` (1.0 when it already fits or max_side is 0)."""
+    if max_side <= 0 or max(width, height) <= max_side:
+        return 1.0
+    return max_side / max(width, height)
+
+
+def fitted_size(width: int, height: int, max_side: int) -> Tuple[int, int]:
+    """(width, height) downscaled so the longer side fits `max_side` (unchanged when max_side is 0)."""
+    factor = downscale_factor(width, height, max_side)
+    if factor == 1.0:
+        return width, height
+    return max(1, round(width * factor)), max(1, round(height * factor))
+
+
+def encode_image(img: np.ndarray, encoding: OutputEncoding) -> Optional[bytes]:
+    """Encodes a BGR image as `encoding.format` (an image format); None if OpenCV fails."""
+    if encoding.format == "webp":
+        ok, encoded = cv2.imencode(".webp", img, [cv2.IMWRITE_WEBP_QUALITY, encoding.quality])
+    elif encoding.format == "png":
+        # Fastest zlib level: PNG is for lossless output, not for size
+        ok, encoded = cv2.imencode(".png", img, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    else:
+        ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, encoding.quality])
+    return encoded.tobytes() if ok else None
@@ -0,0 +1,171 @@
+"""
+Partial star matching for detections whose star count doesn't match the catalog.
+
+find_stars_within_box often returns a few stars too many (noise, a bright
+neighbour) or too few (a faint star under the threshold), and the exact
+Procrustes mapper then has nothing to work with. Here two catalog stars and
+two detected stars are enough to fix a similarity transform, so hypotheses
+are built from pairs of pairs, evaluated in vectorized batches (every
+catalog star projected, nearest detected star looked up in a KD-tree), and
+the best one is refined with a one-to-one assignment.
+
+Work is capped by a hypothesis count and a wall-clock budget, so the worst
+case is bounded no matter how many candidate stars a box produces. Batches
+are sized from the measured cost per hypothesis so the last one ends close
+to the deadline instead of running a full batch past it.
+"""
+import logging
+import math
+import time
+from dataclasses import dataclass
+from itertools import combinations, permutations
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from constellation_catalog import CatalogEntry
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 512       # largest batch, once the budget leaves room for it
+MIN_BATCH_SIZE = 32    # first batch (measures the cost per hypothesis), and the smallest worth running
+
+
+@dataclass
+class PartialMatch:
+    """
+    `stars` holds one pixel position per catalog star, in catalog order: the
+    matched detected star where `matched[i]` is True, the position predicted
+    by the fitted transform otherwise.
+    """
+    stars: List[Tuple[int, int]]
+    matched: np.ndarray
+    inliers: int
+    error: float
+    hypotheses: int
+
+
+def min_partial_inliers(star_count: int, min_fraction: float) -> int:
+    """Catalog stars that must be matched; two always fit, so at least three."""
+    return max(3, math.ceil(min_fraction * star_count))
+
+
+def _fit(src: np.ndarray, dst: np.ndarray) -> Tuple[complex, complex]:
+    """Least-squares similarity dst ≈ a * src + b on complex points (no reflection)."""
+    src_mean, dst_mean = src.mean(), dst.mean()
+    src_centered = src - src_mean
+    a = np.vdot(src_centered, dst - dst_mean) / max(np.vdot(src_centered, src_centered).real, 1e-12)
+    return a, dst_mean - a * src_mean
+
+
+def match_partial_stars(canonical_model: CatalogEntry,
+                        detected_points: Sequence[Tuple[int, int]],
+                        box_size: Optional[float] = None,
+                        tolerance: float = 0.08,
+                        min_fraction: float = 0.6,
+                        max_hypotheses: int = 4096,
+                        time_budget: float = 0.025) -> Optional[PartialMatch]:
+    """
+    Aligns the catalog pattern with a superset or subset of its stars.
+
+    `tolerance` is the inlier radius relative to the pattern's RMS radius in
+    the image; `box_size` (the detection box's longer side), when given,
+    rejects transforms that would make the pattern implausibly small or
+    large for the box. Hypotheses are visited in a fixed pseudo-random order,
+    at most `max_hypotheses` of them and for at most `time_budget` seconds.
+    Returns None unless at least min_partial_inliers catalog stars match.
+    """
+    # Deferred so importing the pipeline (and the server) doesn't load scipy
+    from scipy.optimize import linear_sum_assignment
+    from scipy.spatial import cKDTree
+
+    started = time.perf_counter()
+    deadline = started + time_budget
+
+    star_count = canonical_model.star_count
+    required = min_partial_inliers(star_count, min_fraction)
+    if star_count < 3 or len(detected_points) < required:
+        return None
+
+    detected = np.asarray(detected_points, dtype=np.float64).reshape(-1, 2)
+    query = detected[:, 0] + 1j * detected[:, 1]
+    # Unit RMS radius, so |a| of a transform is the pattern's radius in pixels
+    catalog = canonical_model.normalized[:, 0] + 1j * canonical_model.normalized[:, 1]
+    tree = cKDTree(detected)
+
+    catalog_pairs = np.array(list(combinations(range(star_count), 2)))
+    detected_pairs = np.array(list(permutations(range(len(detected)), 2)))
+    total = len(catalog_pairs) * len(detected_pairs)
+    # Seeded so the same upload always gives the same answer (results are cached)
+    order = (np.random.default_rng(0).permutation(total)[:max_hypotheses]
+             if total > max_hypotheses else np.arange(total))
+
+    best_key, best_transform, evaluated = None, None, 0
+    batch_size, loop_started = MIN_BATCH_SIZE, time.perf_counter()
+    while evaluated < len(order):
+        hypotheses = order[evaluated:evaluated + batch_size]
+        ci, cj = catalog_pairs[hypotheses // len(detected_pairs)].T
+        dk, dl = detected_pairs[hypotheses % len(detected_pairs)].T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Coincident stars give a degenerate (infinite or zero) scale and score no inliers
+            a = (query[dl] - query[dk]) / (catalog[cj] - catalog[ci])
+            a[~np.isfinite(a)] = 0
+            b = query[dk] - a * catalog[ci]
+            size = np.abs(a)
+
+            projected = a[:, None] * catalog[None, :] + b[:, None]
+            distances, _ = tree.query(np.column_stack([projected.real.ravel(), projected.imag.ravel()]))
+            relative = np.nan_to_num(distances.reshape(projected.shape) / size[:, None], nan=np.inf)
+        inliers = (relative <= tolerance).sum(axis=1)
+        # Truncated cost breaks ties between hypotheses with equal inlier counts
+        cost = np.minimum(relative, tolerance).sum(axis=1)
+        if box_size:
+            plausible = (size >= 0.1 * box_size) & (size <= box_size)
+            inliers = np.where(plausible, inliers, -1)
+
+        candidate = np.lexsort((cost, -inliers))[0]
+        key = (int(inliers[candidate]), -float(cost[candidate]))
+        if best_key is None or key > best_key:
+            best_key, best_transform = key, (a[candidate], b[candidate])
+        evaluated += len(hypotheses)
+        if best_key[0] == star_count:
+            break
+        # Spend at most half the remaining time on the next batch, so an
+        # underestimated cost can't carry it far past the deadline
+        now = time.perf_counter()
+        per_hypothesis = max(now - loop_started, 1e-9) / evaluated
+        batch_size = min(BATCH_SIZE, int((deadline - now) / 2 / per_hypothesis))
+        if batch_size < MIN_BATCH_SIZE:
+            break
+
+    if best_key is None or best_key[0] < required:
+        logger.debug("Partial match for '%s' failed: best %s of %d stars after %d hypotheses",
+                     canonical_model.label, best_key and best_key[0], star_count, evaluated)
+        return None
+
+    # Refine: one-to-one assignment, refit on the inliers, assign again
+    a, b = best_transform
+    for refit in (True, False):
+        projected = a * catalog + b
+        distances = np.abs(projected[:, None] - query[None, :])
+        rows, cols = linear_sum_assignment(distances)
+        close = distances[rows, cols] <= tolerance * abs(a)
+        if not refit or close.sum() < 2:
+            break
+        a, b = _fit(catalog[rows[close]], query[cols[close]])
+
+    inliers = int(close.sum())
+    if inliers < required:
+        return None
+    matched = np.zeros(star_count, dtype=bool)
+    matched[rows[close]] = True
+    stars = [(int(round(p.real)), int(round(p.imag))) for p in projected]
+    for row, col in zip(rows[close], cols[close]):
+        stars[row] = tuple(int(v) for v in detected[col])
+    return PartialMatch(
+        stars=stars,
+        matched=matched,
+        inliers=inliers,
+        error=float(distances[rows, cols][close].mean() / abs(a)),
+        hypotheses=evaluated,
+    )
@@ -0,0 +1,284 @@
+"""
+Geometric-hashing index of the constellation catalog's star patterns.
+
+Every non-degenerate triangle of catalog stars is hashed by its shape (the two
+shorter sides divided by the longest, quantized), which doesn't change with
+position, rotation or scale. A query hashes the triangles of the detected
+stars and looks them all up at once, so its cost grows with the number of
+detected stars rather than the number of catalog patterns.
+
+Each hit pairs a catalog triangle with a detected one and so implies a
+similarity transform (scale, rotation, where the constellation's centroid
+lands). The triangles of a real constellation all imply the same transform
+while chance hits scatter, so hits vote for a (constellation, quantized
+transform) cell. The strongest cells are verified by projecting the whole
+constellation and counting how many of its stars land on a detected star,
+and a verified match is only accepted when chance explains it for far fewer
+than one of all the hypotheses tried (an a-contrario number of false alarms).
+"""
+import logging
+import threading
+from dataclasses import dataclass
+from itertools import combinations
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.stats import binom
+
+from constellation_catalog import ConstellationCatalog, get_catalog
+from telemetry import stage
+
+logger = logging.getLogger(__name__)
+
+TRIANGLE_BIN = 0.02       # quantization step of the side ratios
+MIN_TRIANGLE_AREA = 0.02  # area / longest side², below which a triangle is too thin to hash
+SCALE_BIN = 0.15          # transform cells: log-scale step,
+ANGLE_BIN = 0.2           # rotation step (radians),
+POSITION_BIN = 0.3        # and centroid step in units of the constellation's size
+POSITION_NOISE = 1.0      # pixels: star centroid accuracy, the tightest fit counted as evidence
+SEED_STARS = 3            # stars every hypothesis fits by construction (its seed triangle)
+
+_KEY_STRIDE = 1 << 10     # packs a (ratio, ratio) bin pair into one int64
+_NEIGHBOURS = np.array([dk0 * _KEY_STRIDE + dk1 for dk0 in (-1, 0, 1) for dk1 in (-1, 0, 1)])
+
+
+@dataclass
+class PatternMatch:
+    """
+    A verified match. `stars` are the constellation's star positions in the
+    query's coordinates, in catalog order: the matched detected star where
+    there is one (`matched[i]` is its index in the query), the projected
+    catalog position otherwise (`matched[i]` is -1).
+    """
+    label: str
+    name: str
+    score: float
+    inliers: int
+    votes: int
+    stars: np.ndarray
+    matched: np.ndarray
+    connections: np.ndarray
+
+
+def triangle_keys(points: np.ndarray, triangles: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Shape keys for `triangles` (rows of three indices into `points`).
+    Returns (packed int64 keys, triangles with vertices reordered by ascending
+    opposite side, mask of non-degenerate triangles).
+    """
+    a, b, c = (points[triangles[:, i]] for i in range(3))
+    # Side opposite each vertex
+    sides = np.stack([np.linalg.norm(b - c, axis=1), np.linalg.norm(a - c, axis=1),
+                      np.linalg.norm(a - b, axis=1)], axis=1)
+    order = np.argsort(sides, axis=1, kind="stable")
+    sorted_sides = np.take_along_axis(sides, order, axis=1)
+    longest = np.maximum(sorted_sides[:, 2], 1e-9)
+    cross = (b - a)[:, 0] * (c - a)[:, 1] - (b - a)[:, 1] * (c - a)[:, 0]
+    valid = np.abs(cross) / 2 / longest ** 2 >= MIN_TRIANGLE_AREA
+    bins = np.floor(sorted_sides[:, :2] / longest[:, None] / TRIANGLE_BIN).astype(np.int64)
+    return bins[:, 0] * _KEY_STRIDE + bins[:, 1], np.take_along_axis(triangles, order, axis=1), valid
+
+
+def false_alarms(residuals: np.ndarray, star_count: int, other_stars: int,
+                 field_area: float, hypotheses: int) -> float:
+    """
+    A-contrario number of false alarms for a verified match: roughly how many
+    of `hypotheses` tested would fit this well if the detected stars were
+    random. `residuals` are the inliers' distances (pixels) to their
+    projected catalog star. The best-fitting SEED_STARS are set aside: the
+    seed triangle and the refit make those fit by construction. For each
+    count j of the remaining inliers, the binomial tail gives the chance that
+    j of the constellation's other stars each find one of `other_stars`
+    random stars over `field_area` within the j-th smallest residual; the
+    best j is used, with a factor for having tried every j.
+    """
+    trials = star_count - SEED_STARS
+    extra = np.sort(residuals)[SEED_STARS:]
+    if trials <= 0 or not len(extra):
+        return np.inf
+    radius = np.maximum(extra, POSITION_NOISE)
+    hit_rate = np.minimum(1.0, other_stars * np.pi * radius ** 2 / field_area)
+    tails = binom.sf(np.arange(len(extra)), trials, hit_rate)
+    return float(hypotheses * trials * tails.min())
+
+
+def fit_similarity(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """
+    Least-squares similarity (rotation + uniform scale, no reflection) mapping
+    complex points `src` onto `dst` along the last axis. Returns [a, b] with
+    dst ≈ a * src + b (|a| is the scale, arg(a) the rotation); works on
+    stacks of point sets.
+    """
+    src_mean, dst_mean = src.mean(axis=-1, keepdims=True), dst.mean(axis=-1, keepdims=True)
+    src_centered, dst_centered = src - src_mean, dst - dst_mean
+    a = (dst_centered * np.conj(src_centered)).sum(axis=-1) / np.maximum(
+        (np.abs(src_centered) ** 2).sum(axis=-1), 1e-12)
+    b = dst_mean[..., 0] - a * src_mean[..., 0]
+    return np.stack([a, b], axis=-1)
+
+
+class PatternIndex:
+    """Sorted hash table from triangle shape to (constellation, ordered catalog triangle)."""
+
+    def __init__(self, catalog: ConstellationCatalog):
+        self.catalog = catalog
+        self.entries = catalog.entries()
+        # Normalized catalog stars as complex numbers (x + iy), constellation i from _offsets[i]
+        self._stars = catalog.normalized[:, 0] + 1j * catalog.normalized[:, 1]
+        self._offsets = catalog.point_offsets[:-1].astype(np.int64)
+
+        keys, rows = [], []
+        for index, entry in enumerate(self.entries):
+            if entry.star_count < 3:
+                continue  # a single segment has no shape to hash
+            triangles = np.array(list(combinations(range(entry.star_count), 3)))
+            entry_keys, ordered, valid = triangle_keys(entry.normalized, triangles)
+            keys.append(entry_keys[valid])
+            rows.append(np.column_stack([np.full(valid.sum(), index), ordered[valid]]))
+        keys, rows = np.concatenate(keys), np.concatenate(rows).astype(np.int64)
+        order = np.argsort(keys, kind="stable")
+        self._keys, self._rows = keys[order], rows[order]
+        logger.info(f"Pattern index: {len(self._keys)} triangles in {len(np.unique(self._keys))} buckets "
+                    f"for {len(self.entries)} constellations")
+
+    def _lookup(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Every (table row, ordered detected triangle) hit for the triangles of
+        `points`, probing the neighbouring bins too so shapes near a bin edge
+        still hit.
+        """
+        triangles = np.array(list(combinations(range(len(points)), 3)))
+        keys, ordered, valid = triangle_keys(points, triangles)
+        keys, ordered = keys[valid], ordered[valid]
+        probes = (keys[:, None] + _NEIGHBOURS).ravel()
+        starts = np.searchsorted(self._keys, probes, side="left")
+        counts = np.searchsorted(self._keys, probes, side="right") - starts
+        # Expand each probe's run of equal keys into table row indices
+        run_starts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        table_index = run_starts + np.arange(counts.sum())
+        query_index = np.repeat(np.arange(len(probes)) // len(_NEIGHBOURS), counts)
+        return self._rows[table_index], ordered[query_index]
+
+    def _verify(self, index: int, transform: np.ndarray, query: np.ndarray,
+                tolerance: float) -> Tuple[int, float, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Projects constellation `index` with `transform` onto the complex query
+        points, refits the transform on the inliers once, and returns
+        (inliers, mean error relative to size, positions, matched, the
+        inliers' residuals in query units).
+        """
+        entry = self.entries[index]
+        stars = self._stars[self._offsets[index]:self._offsets[index] + entry.star_count]
+        for refine in (True, False):
+            projected = transform[0] * stars + transform[1]
+            distances = np.abs(projected[:, None] - query[None, :])
+            rows, cols = linear_sum_assignment(distances)
+            # Normalized stars have unit RMS radius, so |a| is the pattern's size in the query
+            close = distances[rows, cols] <= tolerance * abs(transform[0])
+            if not refine or close.sum() < 3:
+                break
+            transform = fit_similarity(stars[rows[close]], query[cols[close]])
+
+        residuals = distances[rows, cols][close]
+        inliers = len(residuals)
+        error = float(residuals.mean() / abs(transform[0])) if inliers else np.inf
+        matched = np.full(entry.star_count, -1)
+        matched[rows[close]] = cols[close]
+        positions = np.column_stack([projected.real, projected.imag])
+        positions[rows[close]] = np.column_stack([query[cols[close]].real, query[cols[close]].imag])
+        return inliers, error, positions, matched, residuals
+
+    def match(self, points: np.ndarray,
+              max_stars: int = 15,
+              max_candidates: int = 16,
+              tolerance: float = 0.1,
+              min_inliers: int = 5,
+              min_score: float = 0.6,
+              max_false_alarm: float = 0.1) -> Optional[PatternMatch]:
+        """
+        Finds the constellation formed by the detected star `points` ((n, 2)
+        pixel coordinates, brightest first). Only the first `max_stars` are
+        hashed; all of them are used for verification. The `max_candidates`
+        most-voted (constellation, transform) cells are verified, and a match
+        needs at least `min_inliers` and `min_score` of its stars within
+        `tolerance` (relative to its size) of a detected star.
+
+        Three inliers come free with the triangle a hypothesis was seeded
+        from, so the default `min_inliers` asks for two more, and a candidate
+        is rejected unless its false_alarms over every hypothesis the lookup
+        produced is at most `max_false_alarm`: random star fields then
+        match about that rarely, however many patterns they hit.
+        Returns the best verified match, or None.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) < 3:
+            return None
+        query = points[:, 0] + 1j * points[:, 1]
+        field_area = max(float(np.prod(np.ptp(points, axis=0))), 1.0)
+
+        with stage("pattern_match"):
+            catalog_rows, detected = self._lookup(points[:max_stars])
+            if not len(catalog_rows):
+                return None
+            constellation = catalog_rows[:, 0]
+            catalog_triangles = self._stars[self._offsets[constellation][:, None] + catalog_rows[:, 1:]]
+            transforms = fit_similarity(catalog_triangles, query[detected])
+            a, b = transforms[:, 0], transforms[:, 1]
+            size = np.maximum(np.abs(a), 1e-9)
+            cells = np.column_stack([
+                constellation,
+                np.floor(np.log(size) / SCALE_BIN),
+                np.floor(np.angle(a) / ANGLE_BIN),
+                np.floor(b.real / (size * POSITION_BIN)),
+                np.floor(b.imag / (size * POSITION_BIN)),
+            ]).astype(np.int64)
+            _, cell_of, votes = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+            cell_of = cell_of.ravel()
+
+            best = None
+            for cell in np.argsort(-votes, kind="stable")[:max_candidates]:
+                members = cell_of == cell
+                index = int(constellation[members][0])
+                # The cell's mean transform is steadier than any single triangle's
+                transform = transforms[members].mean(axis=0)
+                inliers, error, positions, matched, residuals = self._verify(index, transform, query, tolerance)
+                star_count = self.entries[index].star_count
+                score = inliers / star_count
+                if inliers < min_inliers or score < min_score:
+                    continue
+                if false_alarms(residuals, star_count, len(points) - SEED_STARS, field_area,
+                                len(catalog_rows)) > max_false_alarm:
+                    continue
+                # More matched stars is stronger evidence than a higher fraction of a small pattern
+                if best is None or (inliers, score, -error) > (best[1], best[0], -best[2]):
+                    best = (score, inliers, error, index, int(votes[cell]), positions, matched)
+
+        if best is None:
+            return None
+        score, inliers, _, index, cell_votes, positions, matched = best
+        entry = self.entries[index]
+        return PatternMatch(
+            label=entry.label,
+            name=entry.name,
+            score=score,
+            inliers=inliers,
+            votes=cell_votes,
+            stars=positions,
+            matched=matched,
+            connections=entry.connections,
+        )
+
+
+_index: Optional[PatternIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_pattern_index() -> PatternIndex:
+    """The process-wide index over get_catalog(), built on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = PatternIndex(get_catalog())
+    return _index
@@ -2,526 +2,116 @@
 import cv2
 import numpy as np
 import os
-import os
-import yaml
+import logging
+import contextvars
+import threading
 from collections import defaultdict
-from ultralytics import YOLO
-from scipy.spatial.distance import cdist
-from scipy.optimize import linear_sum_assignment
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional, Sequence, Tuple
+from model_registry import LoadedModel, get_model
+from cnn_integration import ULTRALYTICS_BACKEND
+from constellation_catalog import CatalogEntry, get_catalog
+from image_decode import DecodedImage, decode_for_pipeline
+from output_encoding import OutputEncoding, encode_image, fitted_size
+from partial_match import match_partial_stars, min_partial_inliers
+from config import Config
+from telemetry import stage, DETECTIONS, CONSTELLATIONS_MATCHED, CONSTELLATIONS_SKIPPED
 
-CONSTELLATION_DATA = {
-# =====================================================
-# ZODIAC CONSTELLATIONS
-# =====================================================
-'Aqr': {
-'name': 'Aquarius',
-'star_points': [
-(500, 350), (400, 200), (350, 150), (550, 180), (250, 400),
-(200, 600), (450, 800), (600, 900), (750, 850), (900, 700)
-],
-'connections': [
-(1, 2), (1, 3), (1, 0), (0, 4), (4, 5), (5, 6), (6, 7), (7, 8), (8, 9)
-]
-},
-'Ari': {
-'name': 'Aries',
-'star_points': [(500, 500), (400, 450), (300, 480)],
-'connections': [(0, 1), (1, 2)]
-},
-'Cnc': {
-'name': 'Cancer',
-'star_points': [(500, 400), (600, 500), (500, 600), (400, 500)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 0)]
-},
-'Cap': {
-'name': 'Capricornus',
-'star_points': [(100, 500), (300, 600), (500, 550), (700, 450), (600, 300), (400, 350), (250, 400)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 0)]
-},
-'Gem': {
-'name': 'Gemini',
-'star_points': [(200, 200), (250, 500), (300, 800), (600, 200), (550, 500), (500, 800)],
-'connections': [(0, 1), (1, 2), (3, 4), (4, 5), (0, 3), (1, 4)]
-},
-'Leo': {
-'name': 'Leo',
-'star_points': [(200, 200), (300, 300), (400, 400), (350, 500), (250, 600), (150, 500), (700, 400), (900, 500)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 0), (2, 6), (6, 7)]
-},
-'Lib': {
-'name': 'Libra',
-'star_points': [(300, 300), (700, 300), (200, 600), (800, 600)],
-'connections': [(0, 1), (0, 2), (1, 3), (2, 3)]
-},
-'Psc': {
-'name': 'Pisces',
-'star_points': [(200, 800), (300, 700), (400, 600), (500, 500), (600, 400), (700, 300), (800, 200), (750, 500), (700, 600), (650, 700)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (3, 7), (7, 8), (8, 9), (9, 2)]
-},
-'Sag': {
-'name': 'Sagittarius',
-'star_points': [(600, 400), (700, 600), (600, 800), (400, 800), (300, 600), (400, 400), (200, 200)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 0), (5, 4), (5, 6)]
-},
-'Sco': {
-'name': 'Scorpius',
-'star_points': [(200, 200), (400, 200), (600, 200), (500, 400), (500, 600), (500, 800), (700, 900), (300, 900)],
-'connections': [(0, 1), (1, 2), (1, 3), (3, 4), (4, 5), (5, 6), (5, 7)]
-},
-'Tau': {
-'name': 'Taurus',
-'star_points': [(800, 200), (600, 400), (500, 500), (400, 400), (200, 200)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (1, 3)]
-},
-'Vir': {
-'name': 'Virgo',
-'star_points': [(200, 800), (300, 600), (400, 400), (600, 400), (800, 600), (700, 800), (500, 500)],
-'connections': [(0, 1), (1, 2), (2, 6), (3, 6), (3, 4), (4, 5)]
-},
-# =====================================================
-# NORTHERN HEMISPHERE CONSTELLATIONS
-# =====================================================
-'And': {
-'name': 'Andromeda',
-'star_points': [(419, 102), (408, 206), (403, 394), (510, 422), (692, 532), (308, 412), (118, 513)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (2, 5), (5, 6)]
-},
-'Aql': {
-'name': 'Aquila',
-'star_points': [(500, 500), (500, 400), (500, 600), (200, 300), (850, 350), (150, 800)],
-'connections': [(1, 0), (0, 2), (3, 0), (4, 0), (2, 5)]
-},
-'Aur': {
-'name': 'Auriga',
-'star_points': [(500, 100), (300, 300), (400, 500), (600, 500), (700, 300)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 0)]
-},
-'Boo': {
-'name': 'Bootes',
-'star_points': [(500, 100), (400, 300), (300, 500), (500, 700), (700, 500), (600, 300)],
-'connections': [(0, 1), (0, 5), (1, 2), (2, 3), (3, 4), (4, 5)]
-},
-'Cam': {
-'name': 'Camelopardalis',
-'star_points': [(100, 800), (300, 700), (500, 600), (400, 400), (200, 300), (450, 200), (700, 100)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (3, 5), (5, 6)]
-},
-'Cas': {
-'name': 'Cassiopeia',
-'star_points': [(100, 500), (300, 350), (500, 500), (700, 350), (900, 500)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4)]
-},
-'Cep': {
-'name': 'Cepheus',
-'star_points': [(500, 700), (300, 500), (350, 300), (650, 300), (700, 500)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 0)]
-},
-'Com': {
-'name': 'Coma Berenices',
-'star_points': [(300, 600), (500, 500), (600, 300)],
-'connections': [(0, 1), (1, 2)]
-},
-'CrB': {
-'name': 'Corona Borealis',
-'star_points': [(200, 500), (400, 350), (600, 350), (800, 500), (700, 650), (500, 700), (300, 650)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 0)]
-},
-'CVn': {
-'name': 'Canes Venatici',
-'star_points': [(400, 600), (600, 400)],
-'connections': [(0, 1)]
-},
-'Cyg': {
-'name': 'Cygnus',
-'star_points': [(500, 350), (500, 500), (500, 900), (200, 500), (800, 500)],
-'connections': [(0, 1), (1, 2), (3, 1), (1, 4)]
-},
-'Del': {
-'name': 'Delphinus',
-'star_points': [(400, 400), (600, 400), (550, 300), (450, 300), (500, 500)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 0), (0, 4)]
-},
-'Dra': {
-'name': 'Draco',
-'star_points': [(800, 800), (700, 600), (600, 400), (500, 200), (300, 250), (200, 450), (350, 600), (550, 700), (400, 100), (200, 150)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (3, 8), (4, 9), (8, 9)]
-},
-'Equ': {
-'name': 'Equuleus',
-'star_points': [(400, 300), (600, 350), (550, 500), (350, 450)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 0)]
-},
-'Her': {
-'name': 'Hercules',
-'star_points': [(300, 200), (700, 200), (200, 400), (800, 400), (200, 600), (800, 600), (300, 800), (700, 800)],
-'connections': [(0, 2), (1, 3), (2, 4), (3, 5), (4, 6), (5, 7), (2, 3), (4, 5), (2, 6), (3, 7)]
-},
-'Lac': {
-'name': 'Lacerta',
-'star_points': [(200, 200), (400, 300), (500, 500), (400, 700), (200, 800)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4)]
-},
-'LMi': {
-'name': 'Leo Minor',
-'star_points': [(300, 300), (500, 500), (700, 400)],
-'connections': [(0, 1), (1, 2)]
-},
-'Lyn': {
-'name': 'Lynx',
-'star_points': [(200, 800), (400, 600), (600, 400), (800, 200)],
-'connections': [(0, 1), (1, 2), (2, 3)]
-},
-'Lyr': {
-'name': 'Lyra',
-'star_points': [(500, 100), (300, 700), (700, 700), (350, 600), (650, 600)],
-'connections': [(1, 3), (1, 2), (2, 4), (0, 3), (0, 4)]
-},
-'Oph': {
-'name': 'Ophiuchus',
-'star_points': [(500, 100), (300, 300), (700, 300), (200, 500), (800, 500), (300, 700), (700, 700), (500, 900)],
-'connections': [(0, 1), (0, 2), (1, 3), (2, 4), (3, 5), (4, 6), (5, 7), (6, 7)]
-},
-'Peg': {
-'name': 'Pegasus',
-'star_points': [(200, 200), (800, 200), (200, 800), (800, 800), (500, 500), (100, 500), (500, 100)],
-'connections': [(0, 1), (1, 3), (3, 2), (2, 0), (2, 4), (4, 5), (1, 6)]
-},
-'Per': {
-'name': 'Perseus',
-'star_points': [(500, 200), (600, 400), (700, 600), (500, 700), (300, 600), (400, 400), (200, 300)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 0), (5, 6)]
-},
-'Sge': {
-'name': 'Sagitta',
-'star_points': [(300, 500), (700, 500), (500, 300), (500, 700)],
-'connections': [(0, 2), (1, 2), (2, 3)]
-},
-'Ser': {
-'name': 'Serpens',
-'star_points': [(200, 800), (300, 600), (400, 400), (500, 600), (600, 800), (700, 600), (800, 400)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (2, 5), (5, 6)]
-},
-'Tri': {
-'name': 'Triangulum',
-'star_points': [(500, 200), (300, 700), (700, 700)],
-'connections': [(0, 1), (1, 2), (2, 0)]
-},
-'UMa': {
-'name': 'Ursa Major',
-'star_points': [(868, 153), (738, 252), (585, 230), (453, 314), (298, 289), (170, 381), (118, 217)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (4, 6)]
-},
-'UMi': {
-'name': 'Ursa Minor',
-'star_points': [(163, 755), (223, 584), (320, 473), (448, 383), (530, 240), (405, 218), (592, 404)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 3)]
-},
-'Vul': {
-'name': 'Vulpecula',
-'star_points': [(200, 800), (400, 600), (600, 400), (800, 200)],
-'connections': [(0, 1), (1, 2), (2, 3)]
-},
-# =====================================================
-# SOUTHERN HEMISPHERE CONSTELLATIONS
-# =====================================================
-'Ant': {
-'name': 'Antlia',
-'star_points': [(353, 335), (523, 239)],
-'connections': [(0, 1)]
-},
-'Aps': {
-'name': 'Apus',
-'star_points': [(244, 342), (426, 363), (530, 219), (344, 182)],
-'connections': [(0, 1), (1, 2), (2, 3), (1, 3)]
-},
-'Ara': {
-'name': 'Ara',
-'star_points': [(500, 200), (450, 300), (550, 300), (500, 400), (400, 500), (600, 500)],
-'connections': [(0, 1), (0, 2), (1, 2), (1, 3), (2, 3), (3, 4), (3, 5)]
-},
-'Cae': {
-'name': 'Caelum',
-'star_points': [(500, 500), (400, 400)],
-'connections': [(0, 1)]
-},
-'Car': {
-'name': 'Carina',
-'star_points': [(100, 500), (300, 400), (400, 600), (600, 550), (700, 350), (500, 200), (250, 250)],
-'connections': [(0, 1), (1, 2), (1, 6), (2, 3), (3, 4), (4, 5), (5, 6), (6, 0)]
-},
-'Cen': {
-'name': 'Centaurus',
-'star_points': [(100, 600), (200, 400), (400, 300), (600, 400), (700, 600), (500, 500), (300, 500), (400, 700), (500, 800), (300, 850)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (3, 5), (1, 6), (6, 5), (5, 7), (7, 8), (8, 9)]
-},
-'Cet': {
-'name': 'Cetus',
-'star_points': [(800, 200), (650, 300), (500, 400), (300, 450), (200, 600), (400, 700), (550, 600)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 2)]
-},
-'Cha': {
-'name': 'Chamaeleon',
-'star_points': [(200, 200), (300, 400), (500, 500), (400, 300)],
-'connections': [(0, 1), (1, 2), (0, 3)]
-},
-'Cir': {
-'name': 'Circinus',
-'star_points': [(500, 300), (300, 500), (500, 700)],
-'connections': [(0, 1), (1, 2), (2, 0)]
-},
-'CMa': {
-'name': 'Canis Major',
-'star_points': [(500, 200), (300, 400), (400, 600), (550, 700), (700, 600), (600, 400)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 0), (1, 5)]
-},
-'CMi': {
-'name': 'Canis Minor',
-'star_points': [(400, 600), (600, 400)],
-'connections': [(0, 1)]
-},
-'Col': {
-'name': 'Columba',
-'star_points': [(400, 300), (600, 400), (500, 600), (300, 500)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 0)]
-},
-'CrA': {
-'name': 'Corona Australis',
-'star_points': [(200, 500), (400, 450), (600, 500), (500, 600), (300, 600)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 0)]
-},
-'Crt': {
-'name': 'Crater',
-'star_points': [(200, 400), (400, 450), (500, 350), (300, 300)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 0)]
-},
-'Cru': {
-'name': 'Crux',
-'star_points': [(500, 100), (500, 800), (200, 500), (800, 500)],
-'connections': [(0, 1), (2, 3)]
-},
-'Crv': {
-'name': 'Corvus',
-'star_points': [(200, 500), (400, 500), (400, 300), (200, 300), (500, 600)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 0), (1, 4)]
-},
-'Dor': {
-'name': 'Dorado',
-'star_points': [(200, 600), (400, 500), (600, 400)],
-'connections': [(0, 1), (1, 2)]
-},
-'Eri': {
-'name': 'Eridanus',
-'star_points': [(200, 100), (300, 200), (250, 300), (350, 400), (300, 500), (400, 600), (500, 700), (600, 800), (700, 900)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8)]
-},
-'For': {
-'name': 'Fornax',
-'star_points': [(400, 300), (600, 400), (500, 600)],
-'connections': [(0, 1), (0, 2)]
-},
-'Gru': {
-'name': 'Grus',
-'star_points': [(500, 200), (400, 400), (600, 400), (500, 600), (500, 800)],
-'connections': [(0, 1), (0, 2), (1, 3), (2, 3), (3, 4)]
-},
-'Hor': {
-'name': 'Horologium',
-'star_points': [(300, 200), (500, 300), (600, 500), (400, 700), (200, 600)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4)]
-},
-'Hya': {
-'name': 'Hydra',
-'star_points': [(100, 400), (200, 300), (300, 400), (400, 500), (500, 600), (600, 700), (700, 600), (800, 500), (900, 400)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8)]
-},
-'Hyi': {
-'name': 'Hydrus',
-'star_points': [(200, 800), (500, 600), (800, 200)],
-'connections': [(0, 1), (1, 2)]
-},
-'Ind': {
-'name': 'Indus',
-'star_points': [(300, 200), (700, 400), (500, 700)],
-'connections': [(0, 1), (0, 2)]
-},
-'Lep': {
-'name': 'Lepus',
-'star_points': [(400, 300), (600, 300), (600, 500), (400, 500)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 0)]
-},
-'Lup': {
-'name': 'Lupus',
-'star_points': [(200, 300), (400, 200), (600, 300), (500, 500), (300, 500), (400, 700)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 0), (3, 5)]
-},
-'Men': {
-'name': 'Mensa',
-'star_points': [(200, 700), (800, 700), (700, 300), (300, 300)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 0)]
-},
-'Mic': {
-'name': 'Microscopium',
-'star_points': [(300, 700), (700, 700), (600, 300), (400, 300)],
-'connections': [(0, 1), (1, 2), (2, 3)]
-},
-'Mon': {
-'name': 'Monoceros',
-'star_points': [(200, 700), (500, 500), (800, 300)],
-'connections': [(0, 1), (1, 2)]
-},
-'Mus': {
-'name': 'Musca',
-'star_points': [(300, 300), (700, 300), (500, 600), (200, 700), (800, 700)],
-'connections': [(0, 1), (0, 2), (1, 2), (2, 3), (2, 4)]
-},
-'Nor': {
-'name': 'Norma',
-'star_points': [(300, 700), (700, 600), (600, 200), (200, 300)],
-'connections': [(0, 1), (1, 2), (3, 0)]
-},
-'Oct': {
-'name': 'Octans',
-'star_points': [(500, 200), (200, 500), (800, 500)],
-'connections': [(0, 1), (0, 2)]
-},
-'Ori': {
-'name': 'Orion',
-'star_points': [(202, 185), (715, 843), (121, 217), (797, 811), (423, 495), (473, 513), (524, 529)],
-'connections': [(0, 2), (0, 4), (1, 3), (1, 6), (2, 4), (3, 6), (4, 5), (5, 6)]
-},
-'Pav': {
-'name': 'Pavo',
-'star_points': [(500, 200), (300, 400), (200, 600), (300, 800), (500, 700), (700, 500)],
-'connections': [(0, 1), (1, 2), (1, 5), (2, 3), (3, 4), (4, 5)]
-},
-'Phe': {
-'name': 'Phoenix',
-'star_points': [(500, 200), (300, 400), (200, 600), (400, 800), (600, 700), (700, 500)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 0)]
-},
-'Pic': {
-'name': 'Pictor',
-'star_points': [(200, 700), (500, 500), (800, 300)],
-'connections': [(0, 1), (1, 2)]
-},
-'PsA': {
-'name': 'Piscis Austrinus',
-'star_points': [(500, 200), (400, 400), (300, 600), (500, 700), (700, 600), (600, 400)],
-'connections': [(0, 1), (0, 5), (1, 2), (2, 3), (3, 4), (4, 5)]
-},
-'Pup': {
-'name': 'Puppis',
-'star_points': [(200, 300), (400, 200), (600, 300), (500, 500), (300, 500), (400, 700)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 0), (0, 5), (2, 5)]
-},
-'Pyx': {
-'name': 'Pyxis',
-'star_points': [(300, 700), (500, 500), (700, 300)],
-'connections': [(0, 1), (1, 2)]
-},
-'Ret': {
-'name': 'Reticulum',
-'star_points': [(300, 300), (700, 300), (700, 700), (300, 700)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 0)]
-},
-'Scl': {
-'name': 'Sculptor',
-'star_points': [(200, 800), (400, 600), (600, 400), (800, 200)],
-'connections': [(0, 1), (1, 2), (2, 3)]
-},
-'Sct': {
-'name': 'Scutum',
-'star_points': [(500, 200), (300, 400), (500, 600), (700, 400)],
-'connections': [(0, 1), (0, 3), (1, 2), (3, 2)]
-},
-'Sex': {
-'name': 'Sextans',
-'star_points': [(300, 700), (500, 500), (700, 300)],
-'connections': [(0, 1), (1, 2)]
-},
-'Tel': {
-'name': 'Telescopium',
-'star_points': [(300, 700), (700, 500), (500, 200)],
-'connections': [(0, 1), (1, 2)]
-},
-'TrA': {
-'name': 'Triangulum Australe',
-'star_points': [(500, 200), (200, 700), (800, 700)],
-'connections': [(0, 1), (1, 2), (2, 0)]
-},
-'Tuc': {
-'name': 'Tucana',
-'star_points': [(500, 200), (300, 400), (200, 600), (400, 800), (700, 700), (600, 500)],
-'connections': [(0, 1), (1, 2), (2, 3), (0, 5), (4, 5)]
-},
-'Vel': {
-'name': 'Vela',
-'star_points': [(200, 300), (400, 200), (600, 300), (500, 500), (300, 500), (400, 700)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 0), (0, 3)]
-},
-'Vol': {
-'name': 'Volans',
-'star_points': [(200, 300), (400, 200), (600, 300), (500, 500), (300, 500), (400, 700)],
-'connections': [(0, 1), (1, 2), (2, 3), (3, 4), (4, 0), (1, 4)]
-}
-}
+logger = logging.getLogger(__name__)
+
+def detections_from_result(result, class_names, with_confidence: bool = False) -> dict:
+    """
+    Converts one ultralytics result into {label: [normalized xywh boxes]}.
+    With `with_confidence`, each box gets its confidence appended as a 5th value.
+    """
+    detections_dict = defaultdict(list)
+
+    # Get the class indices of all detections
+    detected_class_indices = result.boxes.cls.tolist()
+    
+    # Get the normalized bounding box coordinates [x_center, y_center, width, height]
+    normalized_bboxes = result.boxes.xywhn.tolist()
+    confidences = result.boxes.conf.tolist() if with_confidence else None
+
+    for i, class_index in enumerate(detected_class_indices):
+        label_name = class_names[int(class_index)]
+        normalized_bbox = normalized_bboxes[i]
+        if with_confidence:
+            normalized_bbox = normalized_bbox + [confidences[i]]
+        detections_dict[label_name].append(normalized_bbox)
+
+    return dict(detections_dict)
 
 def get_yolo_detections(model_path: str, 
                         image_path: str, 
                         yaml_path: str,
-                        conf_threshold: float = 0.25) -> dict:
-    print(f"--- Running inference on: {os.path.basename(image_path)} ---")
+                        conf_threshold: float = 0.25,
+                        loaded_model: Optional[LoadedModel] = None,
+                        batcher=None,
+                        image: Optional[np.ndarray] = None,
+                        with_confidence: bool = False) -> dict:
+    """
+    Runs YOLO on an image file, or on an already decoded BGR `image` array
+    when one is given (in which case `image_path` is only used for logging).
+    With `with_confidence`, each box is [x_center, y_center, w, h, confidence].
+    """
+    logger.debug("Running inference on %s", os.path.basename(image_path) if image_path else "<in-memory image>")
+    source = image if image is not None else image_path
     
     # --- 1. Input Validation ---
-    for path in [model_path, image_path, yaml_path]:
+    required_paths = [] if image is not None else [image_path]
+    if not (loaded_model or batcher):
+        required_paths += [model_path, yaml_path]
+    for path in required_paths:
         if not os.path.exists(path):
-            print(f"ERROR: File not found at '{path}'")
+            logger.error("File not found at '%s'", path)
             return {}
 
-    detections_dict = defaultdict(list)
-
     try:
-        # --- 2. Load Class Names and Model ---
-        with open(yaml_path, 'r') as f:
-            class_names = yaml.safe_load(f)['names']
-        
-        model = YOLO(model_path)
+        if batcher is not None:
+            # --- 2/3. Hand the image to the micro-batching scheduler ---
+            # It runs one batched predict for all concurrent requests and
+            # returns this image's own slice of the detections. A TiledDetector
+            # has the same detect() and merges its tiles' boxes into one dict.
+            detections = batcher.detect(source)
+            if not with_confidence:
+                detections = {label: [box[:4] for box in boxes] for label, boxes in detections.items()}
+        else:
+            # --- 2. Get the (cached) Model and Class Names ---
+            if loaded_model is None:
+                loaded_model = get_model(model_path, yaml_path)
+            model = loaded_model.model
+            class_names = loaded_model.class_names
 
-        # --- 3. Run Prediction ---
-        # The verbose=False argument suppresses detailed console output
-        results = model.predict(source=image_path, conf=conf_threshold, verbose=False)
-        
-        # The 'results' object is a list, we process the first (and only) result
-        result = results[0]
-        
-        # --- 4. Extract and Format Detections ---
-        # Get the class indices of all detections
-        detected_class_indices = result.boxes.cls.tolist()
-        
-        # Get the normalized bounding box coordinates [x_center, y_center, width, height]
-        normalized_bboxes = result.boxes.xywhn.tolist()
+            # --- 3. Run Prediction ---
+            if loaded_model.backend != ULTRALYTICS_BACKEND:
+                # Exported ONNX / OpenVINO model; returns the same dict shape
+                detections = model.detect_yolo(source, with_confidence=with_confidence, conf_threshold=conf_threshold)
+            else:
+                # The verbose=False argument suppresses detailed console output
+                results = model.predict(source=source, conf=conf_threshold, verbose=False)
+                
+                # The 'results' object is a list, we process the first (and only) result
+                detections = detections_from_result(results[0], class_names, with_confidence)
 
-        if len(detected_class_indices) == 0:
-            print("No objects were detected in this image.")
+        # --- 4. Extract and Format Detections ---
+        if not detections:
+            logger.debug("No objects were detected in this image.")
             return {}
-
-        for i, class_index in enumerate(detected_class_indices):
-            label_name = class_names[int(class_index)]
-            normalized_bbox = normalized_bboxes[i]
-            detections_dict[label_name].append(normalized_bbox)
         
-        print("✅ Inference complete.")
-        return dict(detections_dict)
+        for label, boxes in detections.items():
+            DETECTIONS.labels(label).inc(len(boxes))
+        return detections
 
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+    except Exception:
+        logger.exception("Detection failed")
         return {}
 
 # =====================================================
 # UTILS
 # =====================================================
 def denormalize_box_from_center(normalized_box, img_w, img_h):
-    x_center_rel, y_center_rel, w_rel, h_rel = normalized_box
+    x_center_rel, y_center_rel, w_rel, h_rel = normalized_box[:4]
     w, h = int(w_rel * img_w), int(h_rel * img_h)
     x_center, y_center = int(x_center_rel * img_w), int(y_center_rel * img_h)
     x, y = x_center - (w // 2), y_center - (h // 2)
@@ -530,87 +120,377 @@ def denormalize_box_from_center(normalized_box, img_w, img_h):
 # =====================================================
 # STAR DETECTION 
 # =====================================================
-def find_stars_within_box(image, constellation_box, expected_star_count):
+STAR_THRESHOLD_LEVELS = (150, 130, 110, 90, 70, 50)
+MIN_STAR_AREA = 5
+# Above this share of lit ROI pixels, OpenCV's labeling beats the union-find sweep
+STAR_SWEEP_MAX_LIT_FRACTION = 1 / 32
+
+# Index of the first STAR_THRESHOLD_LEVELS level each gray value is brighter than
+_STAR_LEVEL_LUT = np.array([sum(value <= level for level in STAR_THRESHOLD_LEVELS) for value in range(256)],
+                           dtype=np.uint8)
+_NEIGHBOURS_8 = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+def _union_links(parent: np.ndarray, u: np.ndarray, v: np.ndarray):
+    """
+    Merges the components joined by links (u, v) in `parent`, which must map
+    every node straight to its root, and leaves it that way. Each round hooks
+    the larger root of every still-split link onto the smaller, then jumps
+    pointers until every node points at its root again.
+    """
+    while len(u):
+        root_u, root_v = parent[u], parent[v]
+        split = root_u != root_v
+        u, v, root_u, root_v = u[split], v[split], root_u[split], root_v[split]
+        if not len(u):
+            return
+        np.minimum.at(parent, np.maximum(root_u, root_v), np.minimum(root_u, root_v))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent[:] = grandparent
+
+def _labeled_level(gray_roi: np.ndarray, level: int):
+    """One level the classic way: threshold, then connectedComponentsWithStats."""
+    _, binary_roi = cv2.threshold(gray_roi, level, 255, cv2.THRESH_BINARY)
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(binary_roi, connectivity=8)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    stars = np.flatnonzero(areas >= MIN_STAR_AREA)
+    return areas[stars], lambda indices: centroids[stars[indices] + 1]
+
+def _star_levels(gray_roi: np.ndarray):
+    """
+    Yields (areas, centroids) for each STAR_THRESHOLD_LEVELS level, brightest
+    first: the areas of the 8-connected blobs brighter than the level with at
+    least MIN_STAR_AREA pixels, in connectedComponentsWithStats label order,
+    and a function returning the (x, y) centroids of the blobs at given
+    indices. One union-find sweep yields every level: each level only adds
+    the pixels that light up at it and links them to their lit neighbours,
+    so a caller that stops early never touches the dim pixels.
+
+    OpenCV's 8-way labeling numbers blobs in the 2x2-block raster order it
+    scans in, so blobs are ordered by their first pixel in that order (it
+    breaks area ties).
+
+    The sweep's per-level cost grows with the number of lit pixels while
+    labeling costs the same for any ROI, so once more than
+    STAR_SWEEP_MAX_LIT_FRACTION of the ROI is lit (a bright or light-polluted
+    sky) this and every dimmer level are labeled with OpenCV instead.
+    """
+    height, width = gray_roi.shape
+    max_nodes = gray_roi.size * STAR_SWEEP_MAX_LIT_FRACTION
+    # The level at which each pixel lights up (len(levels) for never)
+    band = cv2.LUT(gray_roi, _STAR_LEVEL_LUT).ravel()
+    # Flat pixel index -> node (-1 while unlit); flat indices keep the per-level scan cheap
+    node_of = np.full(height * width, -1, dtype=np.int32)
+    rows = cols = scan_order = np.empty(0, dtype=np.int64)
+    parent = np.empty(0, dtype=np.int64)
+    for index, level in enumerate(STAR_THRESHOLD_LEVELS):
+        new_pixels = np.flatnonzero(band == index)
+        if len(parent) + len(new_pixels) > max_nodes:
+            break
+        new_rows, new_cols = np.divmod(new_pixels, width)
+        new_nodes = np.arange(len(parent), len(parent) + len(new_pixels))
+        node_of[new_pixels] = new_nodes
+        rows, cols = np.concatenate([rows, new_rows]), np.concatenate([cols, new_cols])
+        parent = np.concatenate([parent, new_nodes])
+        # Label order: each blob's first pixel in block-raster order
+        scan_order = np.concatenate([scan_order, ((new_rows // 2) * ((width + 1) // 2) + new_cols // 2) * 4
+                                     + (new_rows % 2) * 2 + new_cols % 2])
+
+        # Every lit neighbour of a new pixel joins its blob
+        links_u, links_v = [], []
+        for dr, dc in _NEIGHBOURS_8:
+            r, c = new_rows + dr, new_cols + dc
+            inside = np.flatnonzero((r >= 0) & (r < height) & (c >= 0) & (c < width))
+            neighbour = node_of[new_pixels[inside] + (dr * width + dc)].astype(np.int64)
+            lit = neighbour >= 0
+            links_u.append(new_nodes[inside[lit]])
+            links_v.append(neighbour[lit])
+        _union_links(parent, np.concatenate(links_u), np.concatenate(links_v))
+
+        areas = np.bincount(parent, minlength=len(parent))
+        roots = np.flatnonzero(areas >= MIN_STAR_AREA)
+        if len(roots) > 1:
+            first = np.full(len(parent), np.iinfo(np.int64).max)
+            np.minimum.at(first, parent, scan_order)
+            roots = roots[np.argsort(first[roots])]
+
+        def centroids(indices, parent=parent, rows=rows, cols=cols, roots=roots, areas=areas):
+            selected = roots[indices]
+            x_sums = np.bincount(parent, weights=cols, minlength=len(parent))[selected]
+            y_sums = np.bincount(parent, weights=rows, minlength=len(parent))[selected]
+            return np.column_stack([x_sums, y_sums]) / areas[selected, None]
+
+        yield areas[roots], centroids
+    else:
+        return
+    for level in STAR_THRESHOLD_LEVELS[index:]:
+        yield _labeled_level(gray_roi, level)
+
+def find_star_sets(image, constellation_box, selections) -> List[list]:
+    """
+    find_stars_within_box for several (expected_star_count, min_star_count)
+    selections over the same box, from one pass over its threshold levels.
+    Returns one star list per selection.
+    """
     x, y, w, h = constellation_box
+    star_sets = [[] for _ in selections]
     roi = image[y:y+h, x:x+w]
-    if roi.size == 0: return []
-    gray_roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-    threshold_levels = [150, 130, 110, 90, 70, 50]
-    for thresh_val in threshold_levels:
-        _ , binary_roi = cv2.threshold(gray_roi, thresh_val, 255, cv2.THRESH_BINARY)
-        num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(binary_roi, connectivity=8)
-        current_pass_stars = []
-        if num_labels > 1:
-            for i in range(1, num_labels):
-                area = stats[i, cv2.CC_STAT_AREA]
-                if area >= 5:
-                    cx, cy = centroids[i]
-                    global_coord = (x + int(cx), y + int(cy))
-                    current_pass_stars.append({'coord': global_coord, 'area': area})
-        if len(current_pass_stars) >= expected_star_count:
-            current_pass_stars.sort(key=lambda s: s['area'], reverse=True)
-            top_stars = current_pass_stars[:expected_star_count]
-            return [star['coord'] for star in top_stars]
-    return []
+    if roi.size == 0: return star_sets
+    gray_roi = roi if roi.ndim == 2 else cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    pending = list(range(len(selections)))
+    for areas, centroids in _star_levels(gray_roi):
+        for i in list(pending):
+            expected_star_count, min_star_count = selections[i]
+            if len(areas) < (min_star_count or expected_star_count): continue
+            # A stable sort keeps ties in label order
+            top = np.argsort(-areas, kind='stable')[:expected_star_count]
+            star_sets[i] = [(x + int(cx), y + int(cy)) for cx, cy in centroids(top)]
+            pending.remove(i)
+        if not pending: break
+    return star_sets
+
+def find_stars_within_box(image, constellation_box, expected_star_count, min_star_count=None):
+    """
+    Finds the `expected_star_count` largest bright blobs inside the box,
+    lowering the threshold (brightest first) until enough blobs are found.
+    With `min_star_count`, the first level with at least that many blobs is
+    accepted and up to `expected_star_count` of them are returned.
+    Every level comes from one union-find sweep over the pixels brighter than
+    the lowest level (_star_levels), with the ranking done in NumPy.
+    `image` may be BGR or already grayscale.
+    """
+    return find_star_sets(image, constellation_box, [(expected_star_count, min_star_count)])[0]
 
 # =====================================================
 # THE DEFINITIVE, CORRECTED STAR MAPPER (Procrustes with Reflection Fix)
 # =====================================================
-def map_and_order_stars(canonical_model, detected_points):
+def map_and_order_stars(canonical_model: CatalogEntry, detected_points):
     """
     Definitive mapping using Procrustes analysis, with a critical fix
     to prevent reflection errors (mirror images).
     """
-    canonical_points = np.array(canonical_model['star_points'], dtype=float)
-    if len(detected_points) != len(canonical_points): return None
-    detected_points = np.array(detected_points, dtype=float)
+    return map_and_order_stars_batch([canonical_model], [detected_points])[0]
+
+def map_and_order_stars_batch(canonical_models: Sequence[CatalogEntry], detected_point_sets) -> List[Optional[list]]:
+    """
+    map_and_order_stars for many constellations at once (all those in an
+    image, or across a micro-batch of images). Shapes are zero-padded into
+    stacked arrays so centering, the SVD and the reflection fix run as one
+    vectorized call; only the point pairing is done per shape.
+    Returns one ordered point list per shape (None on a star count mismatch).
+    """
+    results: List[Optional[list]] = [None] * len(canonical_models)
+    items = [i for i, (model, points) in enumerate(zip(canonical_models, detected_point_sets))
+             if len(points) == model.star_count and len(points) > 0]
+    if not items: return results
 
-    # --- Step 1: Center both point sets ---
-    canonical_center = np.mean(canonical_points, axis=0)
-    detected_center = np.mean(detected_points, axis=0)
-    canonical_centered = canonical_points - canonical_center
-    detected_centered = detected_points - detected_center
+    # --- Step 1: Pad every shape to the largest and center the detected points ---
+    counts = np.array([canonical_models[i].star_count for i in items])
+    size = counts.max()
+    mask = np.arange(size)[None, :] < counts[:, None]
+    canonical_centered = np.zeros((len(items), size, 2))
+    detected = np.zeros((len(items), size, 2))
+    for row, i in enumerate(items):
+        # The catalog stores the canonical points already centered
+        canonical_centered[row, :counts[row]] = canonical_models[i].centered
+        detected[row, :counts[row]] = detected_point_sets[i]
+    detected_center = detected.sum(axis=1) / counts[:, None]
+    # Padding rows stay zero, so they add nothing to the covariances below
+    detected_centered = (detected - detected_center[:, None, :]) * mask[..., None]
 
-    # --- Step 2: Find optimal rotation using SVD ---
-    covariance_matrix = np.dot(detected_centered.T, canonical_centered)
-    U, S, Vt = np.linalg.svd(covariance_matrix)
-    rotation = np.dot(Vt.T, U.T)
-    
-    # --- Step 3: THE CRITICAL FIX - Check for and correct reflection ---
-    # If the determinant of the rotation matrix is negative, it's a reflection, not a true rotation.
-    # We fix this by flipping the last singular vector.
-    if np.linalg.det(rotation) < 0:
-        Vt_corrected = Vt.copy()
-        Vt_corrected[-1,:] *= -1
-        rotation = np.dot(Vt_corrected.T, U.T)
-
-    # --- Step 4: Apply the corrected rotation ---
-    detected_aligned = np.dot(detected_centered, rotation)
-
-    # --- Step 5: Find the best point-to-point pairing ---
-    cost_matrix = cdist(canonical_centered, detected_aligned)
-    row_ind, col_ind = linear_sum_assignment(cost_matrix)
-    
-    # --- Step 6: Reconstruct the ordered list ---
-    ordered_points = [None] * len(detected_points)
-    for r, c in zip(row_ind, col_ind):
-        ordered_points[r] = tuple(map(int, detected_points[c]))
-        
-    print("    [Mapping Success] Correctly ordered stars using Procrustes analysis with reflection correction.")
-    return ordered_points
+    # --- Step 2: Find optimal rotations using one stacked SVD ---
+    covariance = np.einsum('bni,bnj->bij', detected_centered, canonical_centered)
+    U, S, Vt = np.linalg.svd(covariance)
+    rotation = np.swapaxes(Vt, 1, 2) @ np.swapaxes(U, 1, 2)
+
+    # --- Step 3: THE CRITICAL FIX - correct reflections by flipping the last singular vector ---
+    reflected = np.linalg.det(rotation) < 0
+    if reflected.any():
+        Vt[reflected, -1, :] *= -1
+        rotation[reflected] = np.swapaxes(Vt[reflected], 1, 2) @ np.swapaxes(U[reflected], 1, 2)
+
+    # --- Step 4: Apply the corrected rotations ---
+    detected_aligned = detected_centered @ rotation
+
+    # --- Steps 5-6: Pair points per shape and reconstruct the ordered lists ---
+    from scipy.optimize import linear_sum_assignment
+    from scipy.spatial.distance import cdist
+    for row, i in enumerate(items):
+        n = counts[row]
+        cost_matrix = cdist(canonical_centered[row, :n], detected_aligned[row, :n])
+        row_ind, col_ind = linear_sum_assignment(cost_matrix)
+        ordered_points = [None] * n
+        for r, c in zip(row_ind, col_ind):
+            ordered_points[r] = tuple(map(int, detected[row, c]))
+        results[i] = ordered_points
+    return results
 
 # =====================================================
 # DRAWING
 # =====================================================
-def draw_constellation(image, ordered_star_coords, canonical_model):
-    if not ordered_star_coords: return
-    for connection in canonical_model['connections']:
-        start, end = ordered_star_coords[connection[0]], ordered_star_coords[connection[1]]
-        cv2.line(image, start, end, (128, 0, 128), 3)
-    for pt in ordered_star_coords:
-        cv2.circle(image, pt, 5, (0, 165, 255), -1)
-    cv2.putText(image, canonical_model['name'], (ordered_star_coords[0][0] - 20, ordered_star_coords[0][1] - 30),
-                cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 0), 2)
+LINE_COLOR = (128, 0, 128)
+STAR_COLOR = (0, 165, 255)
+LABEL_COLOR = (255, 255, 0)
+STAR_RADIUS = 5
+
+def _circle_offsets(thickness: int) -> np.ndarray:
+    """(dy, dx) pixel offsets cv2.circle paints for a star, so stars can be stamped all at once."""
+    size = 2 * STAR_RADIUS + 5
+    canvas = np.zeros((size, size), np.uint8)
+    cv2.circle(canvas, (size // 2, size // 2), STAR_RADIUS, 255, thickness)
+    return np.argwhere(canvas) - size // 2
+
+_FILLED_STAR = _circle_offsets(-1)
+_HOLLOW_STAR = _circle_offsets(2)
+
+def _stamp(image, centers: np.ndarray, offsets: np.ndarray, color):
+    if not len(centers): return
+    ys = (centers[:, None, 1] + offsets[None, :, 0]).ravel()
+    xs = (centers[:, None, 0] + offsets[None, :, 1]).ravel()
+    inside = (ys >= 0) & (ys < image.shape[0]) & (xs >= 0) & (xs < image.shape[1])
+    image[ys[inside], xs[inside]] = color
+
+def render_overlay(image, figures):
+    """
+    Draws constellation figures onto `image` in place. `figures` is a list of
+    (ordered star coords, CatalogEntry, matched star indices or None = all).
+    Every connection of every figure goes through one cv2.polylines call and
+    every star is stamped in one vectorized write (hollow for stars that were
+    only predicted); only the labels are drawn one by one.
+    """
+    segments = []
+    filled, hollow = [], []
+    for coords, canonical_model, matched_stars in figures:
+        if not coords: continue
+        points = np.rint(np.asarray(coords, dtype=np.float64)).astype(np.int32)
+        segments += [points[[a, b]] for a, b in canonical_model.connections]
+        matched = np.ones(len(points), bool)
+        if matched_stars is not None:
+            matched[:] = False
+            matched[list(matched_stars)] = True
+        filled.append(points[matched])
+        hollow.append(points[~matched])
+    if segments:
+        cv2.polylines(image, segments, False, LINE_COLOR, 3)
+    if filled:
+        _stamp(image, np.concatenate(filled), _FILLED_STAR, STAR_COLOR)
+        _stamp(image, np.concatenate(hollow), _HOLLOW_STAR, STAR_COLOR)
+    for coords, canonical_model, _ in figures:
+        if not coords: continue
+        x, y = (int(round(v)) for v in coords[0])
+        cv2.putText(image, canonical_model.name, (x - 20, y - 30), cv2.FONT_HERSHEY_SIMPLEX, 1.2, LABEL_COLOR, 2)
+
+def draw_constellation(image, ordered_star_coords, canonical_model: CatalogEntry, matched_stars=None):
+    """Draws one stick figure; stars not in `matched_stars` (predicted positions) are drawn hollow."""
+    render_overlay(image, [(ordered_star_coords, canonical_model, matched_stars)])
+
+# =====================================================
+# PER-BOX WORK
+# =====================================================
+_roi_pool: Optional[ThreadPoolExecutor] = None
+_roi_pool_lock = threading.Lock()
+
+def get_roi_pool() -> Optional[ThreadPoolExecutor]:
+    """The process-wide pool per-box star extraction fans out over (None when ROI_WORKERS <= 1)."""
+    global _roi_pool
+    if _roi_pool is None and Config.ROI_WORKERS > 1:
+        with _roi_pool_lock:
+            if _roi_pool is None:
+                _roi_pool = ThreadPoolExecutor(max_workers=Config.ROI_WORKERS, thread_name_prefix="roi")
+    return _roi_pool
+
+def shutdown_roi_pool():
+    global _roi_pool
+    with _roi_pool_lock:
+        if _roi_pool is not None:
+            _roi_pool.shutdown(wait=True)
+        _roi_pool = None
+
+def suppress_duplicate_boxes(normalized_boxes, iou_threshold: float = 0.5) -> list:
+    """
+    Non-maximum suppression over one label's [x_center, y_center, w, h, conf]
+    boxes: keeps boxes by descending confidence, dropping any whose IoU with a
+    kept box exceeds `iou_threshold`.
+    """
+    if len(normalized_boxes) < 2: return list(normalized_boxes)
+    boxes = np.asarray(normalized_boxes, dtype=float)
+    x0, y0 = boxes[:, 0] - boxes[:, 2] / 2, boxes[:, 1] - boxes[:, 3] / 2
+    x1, y1 = boxes[:, 0] + boxes[:, 2] / 2, boxes[:, 1] + boxes[:, 3] / 2
+    areas = boxes[:, 2] * boxes[:, 3]
+    keep = []
+    for i in np.argsort(-boxes[:, 4], kind='stable'):
+        if keep:
+            kept = np.array(keep)
+            iw = np.maximum(np.minimum(x1[i], x1[kept]) - np.maximum(x0[i], x0[kept]), 0)
+            ih = np.maximum(np.minimum(y1[i], y1[kept]) - np.maximum(y0[i], y0[kept]), 0)
+            intersection = iw * ih
+            if (intersection / np.maximum(areas[i] + areas[kept] - intersection, 1e-12) > iou_threshold).any():
+                continue
+        keep.append(i)
+    return [normalized_boxes[i] for i in keep]
+
+def match_roi(star_img: np.ndarray, label: str, normalized_box, canonical_model: CatalogEntry):
+    """
+    Star extraction (and, on a count mismatch, partial matching) for one box.
+    Returns (result dict, detected points): the points are set when their
+    count matches the catalog, leaving the result to the batched Procrustes
+    alignment; otherwise the result is already final.
+    """
+    img_h, img_w = star_img.shape[:2]
+    constellation_box = denormalize_box_from_center(normalized_box, img_w, img_h)
+    required_stars = canonical_model.star_count
+
+    # The partial-match candidates come from the same pass over the box's levels
+    partial_matching = Config.PARTIAL_MATCHING and required_stars >= 3
+    selections = [(required_stars, None)]
+    if partial_matching:
+        selections.append((required_stars + Config.PARTIAL_MATCH_EXTRA_STARS,
+                           min_partial_inliers(required_stars, Config.PARTIAL_MATCH_MIN_FRACTION)))
+    with stage("find_stars"):
+        detected_points, *candidate_points = find_star_sets(star_img, constellation_box, selections)
+
+    ordered_points = None
+    matched_stars = []
+    exact_points = None
+    if len(detected_points) == required_stars:
+        exact_points = detected_points
+    elif partial_matching:
+        # Too many or too few stars: align against whatever the box holds
+        detected_points = candidate_points[0]
+        with stage("partial_match"):
+            partial = match_partial_stars(
+                canonical_model, detected_points,
+                box_size=max(constellation_box[2], constellation_box[3]),
+                min_fraction=Config.PARTIAL_MATCH_MIN_FRACTION,
+                max_hypotheses=Config.PARTIAL_MATCH_MAX_HYPOTHESES,
+                time_budget=Config.PARTIAL_MATCH_TIME_BUDGET_MS / 1000)
+        if partial is not None:
+            ordered_points = partial.stars
+            matched_stars = np.flatnonzero(partial.matched).tolist()
+            CONSTELLATIONS_MATCHED.labels(label, "partial").inc()
+        else:
+            logger.debug("Skipping '%s': no partial match among %d candidate stars.", label, len(detected_points))
+            CONSTELLATIONS_SKIPPED.labels(label, "star_count").inc()
+    else:
+        logger.debug("Skipping '%s': Found %d of %d required stars.", label, len(detected_points), required_stars)
+        CONSTELLATIONS_SKIPPED.labels(label, "star_count").inc()
+
+    result = {
+        'label': label,
+        'name': canonical_model.name,
+        'confidence': normalized_box[4],
+        'box': constellation_box,
+        'box_normalized': normalized_box[:4],
+        'matched': bool(ordered_points),
+        'stars': ordered_points or [],
+        'matched_stars': matched_stars if ordered_points else [],
+        'connections': canonical_model.connections,
+        'found_stars': len(detected_points),
+        'required_stars': required_stars,
+    }
+    return result, exact_points
 
 # =====================================================
 # MAIN
@@ -621,52 +501,338 @@ def draw_constellation(image, ordered_star_coords, canonical_model):
 
 # In pipeline.py, replace the old run_full_pipeline function with this one
 
-def run_full_pipeline(image_path: str, model_path: str, yaml_path: str, output_path: str) -> bool:
+def analyze_image(img: np.ndarray, model_path: str, yaml_path: str,
+                  loaded_model: Optional[LoadedModel] = None,
+                  batcher=None,
+                  image_name: Optional[str] = None,
+                  full_resolution: Optional[Callable[[], np.ndarray]] = None,
+                  on_detections: Optional[Callable[[dict], None]] = None,
+                  on_result: Optional[Callable[[int, dict], None]] = None) -> Optional[list]:
     """
-    Coordinates the entire detection and drawing pipeline.
-    Returns: True if an image was successfully created, False otherwise.
+    Runs detection and star matching on a decoded BGR image, without drawing.
+    When `img` was decoded at reduced resolution, `full_resolution` returns
+    the original-size image stars are extracted from; it is only called if
+    YOLO found something. Boxes and stars are in original-size pixels.
+    For progressive responses, `on_detections` gets YOLO's normalized boxes
+    as soon as they're known and `on_result(index, result)` each result as
+    soon as its stars are final (in completion order; `index` is its
+    position in the returned list).
+    Returns: one dict per detected box (label, name, box, confidence,
+    ordered star coordinates, connections), or None if YOLO found nothing.
     """
-    # 1. Run YOLO to get the constellation's bounding box
-    detected_objects = get_yolo_detections(
-        model_path=model_path,
-        image_path=image_path,
-        yaml_path=yaml_path
-    )
+    # 1. Run YOLO on the array we'll draw on
+    with stage("detect"):
+        detected_objects = get_yolo_detections(
+            model_path=model_path,
+            image_path=image_name,
+            yaml_path=yaml_path,
+            loaded_model=loaded_model,
+            batcher=batcher,
+            image=img,
+            with_confidence=True
+        )
     
     if not detected_objects:
-        print("Pipeline stopped: YOLO did not detect any constellations.")
-        return False
-        
-    img = cv2.imread(image_path)
-    if img is None: return False
+        logger.debug("Pipeline stopped: YOLO did not detect any constellations.")
+        return None
+    if on_detections is not None:
+        on_detections(detected_objects)
     
-    img_h, img_w, _ = img.shape
-    
-    # 2. Iterate through each detected constellation
+    # Boxes are normalized, so they map straight onto the full-resolution image
+    star_img = full_resolution() if full_resolution is not None else img
+    catalog = get_catalog()
+
+    # 2. Every box of every label, minus overlapping duplicates, in a fixed order
+    jobs = []
     for label, normalized_boxes in detected_objects.items():
-        # --- THIS IS THE CORRECTED LOGIC ---
-        # The 'label' from YOLO (e.g., 'Cyg') is the key we need for CONSTELLATION_DATA
-        cnn_label = label 
-        
-        if cnn_label not in CONSTELLATION_DATA:
-            print(f"Warning: Detected '{label}' but no matching key in CONSTELLATION_DATA.")
+        # The 'label' from YOLO (e.g., 'Cyg') is the key we need for the catalog
+        if label not in catalog:
+            logger.warning("Detected '%s' but no matching key in the constellation catalog.", label)
+            CONSTELLATIONS_SKIPPED.labels(label, "no_catalog_entry").inc()
             continue
-        # ------------------------------------
+        for normalized_box in suppress_duplicate_boxes(normalized_boxes, Config.DUPLICATE_BOX_IOU):
+            jobs.append((label, normalized_box))
 
-        normalized_box = normalized_boxes[0]
-        constellation_box = denormalize_box_from_center(normalized_box, img_w, img_h)
-        canonical_model = CONSTELLATION_DATA[cnn_label]
-        
-        detected_points = find_stars_within_box(img, constellation_box, expected_star_count=len(canonical_model['star_points']))
-        
-        if len(detected_points) == len(canonical_model['star_points']):
-            ordered_points = map_and_order_stars(canonical_model, detected_points)
-            if ordered_points:
-                draw_constellation(img, ordered_points, canonical_model)
-        else:
-            print(f"Skipping '{label}': Found {len(detected_points)} of {len(canonical_model['star_points'])} required stars.")
+    # Star extraction releases the GIL, so the boxes fan out over the shared
+    # pool; results stay in job order, which keeps drawing deterministic
+    pool = get_roi_pool()
+    if pool is None or len(jobs) < 2:
+        outcomes = []
+        for label, box in jobs:
+            outcomes.append(match_roi(star_img, label, box, catalog[label]))
+            if on_result is not None and outcomes[-1][1] is None:
+                on_result(len(outcomes) - 1, outcomes[-1][0])
+    else:
+        futures = [pool.submit(contextvars.copy_context().run, match_roi, star_img, label, box, catalog[label])
+                   for label, box in jobs]
+        if on_result is not None:
+            index_of = {future: index for index, future in enumerate(futures)}
+            for future in as_completed(futures):
+                result, exact_points = future.result()
+                if exact_points is None:
+                    on_result(index_of[future], result)
+        outcomes = [future.result() for future in futures]
+    results = [result for result, _ in outcomes]
+    exact = [(index, catalog[result['label']], points)
+             for index, (result, points) in enumerate(outcomes) if points is not None]
+
+    # 3. One batched Procrustes alignment for every exact-count constellation
+    if exact:
+        indices, models, point_sets = zip(*exact)
+        with stage("match"):
+            aligned = map_and_order_stars_batch(models, point_sets)
+        for index, ordered_points in zip(indices, aligned):
+            result = results[index]
+            result['matched'] = bool(ordered_points)
+            result['stars'] = ordered_points or []
+            result['matched_stars'] = list(range(result['required_stars'])) if ordered_points else []
+            CONSTELLATIONS_MATCHED.labels(result['label'], "exact").inc()
+            if on_result is not None:
+                on_result(index, result)
+
+    return results
+
+def draw_results(img: np.ndarray, results: list, scale: float = 1.0):
+    """
+    Draws every matched constellation from analyze_image onto `img` in place,
+    in a single render_overlay pass.
+    `scale` maps the results' (original-size) pixel coordinates onto `img`.
+    """
+    catalog = get_catalog()
+    figures = []
+    for result in results:
+        if result['matched']:
+            stars = result['stars']
+            if scale != 1.0:
+                stars = [(int(px * scale), int(py * scale)) for px, py in stars]
+            figures.append((stars, catalog[result['label']], result['matched_stars']))
+    render_overlay(img, figures)
+
+def constellation_geometry(result: dict) -> dict:
+    """One analyze_image result as the JSON per-constellation entry (pixel coordinates)."""
+    return {
+        'label': result['label'],
+        'name': result['name'],
+        'confidence': round(float(result['confidence']), 4),
+        'box': [int(v) for v in result['box']],
+        'box_normalized': [round(float(v), 6) for v in result['box_normalized']],
+        'matched': result['matched'],
+        'stars': [[int(x), int(y)] for x, y in result['stars']],
+        'matched_stars': [int(i) for i in result['matched_stars']],
+        'connections': [[int(a), int(b)] for a, b in result['connections']] if result['matched'] else [],
+        'found_stars': result['found_stars'],
+        'required_stars': result['required_stars'],
+    }
+
+def overlay_geometry(result: dict, img_w: int, img_h: int) -> Tuple[list, list]:
+    """A matched result's (lines, points) in the 0-1 relative shape ConstellationOverlay draws."""
+    if not result['matched']:
+        return [], []
+    stars = result['stars']
+    lines = []
+    for start, end in result['connections']:
+        (x1, y1), (x2, y2) = stars[start], stars[end]
+        lines.append([x1 / img_w, y1 / img_h, x2 / img_w, y2 / img_h])
+    points = [{'x': x / img_w, 'y': y / img_h, 'name': f"{result['name']} #{i + 1}"}
+              for i, (x, y) in enumerate(stars)]
+    return lines, points
+
+def results_to_geometry(results: list, img_w: int, img_h: int) -> dict:
+    """
+    Builds the JSON geometry response for analyze_image results.
+    Per-constellation entries use pixel coordinates; the top-level `lines` and
+    `points` use 0-1 relative coordinates in the shape ConstellationOverlay
+    draws (the same shape as ConstellationDetector.process_image).
+    """
+    constellations = []
+    lines = []
+    points = []
+    for result in results:
+        constellations.append(constellation_geometry(result))
+        result_lines, result_points = overlay_geometry(result, img_w, img_h)
+        lines += result_lines
+        points += result_points
+
+    matched = [c for c in constellations if c['matched']]
+    best = max(matched or constellations, key=lambda c: c['confidence'], default=None)
+    return {
+        'width': img_w,
+        'height': img_h,
+        'constellation': best['name'] if best else None,
+        'description': ", ".join(c['name'] for c in matched),
+        'confidence': "high" if best and best['confidence'] > 0.8 else "medium",
+        'detected_stars': sum(len(c['stars']) for c in matched),
+        'lines': lines,
+        'points': points,
+        'constellations': constellations,
+    }
+
+def output_canvas(decoded: DecodedImage, max_side: int = 0) -> Tuple[np.ndarray, float]:
+    """
+    The image a response's overlay is drawn on, and the multiplier from
+    original pixel coordinates onto it: the upload at its original
+    resolution, or fitted within `max_side` when that is set (0 = original).
+    A reduced detection decode is reused only when it is at least the
+    requested size; otherwise the full-resolution image star extraction
+    already decoded is drawn on.
+    """
+    size = fitted_size(decoded.width, decoded.height, max_side)
+    img = decoded.image
+    if decoded.factor > 1 and size[0] > img.shape[1]:
+        img = decoded.load_full_resolution()
+    if (img.shape[1], img.shape[0]) != size:
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return img, size[0] / decoded.width
+
+def render_results(decoded: DecodedImage, results: list,
+                   encoding: Optional[OutputEncoding] = None) -> Optional[bytes]:
+    """
+    Draws `results` onto the output_canvas for `encoding.max_side` and
+    encodes it as `encoding` (Config's default when None), so the response
+    has the upload's resolution unless max_side asks for less. Returns the
+    encoded bytes, or None if encoding fails.
+    """
+    encoding = encoding or OutputEncoding.default()
+    with stage("draw"):
+        img, scale = output_canvas(decoded, encoding.max_side)
+        draw_results(img, results, scale)
+    with stage("encode"):
+        return encode_image(img, encoding)
+
+def run_full_pipeline(image_path: str, model_path: str, yaml_path: str, output_path: str,
+                      loaded_model: Optional[LoadedModel] = None,
+                      batcher=None,
+                      max_pixels: int = 0,
+                      detect_side: int = 0) -> bool:
+    """
+    Coordinates the entire detection and drawing pipeline.
+    `max_pixels` and `detect_side` are passed to image_decode.decode_for_pipeline.
+    Returns: True if an image was successfully created, False otherwise.
+    Raises image_decode.ImageTooLargeError above the pixel budget.
+    """
+    if not os.path.exists(image_path): return False
+    with open(image_path, "rb") as f:
+        decoded = decode_for_pipeline(f.read(), max_pixels, detect_side)
+    if decoded is None: return False
+
+    results = analyze_image(decoded.image, model_path, yaml_path, loaded_model=loaded_model,
+                            batcher=batcher, image_name=image_path,
+                            full_resolution=decoded.load_full_resolution)
+    if results is None:
+        return False
+    # Drawn at the upload's resolution even when detection ran on a reduced decode
+    with stage("draw"):
+        img, scale = output_canvas(decoded, Config.OUTPUT_MAX_SIDE)
+        draw_results(img, results, scale)
 
     # 6. Save the final image
-    cv2.imwrite(output_path, img)
-    print(f"✅ Pipeline complete. Output saved to {output_path}")
-    return True
\ No newline at end of file
+    with stage("write_output"):
+        cv2.imwrite(output_path, img, [cv2.IMWRITE_JPEG_QUALITY, Config.OUTPUT_QUALITY])
+    return True
+
+def run_pipeline_on_bytes(image_bytes: bytes, model_path: str, yaml_path: str,
+                          loaded_model: Optional[LoadedModel] = None,
+                          batcher=None,
+                          image_name: Optional[str] = None,
+                          max_pixels: int = 0,
+                          detect_side: int = 0,
+                          encoding: Optional[OutputEncoding] = None) -> Optional[bytes]:
+    """
+    In-memory variant of run_full_pipeline: decodes the uploaded bytes once,
+    runs the pipeline on that array and returns the result encoded as
+    `encoding` (see render_results).
+    Large uploads are decoded (and the overlay rendered) at reduced resolution;
+    see image_decode.decode_for_pipeline for `max_pixels` and `detect_side`.
+    Returns: the encoded image bytes, or None if nothing could be produced.
+    Raises image_decode.ImageTooLargeError above the pixel budget.
+    """
+    decoded = decode_for_pipeline(image_bytes, max_pixels, detect_side)
+    if decoded is None:
+        logger.warning("Could not decode the uploaded image.")
+        return None
+
+    results = analyze_image(decoded.image, model_path, yaml_path, loaded_model=loaded_model,
+                            batcher=batcher, image_name=image_name,
+                            full_resolution=decoded.load_full_resolution)
+    if results is None:
+        return None
+    return render_results(decoded, results, encoding)
+
+def analyze_bytes(image_bytes: bytes, model_path: str, yaml_path: str,
+                  loaded_model: Optional[LoadedModel] = None,
+                  batcher=None,
+                  image_name: Optional[str] = None,
+                  max_pixels: int = 0,
+                  detect_side: int = 0) -> Optional[dict]:
+    """
+    Geometry-only variant of run_pipeline_on_bytes: skips drawing and encoding
+    and returns the results_to_geometry dict instead of an image. Coordinates
+    are always in the original image's pixels.
+    """
+    decoded = decode_for_pipeline(image_bytes, max_pixels, detect_side)
+    if decoded is None:
+        logger.warning("Could not decode the uploaded image.")
+        return None
+
+    results = analyze_image(decoded.image, model_path, yaml_path, loaded_model=loaded_model,
+                            batcher=batcher, image_name=image_name,
+                            full_resolution=decoded.load_full_resolution)
+    if results is None:
+        return None
+
+    return results_to_geometry(results, decoded.width, decoded.height)
+
+def stream_pipeline_on_bytes(image_bytes: bytes, model_path: str, yaml_path: str,
+                             emit: Callable[[dict], None],
+                             loaded_model: Optional[LoadedModel] = None,
+                             batcher=None,
+                             image_name: Optional[str] = None,
+                             max_pixels: int = 0,
+                             detect_side: int = 0,
+                             encoding: Optional[OutputEncoding] = None,
+                             render: bool = True) -> Tuple[Optional[dict], Optional[bytes]]:
+    """
+    Progressive variant of run_pipeline_on_bytes. Calls `emit` with each
+    event as soon as it is known:
+      {"event": "detections", ...}    YOLO's labels and boxes,
+      {"event": "constellation", ...} one per box once its stars are matched
+                                      (constellation_geometry plus its
+                                      relative lines/points and `index`),
+      {"event": "geometry", ...}      the complete results_to_geometry dict.
+    Returns (geometry, image rendered as `encoding`), or (None, None) when
+    the image can't be decoded or nothing was detected. With `render` False
+    nothing is drawn or encoded and the image is None.
+    Raises image_decode.ImageTooLargeError above the pixel budget.
+    """
+    decoded = decode_for_pipeline(image_bytes, max_pixels, detect_side)
+    if decoded is None:
+        logger.warning("Could not decode the uploaded image.")
+        return None, None
+    img_w, img_h = decoded.width, decoded.height
+
+    def on_detections(detected_objects: dict):
+        detections = []
+        for label, normalized_boxes in detected_objects.items():
+            for normalized_box in normalized_boxes:
+                detections.append({
+                    'label': label,
+                    'confidence': round(float(normalized_box[4]), 4),
+                    'box': denormalize_box_from_center(normalized_box, img_w, img_h),
+                    'box_normalized': [round(float(v), 6) for v in normalized_box[:4]],
+                })
+        emit({'event': 'detections', 'width': img_w, 'height': img_h, 'detections': detections})
+
+    def on_result(index: int, result: dict):
+        lines, points = overlay_geometry(result, img_w, img_h)
+        emit(dict(constellation_geometry(result), event='constellation', index=index, lines=lines, points=points))
+
+    img = decoded.image
+    results = analyze_image(img, model_path, yaml_path, loaded_model=loaded_model,
+                            batcher=batcher, image_name=image_name,
+                            full_resolution=decoded.load_full_resolution,
+                            on_detections=on_detections, on_result=on_result)
+    if results is None:
+        return None, None
+    geometry = results_to_geometry(results, img_w, img_h)
+    emit(dict(geometry, event='geometry'))
+    return geometry, render_results(decoded, results, encoding) if render else None
@@ -0,0 +1,112 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from telemetry import observe_stage
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineBusyError(RuntimeError):
+    """Raised when the executor's wait queue is full."""
+
+
+class PipelineExecutor:
+    """
+    Bounded thread pool for running the blocking pipeline off the event loop.
+
+    Threads (rather than processes) are used so every job shares the model
+    that was loaded once per worker; OpenCV and torch release the GIL for the
+    heavy parts. `max_workers` caps how many images are processed at once and
+    `max_queue` caps how many more may wait for a free thread (0 = unbounded).
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 0):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` in the pool and await its result."""
+        with self._lock:
+            if self.max_queue and self._queued >= self.max_queue:
+                self._rejected += 1
+                raise PipelineBusyError(f"Pipeline queue is full ({self._queued} waiting)")
+            self._queued += 1
+
+        # If the awaiting request is cancelled while the job is still queued,
+        # the pool drops it and `_call` never runs, so the queue slot is given
+        # back here; once started, the job runs to completion in its thread and
+        # only the waiter goes away. The caller's context is carried over so
+        # the job's trace spans nest under the request's.
+        loop = asyncio.get_running_loop()
+        ticket = [False]  # set once this job has left the queue
+        call = functools.partial(self._call, ticket, time.perf_counter(), fn, *args, **kwargs)
+        try:
+            return await loop.run_in_executor(self._pool, contextvars.copy_context().run, call)
+        finally:
+            self._leave_queue(ticket)
+
+    def _leave_queue(self, ticket: list) -> bool:
+        """Release the job's queue slot exactly once; True for the first caller."""
+        with self._lock:
+            if ticket[0]:
+                return False
+            ticket[0] = True
+            self._queued -= 1
+            return True
+
+    def _call(self, ticket: list, submitted_at: float, fn: Callable, *args, **kwargs):
+        if not self._leave_queue(ticket):
+            return None  # the waiter was cancelled before the job started
+        observe_stage("queue_wait", time.perf_counter() - submitted_at)
+        with self._lock:
+            self._in_flight += 1
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        else:
+            with self._lock:
+                self._completed += 1
+            return result
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of the executor's load, suitable for a JSON response."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queued,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
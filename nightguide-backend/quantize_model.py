@@ -0,0 +1,351 @@
+"""
+INT8 post-training quantization of the constellation detector, with an
+accuracy gate against the FP32 model.
+
+    python quantize_model.py --calib-dir path/to/sky_photos
+
+1. Exports models/best.pt to FP32 ONNX (unless an .onnx is given).
+2. Calibrates static INT8 quantization on the images in --calib-dir.
+3. Runs FP32 and INT8 over --eval-dir (defaults to --calib-dir), each in its
+   own process so latency and resident memory (RSS) are measured separately.
+4. Writes a JSON report with per-class detection agreement for every class in
+   data.yaml, latency and RSS per image, and whether the INT8 model passed
+   the --max-delta gate. Exits non-zero if it did not.
+
+Serve the quantized model with:
+
+    USE_CNN=true MODEL_TYPE=onnx CNN_MODEL_PATH=models/best_int8.onnx python run.py
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import re
+import statistics
+import sys
+import time
+from typing import List, Optional
+
+import cv2
+import numpy as np
+import yaml
+
+from batch_upload import is_image
+from cnn_integration import CNNConstellationDetector
+from config import Config
+
+
+def list_images(folder: str, limit: Optional[int] = None) -> List[str]:
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(folder)
+        for name in names
+        if is_image(name)
+    )
+    return paths[:limit] if limit else paths
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process (Linux /proc, falling back to peak RSS)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+# =====================================================
+# CALIBRATION + QUANTIZATION
+# =====================================================
+def head_node_names(onnx_path: str) -> List[str]:
+    """
+    Nodes of the detection head (the last `/model.N/` block of an ultralytics
+    export). Its box decoding is very sensitive to INT8 rounding, so it is
+    left in FP32 by default.
+    """
+    import onnx
+
+    model = onnx.load(onnx_path, load_external_data=False)
+    pattern = re.compile(r"^/model\.(\d+)/")
+    indices = [int(m.group(1)) for node in model.graph.node if (m := pattern.match(node.name))]
+    if not indices:
+        return []
+    prefix = f"/model.{max(indices)}/"
+    return [node.name for node in model.graph.node if node.name.startswith(prefix)]
+
+
+def quantize(fp32_path: str, int8_path: str, calib_images: List[str],
+             per_channel: bool = True, quantize_head: bool = False, method: str = "minmax"):
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                          QuantType, quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    # Reuse the serving backend's letterbox so calibration sees exactly what inference sees
+    preprocessor = CNNConstellationDetector(fp32_path, model_type="onnx")
+    if not preprocessor.is_loaded:
+        raise SystemExit(f"❌ Could not load {fp32_path}")
+    input_name = preprocessor._input_name
+
+    class ImageCalibrationReader(CalibrationDataReader):
+        def __init__(self, paths):
+            self._paths = iter(paths)
+
+        def get_next(self):
+            for path in self._paths:
+                image = cv2.imread(path)
+                if image is not None:
+                    blob, _, _ = preprocessor.preprocess_image(image)
+                    return {input_name: blob}
+            return None
+
+    prepared_path = int8_path.replace(".onnx", "_prep.onnx")
+    quant_pre_process(fp32_path, prepared_path)
+
+    nodes_to_exclude = [] if quantize_head else head_node_names(prepared_path)
+    calibrate_method = {
+        "minmax": CalibrationMethod.MinMax,
+        "entropy": CalibrationMethod.Entropy,
+        "percentile": CalibrationMethod.Percentile,
+    }[method]
+
+    quantize_static(
+        prepared_path,
+        int8_path,
+        ImageCalibrationReader(calib_images),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=per_channel,
+        calibrate_method=calibrate_method,
+        nodes_to_exclude=nodes_to_exclude,
+    )
+    os.remove(prepared_path)
+    return nodes_to_exclude
+
+
+# =====================================================
+# EVALUATION
+# =====================================================
+def evaluate_model(model_path: str, class_names: List[str], images: List[str],
+                   num_threads: int, conf_threshold: float, results_queue):
+    """Runs in a child process: per-image detections, latency and RSS for one model."""
+    rss_before = current_rss_bytes()
+    detector = CNNConstellationDetector(model_path, model_type="onnx", class_names=class_names,
+                                        num_threads=num_threads, conf_threshold=conf_threshold)
+    if not detector.is_loaded:
+        results_queue.put({"error": f"Could not load {model_path}"})
+        return
+    rss_loaded = current_rss_bytes()
+
+    # Warm-up so the first image doesn't include graph initialisation
+    detector.detect_yolo(np.zeros((detector.input_size, detector.input_size, 3), dtype=np.uint8))
+
+    per_image = []
+    for path in images:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        start = time.perf_counter()
+        detections = detector.detect_yolo(image, with_confidence=True)
+        latency_ms = (time.perf_counter() - start) * 1000
+        per_image.append({
+            "image": path,
+            "latency_ms": latency_ms,
+            "rss_bytes": current_rss_bytes(),
+            "detections": detections,
+        })
+
+    results_queue.put({
+        "model": model_path,
+        "rss_before_load_bytes": rss_before,
+        "rss_after_load_bytes": rss_loaded,
+        "images": per_image,
+    })
+
+
+RESULT_POLL_SECONDS = 1.0
+
+
+def run_isolated(model_path: str, class_names: List[str], images: List[str],
+                 num_threads: int, conf_threshold: float) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    results_queue = ctx.Queue()
+    process = ctx.Process(target=evaluate_model,
+                          args=(model_path, class_names, images, num_threads, conf_threshold, results_queue))
+    process.start()
+    # A child killed by the OOM killer or a native crash never reports back,
+    # so poll instead of blocking forever
+    while True:
+        try:
+            result = results_queue.get(timeout=RESULT_POLL_SECONDS)
+            break
+        except queue.Empty:
+            if process.is_alive():
+                continue
+        # It may have exited right after putting its result
+        try:
+            result = results_queue.get(timeout=RESULT_POLL_SECONDS)
+            break
+        except queue.Empty:
+            raise SystemExit(f"❌ Evaluating {model_path} failed: the worker process exited "
+                             f"with code {process.exitcode} without reporting results")
+    process.join()
+    if "error" in result:
+        raise SystemExit(f"❌ {result['error']}")
+    return result
+
+
+def box_iou(a: List[float], b: List[float]) -> float:
+    """IoU of two normalized [x_center, y_center, w, h] boxes."""
+    ax1, ay1, ax2, ay2 = a[0] - a[2] / 2, a[1] - a[3] / 2, a[0] + a[2] / 2, a[1] + a[3] / 2
+    bx1, by1, bx2, by2 = b[0] - b[2] / 2, b[1] - b[3] / 2, b[0] + b[2] / 2, b[1] + b[3] / 2
+    inter = max(0.0, min(ax2, bx2) - max(ax1, bx1)) * max(0.0, min(ay2, by2) - max(ay1, by1))
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare_detections(fp32: dict, int8: dict, class_names: List[str], iou_threshold: float) -> dict:
+    """
+    Per-class agreement of INT8 with FP32 (treated as reference): a class
+    "agrees" on an image when both models detect it with a box IoU above
+    `iou_threshold`.
+    """
+    per_class = {name: {"fp32": 0, "int8": 0, "agreed": 0} for name in class_names}
+    int8_by_image = {entry["image"]: entry["detections"] for entry in int8["images"]}
+
+    for entry in fp32["images"]:
+        reference = entry["detections"]
+        candidate = int8_by_image.get(entry["image"], {})
+        for label in set(reference) | set(candidate):
+            stats = per_class.setdefault(label, {"fp32": 0, "int8": 0, "agreed": 0})
+            stats["fp32"] += int(label in reference)
+            stats["int8"] += int(label in candidate)
+            if label in reference and label in candidate:
+                best_iou = max(box_iou(r, c) for r in reference[label] for c in candidate[label])
+                stats["agreed"] += int(best_iou >= iou_threshold)
+
+    for stats in per_class.values():
+        union = stats["fp32"] + stats["int8"] - stats["agreed"]
+        stats["agreement"] = stats["agreed"] / union if union else 1.0
+
+    total_agreed = sum(s["agreed"] for s in per_class.values())
+    total_union = sum(s["fp32"] + s["int8"] - s["agreed"] for s in per_class.values())
+    overall = total_agreed / total_union if total_union else 1.0
+    return {"overall_agreement": overall, "per_class": per_class}
+
+
+def summarize_performance(result: dict) -> dict:
+    latencies = sorted(entry["latency_ms"] for entry in result["images"])
+    rss = [entry["rss_bytes"] for entry in result["images"]]
+    if not latencies:
+        return {}
+    return {
+        "latency_ms_median": statistics.median(latencies),
+        "latency_ms_p90": latencies[min(len(latencies) - 1, int(0.9 * len(latencies)))],
+        "latency_ms_mean": statistics.fmean(latencies),
+        "rss_model_bytes": result["rss_after_load_bytes"] - result["rss_before_load_bytes"],
+        "rss_peak_bytes": max(rss),
+        "rss_median_bytes": statistics.median(rss),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 quantization of the NightGuide detector with an accuracy gate")
+    parser.add_argument("--model", default=Config.YOLO_MODEL_PATH, help=".pt weights or an FP32 .onnx export")
+    parser.add_argument("--yaml", default=Config.YOLO_YAML_PATH, help="data.yaml with the class names")
+    parser.add_argument("--calib-dir", required=True, help="Folder of representative sky images")
+    parser.add_argument("--eval-dir", help="Folder of images for the FP32/INT8 comparison (default: --calib-dir)")
+    parser.add_argument("--output", default="models/best_int8.onnx")
+    parser.add_argument("--report", default="models/quantization_report.json")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--max-calib", type=int, default=200, help="Max calibration images")
+    parser.add_argument("--max-eval", type=int, default=500, help="Max evaluation images")
+    parser.add_argument("--method", choices=["minmax", "entropy", "percentile"], default="minmax")
+    parser.add_argument("--per-tensor", action="store_true", help="Per-tensor instead of per-channel weights")
+    parser.add_argument("--quantize-head", action="store_true", help="Also quantize the detection head")
+    parser.add_argument("--conf", type=float, default=0.25, help="Detection confidence threshold")
+    parser.add_argument("--iou", type=float, default=0.5, help="Box IoU for two detections to agree")
+    parser.add_argument("--max-delta", type=float, default=0.05,
+                        help="Largest acceptable drop in overall agreement (1 - agreement)")
+    parser.add_argument("--threads", type=int, default=Config.CNN_NUM_THREADS)
+    args = parser.parse_args()
+
+    with open(args.yaml, "r") as f:
+        class_names = yaml.safe_load(f)["names"]
+
+    calib_images = list_images(args.calib_dir, args.max_calib)
+    eval_images = list_images(args.eval_dir or args.calib_dir, args.max_eval)
+    if not calib_images or not eval_images:
+        raise SystemExit("❌ No images found for calibration / evaluation")
+
+    fp32_path = args.model
+    if not fp32_path.endswith(".onnx"):
+        from export_model import export_model
+        print(f"📦 Exporting {fp32_path} to FP32 ONNX...")
+        # Static batch-1 shapes calibrate and quantize more predictably
+        fp32_path = export_model(fp32_path, "onnx", args.imgsz, dynamic_batch=False)
+
+    print(f"🔧 Calibrating INT8 on {len(calib_images)} images ({args.method})...")
+    excluded = quantize(fp32_path, args.output, calib_images,
+                        per_channel=not args.per_tensor, quantize_head=args.quantize_head, method=args.method)
+    print(f"✅ Quantized model written to {args.output} ({len(excluded)} head nodes kept in FP32)")
+
+    print(f"📊 Evaluating FP32 vs INT8 on {len(eval_images)} images...")
+    fp32 = run_isolated(fp32_path, class_names, eval_images, args.threads, args.conf)
+    int8 = run_isolated(args.output, class_names, eval_images, args.threads, args.conf)
+
+    comparison = compare_detections(fp32, int8, class_names, args.iou)
+    delta = 1.0 - comparison["overall_agreement"]
+    accepted = delta <= args.max_delta
+
+    report = {
+        "fp32_model": fp32_path,
+        "int8_model": args.output,
+        "calibration_images": len(calib_images),
+        "evaluation_images": len(eval_images),
+        "settings": {
+            "method": args.method,
+            "per_channel": not args.per_tensor,
+            "quantize_head": args.quantize_head,
+            "conf_threshold": args.conf,
+            "iou_threshold": args.iou,
+            "threads": args.threads,
+        },
+        "fp32": summarize_performance(fp32),
+        "int8": summarize_performance(int8),
+        "model_size_bytes": {"fp32": os.path.getsize(fp32_path), "int8": os.path.getsize(args.output)},
+        "overall_agreement": comparison["overall_agreement"],
+        "accuracy_delta": delta,
+        "max_delta": args.max_delta,
+        "accepted": accepted,
+        "per_class": comparison["per_class"],
+        "per_image": {
+            "fp32": [{k: e[k] for k in ("image", "latency_ms", "rss_bytes")} for e in fp32["images"]],
+            "int8": [{k: e[k] for k in ("image", "latency_ms", "rss_bytes")} for e in int8["images"]],
+        },
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+
+    fp32_perf, int8_perf = report["fp32"], report["int8"]
+    print(f"  Latency median: FP32 {fp32_perf['latency_ms_median']:.1f}ms -> INT8 {int8_perf['latency_ms_median']:.1f}ms")
+    print(f"  Peak RSS:       FP32 {fp32_perf['rss_peak_bytes'] / 2**20:.0f}MB -> INT8 {int8_perf['rss_peak_bytes'] / 2**20:.0f}MB")
+    print(f"  Agreement:      {comparison['overall_agreement']:.3f} (delta {delta:.3f}, max {args.max_delta})")
+    worst = sorted(((s["agreement"], name) for name, s in comparison["per_class"].items()
+                    if s["fp32"] or s["int8"]))[:5]
+    if worst:
+        print("  Least stable classes: " + ", ".join(f"{name} {agreement:.2f}" for agreement, name in worst))
+    print(f"📝 Report written to {args.report}")
+
+    if accepted:
+        print(f"✅ INT8 model accepted. Serve it with: USE_CNN=true MODEL_TYPE=onnx CNN_MODEL_PATH={args.output} python run.py")
+    else:
+        print("❌ INT8 model rejected: accuracy delta exceeds --max-delta. Keep serving the FP32 model.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def file_fingerprint(path: str) -> str:
+    """
+    Short content hash of a file (e.g. the model weights), or of every file in
+    a directory (e.g. an OpenVINO export), computed once per process.
+    """
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    else:
+        paths = [path]
+    digest = hashlib.sha256()
+    for file_path in paths:
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def make_cache_key(image_bytes: bytes, *versions: str) -> str:
+    """Content-addressed key: hash of the image bytes plus every version string."""
+    digest = hashlib.sha256(image_bytes)
+    for version in versions:
+        digest.update(b"\0")
+        digest.update(version.encode())
+    return digest.hexdigest()
+
+
+def guess_media_type(data: bytes) -> str:
+    """Media type of a cached entry, sniffed from its first bytes."""
+    if data[:1] in (b"{", b"["):
+        return "application/json"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of rendered results keyed by content hash.
+
+    Entries live in memory (bounded by count and total bytes). When `disk_dir`
+    is set, entries evicted from memory are kept on disk (bounded by
+    `disk_max_bytes`) and promoted back into memory on the next hit. Disk
+    reads and writes happen outside the lock; call get/put from a worker
+    thread rather than the event loop.
+    """
+
+    def __init__(self,
+                 max_entries: int = 256,
+                 max_bytes: int = 256 * 1024 * 1024,
+                 disk_dir: Optional[str] = None,
+                 disk_max_bytes: int = 2 * 1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return data
+            if key not in self._disk:
+                self.misses += 1
+                return None
+
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            spilled = self._store_memory(key, data) if key not in self._memory else []
+        self._spill(spilled)
+        return data
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            spilled = self._store_memory(key, data)
+        self._spill(spilled)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    # --- Memory tier (caller holds the lock) ---
+
+    def _store_memory(self, key: str, data: bytes) -> List[Tuple[str, bytes]]:
+        """Stores `data` in memory; returns the entries that must go to disk instead."""
+        if len(data) > self.max_bytes:
+            return [(key, data)]
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        spilled = []
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            old_key, old_data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_data)
+            spilled.append((old_key, old_data))
+        return spilled
+
+    # --- Disk tier (file I/O runs without the lock, so a slow disk never stalls memory hits) ---
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.bin")
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".bin"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _spill(self, entries: List[Tuple[str, bytes]]):
+        """Writes entries evicted from memory to disk, then indexes them and trims the disk tier."""
+        if not self.disk_dir:
+            return
+        for key, data in entries:
+            with self._lock:
+                if key in self._disk:
+                    continue
+            # A per-thread temp name, in case another thread spills the same key
+            tmp_path = f"{self._disk_path(key)}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, self._disk_path(key))
+            except OSError as e:
+                logger.warning(f"Could not write cache entry to disk: {e}")
+                continue
+            removed = []
+            with self._lock:
+                if key in self._disk:
+                    continue
+                self._disk[key] = len(data)
+                self._disk_bytes += len(data)
+                while self._disk and self._disk_bytes > self.disk_max_bytes:
+                    old_key, old_size = self._disk.popitem(last=False)
+                    self._disk_bytes -= old_size
+                    removed.append(old_key)
+            for old_key in removed:
+                try:
+                    os.remove(self._disk_path(old_key))
+                except OSError:
+                    pass
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            # Trimmed by another thread since the lookup, or lost
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        return data
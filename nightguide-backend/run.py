@@ -1,24 +1,41 @@
+import argparse
 import uvicorn
 import os
+import sys
 from dotenv import load_dotenv
 from config import Config
 
 # Load environment variables
 load_dotenv()
 
+def run_production():
+    """gunicorn with uvicorn workers and a preloaded, shared model (see gunicorn.conf.py)."""
+    from gunicorn.app.wsgiapp import run
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+    sys.argv = ["gunicorn", "--config", config_path, "main:app"]
+    run()
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start the NightGuide API")
+    parser.add_argument("--production", action="store_true",
+                        help="Run WEB_WORKERS gunicorn workers sharing a preloaded model instead of the reloading dev server")
+    args = parser.parse_args()
+
     # Validate configuration
     Config.validate_cnn_config()
     Config.print_config()
-    
+
     print(f"🚀 Starting NightGuide API on {Config.HOST}:{Config.PORT}")
     print(f"📖 API Documentation: http://{Config.HOST}:{Config.PORT}/docs")
     print(f"🔍 Health Check: http://{Config.HOST}:{Config.PORT}/health")
-    
-    uvicorn.run(
-        "main:app",
-        host=Config.HOST,
-        port=Config.PORT,
-        reload=True,  # Enable auto-reload for development
-        log_level=Config.LOG_LEVEL.lower()
-    ) 
\ No newline at end of file
+
+    if args.production:
+        run_production()
+    else:
+        uvicorn.run(
+            "main:app",
+            host=Config.HOST,
+            port=Config.PORT,
+            reload=True,  # Enable auto-reload for development
+            log_level=Config.LOG_LEVEL.lower()
+        )
@@ -0,0 +1,185 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:  # metrics become no-ops and /metrics reports 501
+    prometheus_client = None
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; the pipeline stages range from sub-millisecond (denormalize) to
+# whole seconds (YOLO on a large image on CPU).
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+class _NoopMetric:
+    """Stands in for every metric type when prometheus_client isn't installed."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def set_function(self, fn):
+        pass
+
+
+if prometheus_client is not None:
+    STAGE_SECONDS = Histogram(
+        "nightguide_stage_seconds", "Time spent in each pipeline stage.",
+        ["stage"], buckets=STAGE_BUCKETS)
+    REQUEST_SECONDS = Histogram(
+        "nightguide_request_seconds", "HTTP request latency until the response starts.",
+        ["endpoint", "method", "status"], buckets=STAGE_BUCKETS)
+    DETECTIONS = Counter(
+        "nightguide_detections_total", "Constellation boxes returned by the detector.",
+        ["label"])
+    CONSTELLATIONS_MATCHED = Counter(
+        "nightguide_constellations_matched_total",
+        "Detected constellations whose stars were matched and ordered (method: exact, partial).",
+        ["label", "method"])
+    CONSTELLATIONS_SKIPPED = Counter(
+        "nightguide_constellations_skipped_total",
+        "Detected constellations that were not drawn (reason: star_count, no_catalog_entry).",
+        ["label", "reason"])
+    INFERENCE_BATCH_SIZE = Histogram(
+        "nightguide_inference_batch_size", "Images per batched detector call.",
+        buckets=BATCH_SIZE_BUCKETS)
+    LIVE_FRAMES = Counter(
+        "nightguide_live_frames_total", "Live-sky frames by outcome (keyframe, tracked, dropped).",
+        ["outcome"])
+    QUEUE_DEPTH = Gauge(
+        "nightguide_queue_depth", "Jobs waiting in each queue.",
+        ["queue"])
+    IN_FLIGHT = Gauge(
+        "nightguide_pipeline_in_flight", "Images currently being processed by the pipeline executor.")
+    MODEL_LOAD_SECONDS = Gauge(
+        "nightguide_model_load_seconds", "Time it took to load the detection model.",
+        ["model", "backend"])
+    MODEL_WARMUP_SECONDS = Gauge(
+        "nightguide_model_warmup_seconds", "Time the warm-up inference took.",
+        ["model", "backend"])
+    ADMISSION_WAIT_SECONDS = Histogram(
+        "nightguide_admission_wait_seconds", "Time uploads waited for admission (0 when admitted at once).",
+        buckets=STAGE_BUCKETS + (30.0,))
+    ADMISSION_REJECTED = Counter(
+        "nightguide_admission_rejected_total",
+        "Uploads turned away by admission control (reason: queue_full, wait_timeout, client_limit).",
+        ["reason"])
+    ADMISSION_IN_FLIGHT = Gauge(
+        "nightguide_admission_in_flight", "Uploads currently admitted.")
+    ADMISSION_OLDEST_WAIT = Gauge(
+        "nightguide_admission_oldest_wait_seconds", "How long the longest-waiting upload has been queued.")
+else:
+    STAGE_SECONDS = REQUEST_SECONDS = DETECTIONS = _NoopMetric()
+    CONSTELLATIONS_MATCHED = CONSTELLATIONS_SKIPPED = INFERENCE_BATCH_SIZE = LIVE_FRAMES = _NoopMetric()
+    QUEUE_DEPTH = IN_FLIGHT = MODEL_LOAD_SECONDS = MODEL_WARMUP_SECONDS = _NoopMetric()
+    ADMISSION_WAIT_SECONDS = ADMISSION_REJECTED = ADMISSION_IN_FLIGHT = ADMISSION_OLDEST_WAIT = _NoopMetric()
+
+_tracer = None
+_tracer_provider = None
+
+
+def metrics_available() -> bool:
+    return prometheus_client is not None
+
+
+def render_metrics() -> bytes:
+    """The process's metrics in the Prometheus text exposition format."""
+    return prometheus_client.generate_latest()
+
+
+def observe_stage(name: str, seconds: float):
+    """Records an already measured stage duration."""
+    STAGE_SECONDS.labels(name).observe(seconds)
+
+
+def track_queue(name: str, depth: Callable[[], int]):
+    """Reports `depth()` as nightguide_queue_depth{queue=name} at scrape time."""
+    QUEUE_DEPTH.labels(name).set_function(depth)
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """
+    Times the block into nightguide_stage_seconds{stage=name} and, when
+    tracing is configured, wraps it in a span of the same name. Yields the
+    span (or None) so callers can attach attributes.
+    """
+    start = time.perf_counter()
+    if _tracer is None:
+        try:
+            yield None
+        finally:
+            STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+        return
+    with _tracer.start_as_current_span(name, attributes=attributes or None) as current:
+        try:
+            yield current
+        finally:
+            STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """A trace span without a stage histogram (e.g. one per request); no-op when tracing is off."""
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name, attributes=attributes or None) as current:
+        yield current
+
+
+def configure_tracing(service_name: str = "nightguide-backend",
+                      endpoint: Optional[str] = None) -> bool:
+    """
+    Exports spans over OTLP/HTTP to a local collector when TRACING_ENABLED is
+    set and the OpenTelemetry SDK is installed. Returns whether tracing is on.
+    """
+    global _tracer, _tracer_provider
+    if not Config.TRACING_ENABLED:
+        return False
+    if _tracer is not None:
+        return True
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("TRACING_ENABLED=true but opentelemetry-sdk / opentelemetry-exporter-otlp "
+                       "are not installed; tracing is disabled")
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint or Config.TRACING_ENDPOINT)))
+    trace.set_tracer_provider(provider)
+    _tracer_provider = provider
+    _tracer = trace.get_tracer("nightguide")
+    logger.info(f"Exporting traces to {endpoint or Config.TRACING_ENDPOINT}")
+    return True
+
+
+def shutdown_tracing():
+    """Flushes pending spans."""
+    global _tracer, _tracer_provider
+    if _tracer_provider is not None:
+        _tracer_provider.shutdown()
+    _tracer = _tracer_provider = None
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from admission import AdmissionController, AdmissionMiddleware, AdmissionRejected
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def assert_idle(controller: AdmissionController):
+    assert (controller.in_flight, controller.queue_depth, controller._clients) == (0, 0, {})
+
+
+def test_admits_up_to_max_in_flight():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=2)
+        assert await controller.acquire("a") == 0.0
+        await controller.acquire("b")
+        assert controller.in_flight == 2
+        controller.release("a")
+        controller.release("b")
+        assert_idle(controller)
+    run(scenario())
+
+
+def test_full_queue_is_rejected_with_503_and_retry_after():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_waiting=0)
+        await controller.acquire("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("b")
+        assert (rejected.value.status, rejected.value.reason) == (503, "queue_full")
+        assert 1 <= rejected.value.retry_after <= 60
+        assert controller.stats()["rejected"] == 1
+    run(scenario())
+
+
+def test_client_over_its_cap_is_rejected_with_429():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=4, per_client=1)
+        await controller.acquire("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("a")
+        assert (rejected.value.status, rejected.value.reason) == (429, "client_limit")
+        await controller.acquire("b")
+        assert controller.in_flight == 2
+    run(scenario())
+
+
+def test_retry_after_grows_with_queue_and_service_time():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_waiting=4, max_wait=5)
+        await controller.acquire("a")
+        for _ in range(10):
+            controller.release("a", held=8.0)
+            await controller.acquire("a")
+        idle_estimate = controller.retry_after()
+        waiters = [asyncio.create_task(controller.acquire(f"w{i}")) for i in range(4)]
+        await asyncio.sleep(0)
+        assert controller.retry_after() > idle_estimate > 1
+        for task in waiters:
+            task.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+    run(scenario())
+
+
+def test_wait_timeout_is_rejected_and_leaves_no_trace():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_waiting=1, max_wait=0.02)
+        await controller.acquire("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("b")
+        assert (rejected.value.status, rejected.value.reason) == (503, "wait_timeout")
+        assert controller.stats()["timed_out"] == 1
+        controller.release("a")
+        assert_idle(controller)
+    run(scenario())
+
+
+def test_release_hands_the_slot_to_the_longest_waiter():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_waiting=2, max_wait=5)
+        await controller.acquire("a")
+        first = asyncio.create_task(controller.acquire("b"))
+        second = asyncio.create_task(controller.acquire("c"))
+        await asyncio.sleep(0)
+        assert controller.queue_depth == 2
+
+        controller.release("a")
+        await first
+        assert not second.done()
+        assert controller.in_flight == 1
+        controller.release("b")
+        await second
+        controller.release("c")
+        assert_idle(controller)
+    run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_waiting=1, max_wait=5)
+        await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        controller.release("a")
+        assert_idle(controller)
+    run(scenario())
+
+
+def test_slot_handed_to_a_cancelled_waiter_is_passed_on():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_waiting=2, max_wait=5)
+        await controller.acquire("a")
+        cancelled = asyncio.create_task(controller.acquire("b"))
+        next_in_line = asyncio.create_task(controller.acquire("c"))
+        await asyncio.sleep(0)
+
+        # Cancelled and handed the slot before the waiter gets to run
+        cancelled.cancel()
+        controller.release("a")
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        await asyncio.wait_for(next_in_line, 1)
+        assert controller.in_flight == 1
+        controller.release("c")
+        assert_idle(controller)
+    run(scenario())
+
+
+def test_slot_handed_over_as_the_wait_runs_out_is_kept():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_waiting=1, max_wait=0.02)
+        await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+
+        def release_late():
+            # Blocks the loop past the deadline, so the handoff and the timeout land together
+            time.sleep(0.05)
+            controller.release("a")
+
+        asyncio.get_running_loop().call_soon(release_late)
+        await waiter
+        assert controller.in_flight == 1
+        controller.release("b")
+        assert_idle(controller)
+    run(scenario())
+
+
+def http_scope(admission, path="/upload", method="POST", client=("10.0.0.1", 4000), headers=()):
+    return {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": list(headers),
+        "client": client,
+        "app": SimpleNamespace(state=SimpleNamespace(admission=admission)),
+    }
+
+
+async def call(middleware, scope):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await middleware(scope, receive, send)
+    return sent
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"done"})
+
+
+def test_middleware_rejects_with_json_and_retry_after():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_waiting=0)
+        await controller.acquire("someone-else")
+        called = []
+
+        async def app(scope, receive, send):
+            called.append(scope)
+
+        sent = await call(AdmissionMiddleware(app, paths=["/upload"]), http_scope(controller))
+        assert not called
+        start, body = sent
+        headers = dict(start["headers"])
+        assert start["status"] == 503
+        assert int(headers[b"retry-after"]) >= 1
+        assert headers[b"content-type"] == b"application/json"
+        assert int(headers[b"content-length"]) == len(body["body"])
+        assert "busy" in json.loads(body["body"])["error"]
+    run(scenario())
+
+
+def test_middleware_keys_clients_by_forwarded_for_when_trusted():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=4, per_client=1)
+        await controller.acquire("203.0.113.7")
+        middleware = AdmissionMiddleware(ok_app, paths=["/upload"], trust_forwarded_for=True)
+        scope = http_scope(controller, headers=[(b"x-forwarded-for", b"203.0.113.7, 10.0.0.2")])
+        sent = await call(middleware, scope)
+        assert sent[0]["status"] == 429
+        # A different proxy client still gets in
+        scope = http_scope(controller, headers=[(b"x-forwarded-for", b"198.51.100.1")])
+        assert (await call(middleware, scope))[0]["status"] == 200
+    run(scenario())
+
+
+def test_middleware_releases_the_slot_when_the_app_fails():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1)
+
+        async def failing_app(scope, receive, send):
+            assert controller.in_flight == 1
+            assert "received_at" in scope["state"]
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            await call(AdmissionMiddleware(failing_app, paths=["/upload"]), http_scope(controller))
+        assert_idle(controller)
+        assert (await call(AdmissionMiddleware(ok_app, paths=["/upload"]), http_scope(controller)))[0]["status"] == 200
+        assert_idle(controller)
+    run(scenario())
+
+
+@pytest.mark.parametrize("method, path", [("GET", "/upload"), ("POST", "/health"), ("POST", "/upload/batch")])
+def test_middleware_passes_other_requests_through(method, path):
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_waiting=0)
+        await controller.acquire("busy")
+        middleware = AdmissionMiddleware(ok_app, paths=["/upload", "/upload/stream"])
+        assert (await call(middleware, http_scope(controller, path=path, method=method)))[0]["status"] == 200
+    run(scenario())
+
+
+def test_middleware_without_a_controller_passes_through():
+    sent = run(call(AdmissionMiddleware(ok_app, paths=["/upload"]), http_scope(None)))
+    assert sent[0]["status"] == 200
@@ -0,0 +1,69 @@
+import pytest
+
+from output_encoding import OutputEncoding, fitted_size, negotiate_encoding
+
+DEFAULT = OutputEncoding("jpeg", quality=85, max_side=0)
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("", "jpeg"),
+    ("*/*", "jpeg"),
+    ("image/*", "jpeg"),
+    ("application/json", "json"),
+    ("image/webp", "webp"),
+    ("image/png", "png"),
+    ("image/png;q=0.9, image/webp", "webp"),
+    # Equally ranked images: the cheapest to encode wins
+    ("image/webp, image/jpeg, image/png", "jpeg"),
+    ("image/webp, image/png", "webp"),
+    # A browser: images outrank the */* fallback
+    ("text/html, image/avif, image/webp, */*;q=0.8", "webp"),
+    # An API client: */* alone doesn't outrank JSON
+    ("application/json, text/plain, */*", "json"),
+    ("application/json;q=0.5, image/png", "png"),
+    ("image/png;q=0.5, application/json", "json"),
+    ("image/png;q=oops", "png"),
+])
+def test_accept_header(accept, expected):
+    assert negotiate_encoding(accept, default=DEFAULT).format == expected
+
+
+def test_image_accept_overrides_json_default():
+    json_default = OutputEncoding("json")
+    assert negotiate_encoding("image/*", default=json_default).format == "jpeg"
+    assert negotiate_encoding("image/png", default=json_default).format == "png"
+    assert negotiate_encoding("*/*", default=json_default).format == "json"
+
+
+def test_explicit_format_wins_over_accept():
+    assert negotiate_encoding("application/json", format="PNG", default=DEFAULT).format == "png"
+    assert negotiate_encoding("image/webp", format="jpg", default=DEFAULT).format == "jpeg"
+
+
+def test_unknown_format_raises():
+    with pytest.raises(ValueError):
+        negotiate_encoding(format="gif", default=DEFAULT)
+
+
+def test_quality_and_max_side_are_clamped():
+    encoding = negotiate_encoding(quality=500, max_side=-3, default=DEFAULT)
+    assert (encoding.quality, encoding.max_side) == (100, 0)
+    assert negotiate_encoding(quality=0, default=DEFAULT).quality == 1
+
+
+def test_cache_tag_distinguishes_renderings():
+    tags = {OutputEncoding("jpeg").cache_tag, OutputEncoding("jpeg", quality=60).cache_tag,
+            OutputEncoding("jpeg", max_side=800).cache_tag, OutputEncoding("webp").cache_tag}
+    assert len(tags) == 4
+    assert OutputEncoding("json", quality=60).cache_tag == OutputEncoding("json").cache_tag
+
+
+@pytest.mark.parametrize("size, max_side, expected", [
+    ((3000, 2000), 0, (3000, 2000)),
+    ((3000, 2000), 4000, (3000, 2000)),
+    ((3000, 2000), 1500, (1500, 1000)),
+    ((2000, 3000), 600, (400, 600)),
+    ((5000, 1), 100, (100, 1)),
+])
+def test_fitted_size(size, max_side, expected):
+    assert fitted_size(*size, max_side) == expected
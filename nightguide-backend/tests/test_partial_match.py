@@ -0,0 +1,48 @@
+import statistics
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+
+from constellation_catalog import get_catalog
+from partial_match import match_partial_stars
+
+
+def planted_points(label: str, size: float = 300.0):
+    entry = get_catalog()[label]
+    points = np.asarray(entry.normalized, dtype=float) / np.abs(entry.normalized).max() * size / 2 + 500
+    return entry, [tuple(int(round(v)) for v in point) for point in points]
+
+
+def test_missing_star_still_matches():
+    entry, points = planted_points("UMa")
+    match = match_partial_stars(entry, points[:-1], box_size=400)
+    assert match is not None
+    assert match.inliers == entry.star_count - 1
+    assert not match.matched[-1]
+    assert all(match.stars[i] == points[i] for i in range(entry.star_count - 1))
+
+
+def test_extra_stars_still_match():
+    entry, points = planted_points("Ori")
+    extra = [tuple(p) for p in np.random.default_rng(3).integers(300, 700, size=(4, 2))]
+    match = match_partial_stars(entry, points + extra, box_size=400)
+    assert match is not None
+    assert match.inliers == entry.star_count
+
+
+@pytest.mark.parametrize("budget", [0.002, 0.01])
+def test_time_budget_is_respected(budget):
+    # Ten catalog stars against 25 unrelated points: far more hypotheses than the budget allows
+    entry = next(e for e in get_catalog().entries() if e.star_count == 10)
+    points = [tuple(p) for p in np.random.default_rng(1).integers(0, 1000, size=(25, 2))]
+    match_partial_stars(entry, points, max_hypotheses=10 ** 6, time_budget=budget)  # imports scipy
+
+    elapsed = []
+    for _ in range(9):
+        start = time.perf_counter()
+        match_partial_stars(entry, points, min_fraction=1.0, max_hypotheses=10 ** 6, time_budget=budget)
+        elapsed.append(time.perf_counter() - start)
+    assert statistics.median(elapsed) <= budget * 1.5
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+
+from constellation_catalog import get_catalog
+from pattern_index import get_pattern_index
+
+
+def random_field(seed: int, count: int) -> np.ndarray:
+    return np.random.default_rng(seed).uniform(0, 1000, size=(count, 2))
+
+
+def planted_field(label: str, seed: int, distractors: int = 8) -> np.ndarray:
+    """The constellation rotated, scaled and moved into a field of random stars, in random order."""
+    rng = np.random.default_rng(seed)
+    points = np.array(get_catalog()[label].normalized, dtype=float)
+    angle = rng.uniform(0, 2 * np.pi)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    points = points @ rotation.T / np.abs(points).max() * rng.uniform(150, 400) + rng.uniform(400, 600, 2)
+    field = np.vstack([points + rng.normal(0, 1.0, points.shape), rng.uniform(0, 1000, (distractors, 2))])
+    return field[rng.permutation(len(field))]
+
+
+@pytest.mark.parametrize("count", [8, 15, 30])
+def test_random_fields_rarely_match(count):
+    index = get_pattern_index()
+    matches = [index.match(random_field(seed, count)) for seed in range(200)]
+    assert sum(match is not None for match in matches) <= 1
+
+
+@pytest.mark.parametrize("label", ["UMa", "Ori", "Cas", "Cyg", "Leo"])
+def test_planted_constellation_matches(label):
+    index = get_pattern_index()
+    matches = [index.match(planted_field(label, seed)) for seed in range(5)]
+    assert sum(match is not None and match.label == label for match in matches) >= 4
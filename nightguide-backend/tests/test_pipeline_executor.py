@@ -0,0 +1,101 @@
+import asyncio
+import contextvars
+import threading
+
+import pytest
+
+from pipeline_executor import PipelineBusyError, PipelineExecutor
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def test_runs_jobs_and_counts_them():
+    async def scenario():
+        executor = PipelineExecutor(max_workers=2)
+        try:
+            assert await executor.run(pow, 2, exp=10) == 1024
+            with pytest.raises(ZeroDivisionError):
+                await executor.run(lambda: 1 / 0)
+            stats = executor.stats()
+            assert (stats["completed"], stats["failed"], stats["in_flight"], stats["queue_depth"]) == (1, 1, 0, 0)
+        finally:
+            executor.shutdown()
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_rejected():
+    async def scenario():
+        executor = PipelineExecutor(max_workers=1, max_queue=1)
+        started, release = threading.Event(), threading.Event()
+
+        def blocking():
+            started.set()
+            release.wait(5)
+            return "done"
+
+        try:
+            running = asyncio.create_task(executor.run(blocking))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            waiting = asyncio.create_task(executor.run(lambda: "queued"))
+            await asyncio.sleep(0)
+            assert (executor.in_flight, executor.queue_depth) == (1, 1)
+
+            with pytest.raises(PipelineBusyError):
+                await executor.run(lambda: "rejected")
+            assert executor.stats()["rejected"] == 1
+
+            release.set()
+            assert await running == "done"
+            assert await waiting == "queued"
+            # Room again once the queue drained
+            assert await executor.run(lambda: "later") == "later"
+        finally:
+            release.set()
+            executor.shutdown()
+    asyncio.run(scenario())
+
+
+def test_job_sees_the_callers_context():
+    async def scenario():
+        executor = PipelineExecutor(max_workers=1)
+        try:
+            request_id.set("abc")
+            assert await executor.run(request_id.get) == "abc"
+        finally:
+            executor.shutdown()
+    asyncio.run(scenario())
+
+
+def test_cancelled_queued_job_gives_its_slot_back():
+    async def scenario():
+        executor = PipelineExecutor(max_workers=1, max_queue=1)
+        started, release = threading.Event(), threading.Event()
+        ran = []
+
+        def blocking():
+            started.set()
+            release.wait(5)
+            return "done"
+
+        try:
+            running = asyncio.create_task(executor.run(blocking))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            waiting = asyncio.create_task(executor.run(ran.append, "queued"))
+            await asyncio.sleep(0)
+            assert executor.queue_depth == 1
+
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+            assert executor.queue_depth == 0
+
+            release.set()
+            assert await running == "done"
+            # The cancelled job never ran and the queue accepts new work
+            assert await executor.run(lambda: "later") == "later"
+            assert ran == []
+            assert executor.stats()["queue_depth"] == 0
+        finally:
+            release.set()
+            executor.shutdown()
+    asyncio.run(scenario())
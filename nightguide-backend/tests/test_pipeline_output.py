@@ -0,0 +1,119 @@
+"""
+Rendered output of the pipeline: size and format of the returned image.
+
+Detection is replaced by a fixed detector passed as the `batcher`, so these
+run without a model.
+"""
+import cv2
+import numpy as np
+import pytest
+
+import pipeline
+from benchmarks.fixtures import plant_constellation
+from config import Config
+from constellation_catalog import get_catalog
+from output_encoding import OutputEncoding
+
+WIDTH, HEIGHT = 3000, 2000
+BOX = [600, 400, 1200, 1200]
+
+
+class FixedDetector:
+    """Reports one UMa box wherever it is asked, like InferenceBatcher.detect."""
+
+    def detect(self, image):
+        x, y, w, h = BOX
+        return {"UMa": [[(x + w / 2) / WIDTH, (y + h / 2) / HEIGHT, w / WIDTH, h / HEIGHT, 0.9]]}
+
+
+@pytest.fixture(scope="module")
+def large_upload() -> bytes:
+    img = np.zeros((HEIGHT, WIDTH, 3), np.uint8)
+    plant_constellation(img, get_catalog()["UMa"].points, BOX)
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    assert ok
+    return encoded.tobytes()
+
+
+def decoded_size(image_bytes: bytes):
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    return img.shape[1], img.shape[0]
+
+
+def test_reduced_decode_returns_original_size(large_upload):
+    # Long side >= 2 * detect_side, so detection runs on a 1/2 decode
+    output = pipeline.run_pipeline_on_bytes(large_upload, "model", "yaml", batcher=FixedDetector(),
+                                            detect_side=1280, encoding=OutputEncoding("jpeg", max_side=0))
+    assert output is not None
+    assert decoded_size(output) == (WIDTH, HEIGHT)
+
+
+def test_max_side_downscales_output(large_upload):
+    output = pipeline.run_pipeline_on_bytes(large_upload, "model", "yaml", batcher=FixedDetector(),
+                                            detect_side=1280, encoding=OutputEncoding("png", max_side=600))
+    assert decoded_size(output) == (600, 400)
+
+
+def test_stream_returns_original_size(large_upload):
+    events = []
+    geometry, output = pipeline.stream_pipeline_on_bytes(large_upload, "model", "yaml", events.append,
+                                                         batcher=FixedDetector(), detect_side=1280,
+                                                         encoding=OutputEncoding("jpeg"))
+    assert geometry["width"] == WIDTH
+    assert decoded_size(output) == (WIDTH, HEIGHT)
+
+
+def test_temp_file_path_returns_original_size(large_upload, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "OUTPUT_MAX_SIDE", 0)
+    source, target = tmp_path / "upload.jpg", tmp_path / "result.jpg"
+    source.write_bytes(large_upload)
+    assert pipeline.run_full_pipeline(str(source), "model", "yaml", str(target),
+                                      batcher=FixedDetector(), detect_side=1280)
+    assert decoded_size(target.read_bytes()) == (WIDTH, HEIGHT)
+
+
+def test_max_side_above_reduced_decode_uses_full_resolution(large_upload):
+    # 2000 is larger than the 1500-wide detection decode, so it can't simply be reused
+    output = pipeline.run_pipeline_on_bytes(large_upload, "model", "yaml", batcher=FixedDetector(),
+                                            detect_side=1280, encoding=OutputEncoding("jpeg", max_side=2000))
+    assert decoded_size(output) == (2000, 1333)
+
+
+def test_max_side_larger_than_upload_does_not_upscale(large_upload):
+    output = pipeline.run_pipeline_on_bytes(large_upload, "model", "yaml", batcher=FixedDetector(),
+                                            detect_side=1280, encoding=OutputEncoding("jpeg", max_side=8000))
+    assert decoded_size(output) == (WIDTH, HEIGHT)
+
+
+@pytest.mark.parametrize("max_side", [0, 2000, 600])
+def test_upload_is_decoded_at_full_resolution_at_most_once(large_upload, monkeypatch, max_side):
+    decodes = []
+    imdecode = cv2.imdecode
+
+    def counting_imdecode(buffer, flags):
+        decodes.append(flags)
+        return imdecode(buffer, flags)
+
+    monkeypatch.setattr(cv2, "imdecode", counting_imdecode)
+    events = []
+    geometry, output = pipeline.stream_pipeline_on_bytes(large_upload, "model", "yaml", events.append,
+                                                         batcher=FixedDetector(), detect_side=1280,
+                                                         encoding=OutputEncoding("jpeg", max_side=max_side))
+    # One reduced decode for detection, one full-resolution decode shared by
+    # star extraction and the rendering
+    assert decodes == [cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_COLOR]
+    assert geometry["constellations"][0]["matched"]
+    assert output is not None
+
+
+def test_stream_without_render_skips_the_image(large_upload, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("rendered although render=False")
+
+    monkeypatch.setattr(pipeline, "render_results", fail)
+    events = []
+    geometry, output = pipeline.stream_pipeline_on_bytes(large_upload, "model", "yaml", events.append,
+                                                         batcher=FixedDetector(), detect_side=1280, render=False)
+    assert output is None
+    assert geometry["constellations"][0]["matched"]
+    assert [event["event"] for event in events] == ["detections", "constellation", "geometry"]
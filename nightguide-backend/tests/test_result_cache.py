@@ -0,0 +1,116 @@
+import pytest
+
+from result_cache import ResultCache, file_fingerprint, guess_media_type, make_cache_key
+
+
+def test_cache_key_depends_on_content_and_every_version():
+    key = make_cache_key(b"image", "model", "catalog", "jpeg:q85:s0")
+    assert key == make_cache_key(b"image", "model", "catalog", "jpeg:q85:s0")
+    assert key != make_cache_key(b"image2", "model", "catalog", "jpeg:q85:s0")
+    assert key != make_cache_key(b"image", "model2", "catalog", "jpeg:q85:s0")
+    assert key != make_cache_key(b"image", "model", "catalog", "jpeg:q85:s1280")
+    assert key != make_cache_key(b"image", "model", "catalog")
+
+
+def test_cache_key_versions_are_delimited():
+    assert make_cache_key(b"x", "ab", "c") != make_cache_key(b"x", "a", "bc")
+    assert make_cache_key(b"x", "a") != make_cache_key(b"xa")
+
+
+def test_file_fingerprint_follows_content(tmp_path):
+    first, second = tmp_path / "first.pt", tmp_path / "second.pt"
+    first.write_bytes(b"weights")
+    second.write_bytes(b"other weights")
+    assert file_fingerprint(str(first)) != file_fingerprint(str(second))
+
+    export = tmp_path / "export"
+    export.mkdir()
+    (export / "model.xml").write_bytes(b"graph")
+    (export / "model.bin").write_bytes(b"weights")
+    assert len(file_fingerprint(str(export))) == 16
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == b"1"
+    cache.put("c", b"3")
+    assert "b" not in cache
+    assert cache.get("a") == b"1" and cache.get("c") == b"3"
+    assert cache.stats()["misses"] == 0
+
+
+def test_disk_tier_keeps_evicted_entries(tmp_path):
+    cache = ResultCache(max_entries=1, disk_dir=str(tmp_path))
+    cache.put("a", b"first")
+    cache.put("b", b"second")
+    assert cache.stats()["disk_entries"] == 1
+    assert cache.get("a") == b"first"
+    # A new process finds the disk entries again
+    reopened = ResultCache(max_entries=1, disk_dir=str(tmp_path))
+    assert "a" in reopened and "b" in reopened
+    assert reopened.get("b") == b"second"
+
+
+@pytest.mark.parametrize("data, media_type", [
+    (b'{"constellations": []}', "application/json"),
+    (b"\x89PNG\r\n\x1a\n....", "image/png"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "image/webp"),
+    (b"\xff\xd8\xff\xe0", "image/jpeg"),
+])
+def test_guess_media_type(data, media_type):
+    assert guess_media_type(data) == media_type
+
+
+def test_result_cache_key_covers_pipeline_settings(monkeypatch):
+    pytest.importorskip("fastapi")
+    import main
+    from config import Config
+
+    image = b"upload"
+    base = main.result_cache_key(image, "jpeg:q85:s0")
+    assert base == main.result_cache_key(image, "jpeg:q85:s0")
+    assert base != main.result_cache_key(image, "json")
+    for name, value in (("DUPLICATE_BOX_IOU", 0.9), ("TILED_INFERENCE", not Config.TILED_INFERENCE),
+                        ("PARTIAL_MATCH_MIN_FRACTION", 0.9), ("PARTIAL_MATCH_MAX_HYPOTHESES", 7),
+                        ("PARTIAL_MATCH_TIME_BUDGET_MS", 1)):
+        with monkeypatch.context() as patch:
+            patch.setattr(Config, name, value)
+            assert main.result_cache_key(image, "jpeg:q85:s0") != base, name
+
+
+def test_disk_tier_is_trimmed_to_its_budget(tmp_path):
+    cache = ResultCache(max_entries=1, disk_dir=str(tmp_path), disk_max_bytes=10)
+    for key in "abcd":
+        cache.put(key, key.encode() * 4)
+    # "d" is in memory; only the newest two spilled entries fit in 10 bytes
+    assert cache.stats()["disk_bytes"] == 8
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["b.bin", "c.bin"]
+    assert cache.get("a") is None and cache.get("b") == b"bbbb"
+
+
+def test_concurrent_use_keeps_the_index_consistent(tmp_path):
+    import threading
+    cache = ResultCache(max_entries=4, disk_dir=str(tmp_path), disk_max_bytes=200)
+
+    def worker(offset):
+        for i in range(200):
+            key = str((i * 7 + offset) % 40)
+            if cache.get(key) is None:
+                cache.put(key, key.encode() * 5)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats()["disk_bytes"] <= 200
+    assert not list(tmp_path.glob("*.tmp"))
+    # Entries trimmed mid-race read as misses, and the index heals on the way
+    for i in range(40):
+        assert cache.get(str(i)) in (None, str(i).encode() * 5)
+    stats = cache.stats()
+    on_disk = {path.name[:-4]: path.stat().st_size for path in tmp_path.glob("*.bin")}
+    assert stats["disk_bytes"] == sum(on_disk.values()) <= 200
+    assert stats["disk_entries"] == len(on_disk)
@@ -0,0 +1,101 @@
+"""
+find_stars_within_box's single union-find sweep (and its fallback to OpenCV's
+labeling on bright skies) must return exactly what the threshold ladder it
+replaced (one threshold + connectedComponentsWithStats per level) returned.
+"""
+import cv2
+import numpy as np
+import pytest
+
+import pipeline
+from benchmarks.fixtures import DEFAULT_FIXTURES, render_sky
+
+
+def ladder_find_stars(image, constellation_box, expected_star_count, min_star_count=None):
+    x, y, w, h = constellation_box
+    roi = image[y:y+h, x:x+w]
+    if roi.size == 0: return []
+    gray_roi = roi if roi.ndim == 2 else cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    for thresh_val in pipeline.STAR_THRESHOLD_LEVELS:
+        _, binary_roi = cv2.threshold(gray_roi, thresh_val, 255, cv2.THRESH_BINARY)
+        num_labels, _, stats, centroids = cv2.connectedComponentsWithStats(binary_roi, connectivity=8)
+        if num_labels <= 1: continue
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        star_idx = np.flatnonzero(areas >= pipeline.MIN_STAR_AREA)
+        if len(star_idx) < (min_star_count or expected_star_count): continue
+        top = star_idx[np.argsort(-areas[star_idx], kind='stable')[:expected_star_count]]
+        return [(x + int(cx), y + int(cy)) for cx, cy in centroids[top + 1].astype(int)]
+    return []
+
+
+def random_field(rng) -> np.ndarray:
+    img = np.zeros((400, 400, 3), np.uint8)
+    for _ in range(rng.integers(5, 80)):
+        center = tuple(int(v) for v in rng.integers(0, 400, 2))
+        color = tuple(int(rng.integers(40, 256)) for _ in range(3))
+        cv2.circle(img, center, int(rng.integers(1, 6)), color, -1)
+    return cv2.GaussianBlur(img, (3, 3), 0)
+
+
+def tied_field(rng) -> np.ndarray:
+    """Identical square stars, so the ranking comes down to label order."""
+    img = np.zeros((300, 300), np.uint8)
+    for _ in range(rng.integers(5, 40)):
+        r, c = (int(v) for v in rng.integers(0, 297, 2))
+        img[r:r+int(rng.integers(2, 4)), c:c+3] = rng.choice([60, 100, 200])
+    return img
+
+
+def test_matches_ladder_on_random_fields():
+    rng = np.random.default_rng(0)
+    mismatches = 0
+    for _ in range(200):
+        img = random_field(rng)
+        box = [int(v) for v in rng.integers(0, 150, 2)] + [int(v) for v in rng.integers(50, 300, 2)]
+        n = int(rng.integers(2, 12))
+        minimum = int(rng.integers(1, n + 1)) if rng.random() < 0.5 else None
+        if pipeline.find_stars_within_box(img, box, n, minimum) != ladder_find_stars(img, box, n, minimum):
+            mismatches += 1
+    assert mismatches == 0
+
+
+def test_matches_ladder_on_area_ties():
+    rng = np.random.default_rng(1)
+    for _ in range(100):
+        img = tied_field(rng)
+        box = [int(v) for v in rng.integers(0, 20, 2)] + [280, 280]
+        n = int(rng.integers(2, 12))
+        assert pipeline.find_stars_within_box(img, box, n) == ladder_find_stars(img, box, n)
+
+
+@pytest.mark.parametrize("fixture", DEFAULT_FIXTURES[:2], ids=lambda f: f.name)
+def test_matches_ladder_on_sky_fixtures(fixture):
+    img = render_sky(fixture)
+    box = [fixture.width // 4 + 1, fixture.height // 4, fixture.width // 2, fixture.height // 2 + 1]
+    for n, minimum in ((7, None), (40, None), (11, 5), (500, None)):
+        assert pipeline.find_stars_within_box(img, box, n, minimum) == ladder_find_stars(img, box, n, minimum)
+
+
+def test_matches_ladder_on_a_bright_sky():
+    # Most of the ROI is lit at the dimmer levels, so those come from OpenCV's labeling
+    fixture = next(f for f in DEFAULT_FIXTURES if f.background > 40)
+    img = render_sky(fixture)
+    box = [0, 0, fixture.width, fixture.height]
+    for n, minimum in ((7, None), (11, 5), (3000, None), (10 ** 6, None)):
+        assert pipeline.find_stars_within_box(img, box, n, minimum) == ladder_find_stars(img, box, n, minimum)
+
+
+def test_star_sets_share_one_pass():
+    rng = np.random.default_rng(2)
+    for _ in range(50):
+        img = random_field(rng)
+        box = [int(v) for v in rng.integers(0, 150, 2)] + [int(v) for v in rng.integers(50, 300, 2)]
+        selections = [(int(rng.integers(2, 12)), None), (int(rng.integers(4, 16)), int(rng.integers(1, 4)))]
+        assert pipeline.find_star_sets(img, box, selections) == [
+            ladder_find_stars(img, box, n, minimum) for n, minimum in selections]
+
+
+def test_empty_box():
+    img = np.zeros((100, 100, 3), np.uint8)
+    assert pipeline.find_stars_within_box(img, [10, 10, 0, 0], 3) == []
+    assert pipeline.find_stars_within_box(img, [10, 10, 50, 50], 3) == []
@@ -0,0 +1,70 @@
+"""
+map_and_order_stars_batch must order every shape exactly as aligning it on
+its own does, whatever else is in the batch.
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial.distance import cdist
+
+import pipeline
+from constellation_catalog import get_catalog
+
+
+def single_procrustes(canonical_model, detected_points):
+    """The per-shape Procrustes alignment the batch replaced."""
+    canonical_centered = canonical_model.centered
+    if len(detected_points) != len(canonical_centered): return None
+    detected_points = np.array(detected_points, dtype=float)
+    detected_centered = detected_points - np.mean(detected_points, axis=0)
+    U, S, Vt = np.linalg.svd(np.dot(detected_centered.T, canonical_centered))
+    rotation = np.dot(Vt.T, U.T)
+    if np.linalg.det(rotation) < 0:
+        Vt_corrected = Vt.copy()
+        Vt_corrected[-1, :] *= -1
+        rotation = np.dot(Vt_corrected.T, U.T)
+    row_ind, col_ind = linear_sum_assignment(cdist(canonical_centered, np.dot(detected_centered, rotation)))
+    ordered_points = [None] * len(detected_points)
+    for r, c in zip(row_ind, col_ind):
+        ordered_points[r] = tuple(map(int, detected_points[c]))
+    return ordered_points
+
+
+def point_sets(rng, entries):
+    """Per entry: a rotated, scaled, shuffled and jittered copy of its stars, or random points."""
+    sets = []
+    for index, entry in enumerate(entries):
+        if index % 3 == 0:
+            points = rng.uniform(0, 1000, (entry.star_count, 2))
+        else:
+            angle = rng.uniform(0, 2 * np.pi)
+            rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+            points = np.asarray(entry.centered) @ rotation.T * rng.uniform(0.5, 3) + rng.uniform(200, 800, 2)
+            points = points[rng.permutation(entry.star_count)] + rng.normal(0, 2, points.shape)
+        sets.append([tuple(int(v) for v in point) for point in points])
+    return sets
+
+
+def test_batch_matches_single_calls():
+    rng = np.random.default_rng(0)
+    entries = [entry for entry in get_catalog().entries() if entry.star_count >= 2]
+    for _ in range(5):
+        batch = [entries[i] for i in rng.permutation(len(entries))[:24]]
+        sets = point_sets(rng, batch)
+        results = pipeline.map_and_order_stars_batch(batch, sets)
+        assert results == [pipeline.map_and_order_stars(entry, points) for entry, points in zip(batch, sets)]
+        assert results == [single_procrustes(entry, points) for entry, points in zip(batch, sets)]
+
+
+def test_count_mismatches_are_none_without_disturbing_the_rest():
+    catalog = get_catalog()
+    entries = [catalog["UMa"], catalog["Ori"], catalog["Cas"]]
+    sets = point_sets(np.random.default_rng(1), entries)
+    sets[1] = sets[1][:-1]
+    results = pipeline.map_and_order_stars_batch(entries, sets)
+    assert results[1] is None
+    assert results[0] == single_procrustes(entries[0], sets[0])
+    assert results[2] == single_procrustes(entries[2], sets[2])
+    assert pipeline.map_and_order_stars_batch([], []) == []
@@ -0,0 +1,170 @@
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from cnn_integration import ULTRALYTICS_BACKEND
+from model_registry import LoadedModel
+from pipeline import detections_from_result
+from telemetry import stage
+
+logger = logging.getLogger(__name__)
+
+Tile = Tuple[int, int, int, int]  # x0, y0, x1, y1 in full-image pixels
+
+
+def tile_grid(img_w: int, img_h: int, tile_size: int, overlap: float) -> List[Tile]:
+    """
+    Overlapping `tile_size` squares covering the whole image. Tiles are spaced
+    evenly so the last row/column ends exactly on the image border, and each
+    pair of neighbours shares at least `overlap` (0-1) of a tile.
+    """
+    def starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        stride = max(1, int(tile_size * (1 - overlap)))
+        count = -(-(length - tile_size) // stride) + 1
+        return [round(i * (length - tile_size) / (count - 1)) for i in range(count)]
+
+    return [
+        (x0, y0, min(x0 + tile_size, img_w), min(y0 + tile_size, img_h))
+        for y0 in starts(img_h)
+        for x0 in starts(img_w)
+    ]
+
+
+def merge_boxes(boxes: np.ndarray, scores: np.ndarray, match_threshold: float = 0.5) -> List[Tuple[np.ndarray, float]]:
+    """
+    Greedy non-maximum merging for one class. Boxes (xyxy) are visited by
+    descending score; every remaining box overlapping the current group by
+    more than `match_threshold` of the smaller box's area joins it, and the
+    group grows to the union of its boxes until nothing else overlaps. A
+    constellation cut by a tile seam shows up as partial boxes with a low IoU
+    but a high intersection-over-smaller, so this rejoins it instead of
+    keeping the pieces.
+    Returns [(xyxy box, best score)] by descending score.
+    """
+    remaining = np.argsort(-scores, kind="stable")
+    merged = []
+    while len(remaining):
+        best, rest = remaining[0], remaining[1:]
+        union = boxes[best].copy()
+        while len(rest):
+            ix0 = np.maximum(union[0], boxes[rest, 0])
+            iy0 = np.maximum(union[1], boxes[rest, 1])
+            ix1 = np.minimum(union[2], boxes[rest, 2])
+            iy1 = np.minimum(union[3], boxes[rest, 3])
+            intersection = np.maximum(ix1 - ix0, 0) * np.maximum(iy1 - iy0, 0)
+            union_area = (union[2] - union[0]) * (union[3] - union[1])
+            rest_areas = (boxes[rest, 2] - boxes[rest, 0]) * (boxes[rest, 3] - boxes[rest, 1])
+            joins = intersection / np.maximum(np.minimum(union_area, rest_areas), 1e-9) > match_threshold
+            if not joins.any():
+                break
+            members = boxes[rest[joins]]
+            union = np.concatenate((np.minimum(union[:2], members[:, :2].min(axis=0)),
+                                    np.maximum(union[2:], members[:, 2:].max(axis=0))))
+            rest = rest[~joins]
+        merged.append((union, float(scores[best])))
+        remaining = rest
+    return merged
+
+
+class TiledDetector:
+    """
+    Sliding-window detection for high-resolution frames.
+
+    YOLO letterboxes its input down to a few hundred pixels, so small
+    constellations in a 24-60 MP frame are lost. Images larger than
+    `tile_size` are cut into overlapping tiles, each tile (plus, with
+    `include_full_frame`, the downscaled whole frame for constellations larger
+    than a tile) is run through the detector in batches, and the boxes are
+    merged across seams with `merge_boxes`.
+
+    Exposes the same `detect(source)` as InferenceBatcher, so it can be passed
+    as `batcher` to get_yolo_detections; when an `inner` batcher is given the
+    tiles are submitted to it and batched together with other requests.
+    """
+
+    def __init__(self,
+                 loaded_model: LoadedModel,
+                 tile_size: int = 1280,
+                 overlap: float = 0.2,
+                 batch_size: int = 8,
+                 include_full_frame: bool = True,
+                 match_threshold: float = 0.5,
+                 conf_threshold: float = 0.25,
+                 inner=None):
+        self.loaded_model = loaded_model
+        self.tile_size = max(32, tile_size)
+        self.overlap = min(max(overlap, 0.0), 0.9)
+        self.batch_size = max(1, batch_size)
+        self.include_full_frame = include_full_frame
+        self.match_threshold = match_threshold
+        self.conf_threshold = conf_threshold
+        self.inner = inner
+
+    def detect(self, source, timeout: Optional[float] = None) -> dict:
+        """
+        Detections for an image (path or BGR ndarray) as
+        {label: [[x_center, y_center, w, h, confidence], ...]}, normalized to
+        the full image and sorted by descending confidence.
+        """
+        image = cv2.imread(source) if isinstance(source, str) else source
+        if image is None:
+            return {}
+        img_h, img_w = image.shape[:2]
+        if img_w <= self.tile_size and img_h <= self.tile_size:
+            return self._detect_many([image], timeout)[0]
+
+        tiles = tile_grid(img_w, img_h, self.tile_size, self.overlap)
+        crops = [np.ascontiguousarray(image[y0:y1, x0:x1]) for x0, y0, x1, y1 in tiles]
+        if self.include_full_frame:
+            tiles.append((0, 0, img_w, img_h))
+            crops.append(image)
+
+        with stage("tiled_detect", tiles=len(crops)):
+            per_tile = self._detect_many(crops, timeout)
+
+        boxes: Dict[str, List[List[float]]] = defaultdict(list)
+        scores: Dict[str, List[float]] = defaultdict(list)
+        for (x0, y0, x1, y1), detections in zip(tiles, per_tile):
+            tile_w, tile_h = x1 - x0, y1 - y0
+            for label, label_boxes in detections.items():
+                for cx, cy, w, h, conf in label_boxes:
+                    cx, cy = x0 + cx * tile_w, y0 + cy * tile_h
+                    w, h = w * tile_w, h * tile_h
+                    boxes[label].append([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+                    scores[label].append(conf)
+
+        merged = {}
+        for label in boxes:
+            label_merged = merge_boxes(np.array(boxes[label]), np.array(scores[label]), self.match_threshold)
+            merged[label] = [
+                [float((bx0 + bx1) / 2 / img_w), float((by0 + by1) / 2 / img_h),
+                 float((bx1 - bx0) / img_w), float((by1 - by0) / img_h), conf]
+                for (bx0, by0, bx1, by1), conf in label_merged
+            ]
+        logger.debug("Tiled detection: %d tiles, %d boxes merged into %d",
+                     len(crops), sum(len(b) for b in boxes.values()), sum(len(b) for b in merged.values()))
+        return merged
+
+    def _detect_many(self, images: List[np.ndarray], timeout: Optional[float]) -> List[dict]:
+        if self.inner is not None:
+            futures = [self.inner.submit(image) for image in images]
+            return [future.result(timeout) for future in futures]
+
+        detections = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            if self.loaded_model.backend != ULTRALYTICS_BACKEND:
+                detections += self.loaded_model.model.detect_batch(
+                    chunk, with_confidence=True, conf_threshold=self.conf_threshold)
+            else:
+                results = self.loaded_model.model.predict(source=chunk, conf=self.conf_threshold, verbose=False)
+                detections += [
+                    detections_from_result(result, self.loaded_model.class_names, with_confidence=True)
+                    for result in results
+                ]
+        return detections
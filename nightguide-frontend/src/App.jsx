@@ -37,18 +37,55 @@ export default function App() {
       const formData = new FormData();
       formData.append("file", file);
 
-      const res = await fetch(`${API_BASE}/upload`, {
+      // Streamed NDJSON: boxes as soon as detection finishes, then each
+      // constellation as its stars are matched, then the full geometry.
+      // The overlay is drawn here, so the server skips rendering an image.
+      const res = await fetch(`${API_BASE}/upload/stream?render=0`, {
         method: "POST",
         body: formData,
       });
 
       if (!res.ok) {
         const errorData = await res.json().catch(() => ({}));
-        throw new Error(errorData.detail || `Server error ${res.status}`);
+        throw new Error(errorData.error || errorData.detail || `Server error ${res.status}`);
+      }
+
+      const handleEvent = (event) => {
+        if (event.event === "detections") {
+          setResult({
+            constellation: event.detections.map((d) => d.label).join(", "),
+            description: "Matching stars…",
+            lines: [],
+            points: [],
+          });
+        } else if (event.event === "constellation" && event.matched) {
+          setResult((prev) => ({
+            ...prev,
+            constellation: prev?.matchedName || event.name,
+            matchedName: prev?.matchedName || event.name,
+            lines: [...(prev?.lines || []), ...event.lines],
+            points: [...(prev?.points || []), ...event.points],
+          }));
+        } else if (event.event === "geometry") {
+          setResult(event);
+        } else if (event.event === "error") {
+          throw new Error(event.error);
+        }
+      };
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+        for (const line of lines) {
+          if (line.trim()) handleEvent(JSON.parse(line));
+        }
       }
-      
-      const data = await res.json();
-      setResult(data);
     } catch (err) {
       console.error(err);
       setError(err.message || "Analysis failed. Please try again.");